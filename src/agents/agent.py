@@ -1,15 +1,27 @@
 import os
 import json
+import hashlib
+import logging
 from typing import Annotated
 from langchain.agents import create_agent
-from langchain.agents.middleware import wrap_tool_call
+from langchain.agents.middleware import AgentMiddleware
 from langchain.messages import ToolMessage
 from langchain_openai import ChatOpenAI
+from langchain_core.language_models import BaseChatModel
 from langgraph.graph import MessagesState
-from langgraph.graph.message import add_messages
 from langchain_core.messages import AnyMessage
 from coze_coding_utils.runtime_ctx.context import default_headers
 from storage.memory.memory_saver import get_memory_saver
+from agents.prompting import assemble_system_prompt, prompt_cache_params
+from agents.history import is_summary, truncate_message
+from agents.message_window import coerce_messages, merge_window
+from agents.request_headers import RequestHeadersMiddleware
+from tools.product_catalog import CATALOG_TOOLS
+from agents.hedging import LLM_FALLBACK_BASE_URL, LLM_FALLBACK_MODEL, LLM_HEDGING_ENABLED, with_hedging
+from agents.language_prompt import build_language_prompt
+from agents.model_router import ModelRouterMiddleware, TierRule, tier_config
+
+logger = logging.getLogger(__name__)
 
 LLM_CONFIG = "config/agent_llm_config.json"
 
@@ -27,72 +39,158 @@ DEFAULT_CONFIG = {
     "tools": []
 }
 
-# 默认保留最近 20 轮对话 (40 条消息)
+# 默认保留最近 20 轮对话 (40 条消息)，token 预算见 agents/history.py
 MAX_MESSAGES = 40
 
 def _windowed_messages(old, new):
-    """滑动窗口: 只保留最近 MAX_MESSAGES 条消息"""
-    return add_messages(old, new)[-MAX_MESSAGES:] # type: ignore
+    """滑动窗口: 只保留最近 MAX_MESSAGES 条消息（历史摘要固定在最前面），超长用户消息截断"""
+    return merge_window(old, [truncate_message(m) for m in coerce_messages(new)], MAX_MESSAGES, is_pinned=is_summary)
 
 class AgentState(MessagesState):
     messages: Annotated[list[AnyMessage], _windowed_messages]
 
-@wrap_tool_call
-def filter_tool_calls(request, handler):
-    """过滤工具调用显示，确保客户看不到工具执行的详细信息"""
-    try:
-        # 执行工具调用
-        result = handler(request)
-        # 如果是ToolMessage，检查内容
-        if isinstance(result, ToolMessage):
+# 可在配置的 tools 字段中按名称启用的工具
+AVAILABLE_TOOLS = {**CATALOG_TOOLS}
+# 结果需要交给模型阅读的工具（产品目录为公开的产品信息；客服前端只推送 AI 文本，不展示工具消息）
+KNOWLEDGE_TOOLS = set(CATALOG_TOOLS)
+
+def resolve_tools(cfg):
+    return [AVAILABLE_TOOLS[name] for name in cfg.get("tools") or []]
+
+class ToolCallFilter(AgentMiddleware):
+    """过滤工具调用显示，确保客户看不到工具执行的详细信息（同步 / 异步调用均生效）"""
+
+    @staticmethod
+    def _filter(request, result):
+        # 如果是ToolMessage，检查内容（知识查询类工具的结果是模型回答的依据，保留内容）
+        if isinstance(result, ToolMessage) and request.tool_call["name"] not in KNOWLEDGE_TOOLS:
             # 确保工具返回空内容（已在工具中实现）
             if result.content:
                 result.content = ""
         return result
-    except Exception as e:
+
+    @staticmethod
+    def _silent(request):
         # 静默处理错误，不向客户显示
         return ToolMessage(
             content="",
             tool_call_id=request.tool_call["id"]
         )
 
-def build_agent(ctx=None):
+    def wrap_tool_call(self, request, handler):
+        try:
+            # 执行工具调用
+            return self._filter(request, handler(request))
+        except Exception:
+            return self._silent(request)
+
+    async def awrap_tool_call(self, request, handler):
+        try:
+            return self._filter(request, await handler(request))
+        except Exception:
+            return self._silent(request)
+
+filter_tool_calls = ToolCallFilter()
+
+def llm_config_path() -> str:
     workspace_path = os.getenv("COZE_WORKSPACE_PATH", "/workspace/projects")
-    config_path = os.path.join(workspace_path, LLM_CONFIG)
+    return os.path.join(workspace_path, LLM_CONFIG)
+
+def load_llm_config() -> dict:
+    """读取 agent_llm_config.json，失败时使用硬编码配置"""
+    config_path = llm_config_path()
     
     # 先尝试从配置文件加载，如果失败则使用硬编码配置
     try:
         with open(config_path, 'r', encoding='utf-8') as f:
             cfg = json.load(f)
-        print(f"✅ Successfully loaded config from: {config_path}")
+        logger.info(f"Loaded agent config from {config_path}")
     except (FileNotFoundError, json.JSONDecodeError) as e:
-        print(f"⚠️  Failed to load config file: {e}")
-        print(f"📦 Using hardcoded default config")
+        logger.warning(f"Failed to load config file ({e}), using hardcoded default config")
         cfg = DEFAULT_CONFIG
-    
+    return cfg
+
+def config_fingerprint(cfg) -> str:
+    """配置内容的稳定哈希，用于区分配置版本（提示词或模型参数变化时随之变化）"""
+    raw = json.dumps(cfg, ensure_ascii=False, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(raw).hexdigest()[:16]
+
+def _chat_openai(cfg, ctx=None, model=None, base_url=None, max_tokens=None) -> ChatOpenAI:
+    """
+    按配置构造 ChatOpenAI（相同 base_url/timeout 的实例共享底层 HTTP 连接池）
+
+    max_tokens 只对在档位内显式设置了 max_completion_tokens 的路由档位传入，
+    未路由时与之前一样不限制输出长度（config.max_completion_tokens 不作为上限）
+    """
     api_key = os.getenv("COZE_WORKLOAD_IDENTITY_API_KEY")
-    base_url = os.getenv("COZE_INTEGRATION_MODEL_BASE_URL")
+    base_url = base_url or os.getenv("COZE_INTEGRATION_MODEL_BASE_URL")
+    extra_body = {
+        "thinking": {
+            "type": cfg['config'].get('thinking', 'disabled')
+        },
+        **prompt_cache_params(cfg, assemble_system_prompt(cfg))
+    }
     
-    llm = ChatOpenAI(
-        model=cfg['config'].get("model"),
+    return ChatOpenAI(
+        model=model or cfg['config'].get("model"),
         api_key=api_key,
         base_url=base_url,
         temperature=cfg['config'].get('temperature', 0.7),
         streaming=True,
         timeout=cfg['config'].get('timeout', 600),
-        extra_body={
-            "thinking": {
-                "type": cfg['config'].get('thinking', 'disabled')
-            }
-        },
+        max_tokens=max_tokens,
+        # 流式响应末尾返回 usage（input/cached/output tokens），用于 token 统计
+        stream_usage=True,
+        extra_body=extra_body,
+        # 启用对冲时重试由 HedgedChatModel 负责（带截止时间与抖动），SDK 不再自行重试
+        max_retries=0 if LLM_HEDGING_ENABLED else None,
         default_headers=default_headers(ctx) if ctx else {}
     )
+
+def build_llm(cfg, ctx=None, max_tokens=None) -> BaseChatModel:
+    """按配置构造模型：主模型 + 可选的备用模型 / 地址，包装首 token 截止时间对冲与重试"""
+    primary = _chat_openai(cfg, ctx, max_tokens=max_tokens)
+    fallback = None
+    if LLM_FALLBACK_MODEL or LLM_FALLBACK_BASE_URL:
+        fallback = _chat_openai(
+            cfg, ctx, model=LLM_FALLBACK_MODEL or None, base_url=LLM_FALLBACK_BASE_URL or None, max_tokens=max_tokens
+        )
+    return with_hedging(primary, fallback)
+
+def build_router(cfg, ctx=None):
+    """配置了 routing 段时按档位创建模型并返回路由中间件，否则返回 None"""
+    routing = cfg.get("routing")
+    if not routing:
+        return None
+    models = {
+        tier: build_llm(tier_config(cfg, tier), ctx, max_tokens=overrides.get("max_completion_tokens"))
+        for tier, overrides in routing["tiers"].items()
+    }
+    return ModelRouterMiddleware(TierRule(routing), models)
+
+def compile_agent(cfg, ctx=None, checkpointer=None):
+    """按给定配置构建并编译 Agent（未传入 checkpointer 时从 MemoryManager 获取）"""
+    llm = build_llm(cfg, ctx)
+    middleware = [RequestHeadersMiddleware(), filter_tool_calls]
+    language_prompt = build_language_prompt(cfg)
+    if language_prompt is not None:
+        # 按会话语言裁剪系统提示词（编译时的 system_prompt 为包含全部语言的完整版本）
+        middleware.insert(0, language_prompt)
+    router = build_router(cfg, ctx)
+    if router is not None:
+        # 路由在调用头注入之前执行：替换模型后仍携带本次请求的调用头
+        middleware.insert(0, router)
     
     return create_agent(
         model=llm,
-        system_prompt=cfg.get("sp"),
-        tools=[],
-        checkpointer=get_memory_saver(),
+        # 系统提示词逐字节稳定，作为所有请求的公共前缀
+        system_prompt=assemble_system_prompt(cfg),
+        tools=resolve_tools(cfg),
+        checkpointer=checkpointer if checkpointer is not None else get_memory_saver(),
         state_schema=AgentState,
-        middleware=[filter_tool_calls]
+        # 随请求变化的调用头在每次模型调用时注入，编译好的 Agent 可在请求间复用
+        middleware=middleware
     )
+
+def build_agent(ctx=None):
+    return compile_agent(load_llm_config(), ctx)
@@ -0,0 +1,304 @@
+"""
+Agent Config Manager
+agent_llm_config.json 热更新：后台线程按 mtime 轮询配置文件，新版本校验通过并编译成功后
+原子替换当前的 AgentVersion
+
+- 请求路径只读取内存中的当前版本，不做任何文件 I/O
+- 进行中的运行持有旧版本的 Agent 引用，照常在旧版本上完成；替换后开始的运行使用新版本
+- 新版本解析、校验或编译失败时保留旧版本继续服务，错误记录在 stats() 中
+- 编译 Agent 不在事件循环上执行：热更新在监听线程内完成，异步路径的首次加载经 acurrent() 放到线程池；
+  checkpointer 只在首次加载时解析一次，之后的版本复用同一个实例
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from agents.agent import AVAILABLE_TOOLS, DEFAULT_CONFIG, build_llm, compile_agent, config_fingerprint, llm_config_path
+from agents.prompting import system_prompt_tokens
+from storage.memory.memory_saver import get_memory_manager
+
+logger = logging.getLogger(__name__)
+
+# 配置文件轮询间隔（秒），0 表示不监听（只在启动时读取一次）
+CONFIG_RELOAD_INTERVAL = float(os.getenv("CONFIG_RELOAD_INTERVAL", "2"))
+
+
+class ConfigValidationError(ValueError):
+    """配置内容不合法，不会被加载"""
+
+
+def _check_number(model_cfg: Dict[str, Any], key: str, low: float, high: float, integer: bool = False, prefix: str = "config"):
+    if key not in model_cfg:
+        return
+    value = model_cfg[key]
+    if isinstance(value, bool) or not isinstance(value, int if integer else (int, float)):
+        raise ConfigValidationError(f"{prefix}.{key} must be {'an integer' if integer else 'a number'}, got {value!r}")
+    if not low <= value <= high:
+        raise ConfigValidationError(f"{prefix}.{key} must be between {low} and {high}, got {value!r}")
+
+
+def _check_model_params(model_cfg: Dict[str, Any], prefix: str = "config"):
+    _check_number(model_cfg, "temperature", 0, 2, prefix=prefix)
+    _check_number(model_cfg, "top_p", 0, 1, prefix=prefix)
+    _check_number(model_cfg, "max_completion_tokens", 1, 1_000_000, integer=True, prefix=prefix)
+    _check_number(model_cfg, "timeout", 1, 3600, prefix=prefix)
+    if "thinking" in model_cfg and model_cfg["thinking"] not in ("enabled", "disabled", "auto"):
+        raise ConfigValidationError(f"{prefix}.thinking must be enabled/disabled/auto, got {model_cfg['thinking']!r}")
+
+
+def _validate_sp_languages(section: Any):
+    if not isinstance(section, dict):
+        raise ConfigValidationError("'sp_languages' must be an object")
+    if not isinstance(section.get("header", ""), str):
+        raise ConfigValidationError("sp_languages.header must be a string")
+    blocks = section.get("blocks")
+    if not isinstance(blocks, dict) or not all(isinstance(v, str) and v.strip() for v in blocks.values()):
+        raise ConfigValidationError("sp_languages.blocks must map language codes to non-empty strings")
+
+
+def _validate_routing(routing: Any):
+    if not isinstance(routing, dict):
+        raise ConfigValidationError("'routing' must be an object")
+    tiers = routing.get("tiers")
+    if not isinstance(tiers, dict) or not tiers:
+        raise ConfigValidationError("routing.tiers must be a non-empty object")
+    for name, tier in tiers.items():
+        prefix = f"routing.tiers.{name}"
+        if not isinstance(tier, dict):
+            raise ConfigValidationError(f"{prefix} must be an object")
+        if "model" in tier and (not isinstance(tier["model"], str) or not tier["model"].strip()):
+            raise ConfigValidationError(f"{prefix}.model must be a non-empty string")
+        _check_model_params(tier, prefix)
+    for key in ("default_tier", "simple_tier"):
+        if key in routing and routing[key] not in tiers:
+            raise ConfigValidationError(f"routing.{key} {routing[key]!r} is not defined in routing.tiers")
+    _check_number(routing, "simple_max_chars", 0, 100_000, integer=True, prefix="routing")
+    _check_number(routing, "max_simple_turn", 0, 100_000, integer=True, prefix="routing")
+    for key in ("complex_keywords", "simple_patterns", "simple_scripts"):
+        if key in routing and (not isinstance(routing[key], list) or not all(isinstance(x, str) and x for x in routing[key])):
+            raise ConfigValidationError(f"routing.{key} must be a list of non-empty strings")
+    for pattern in routing.get("simple_patterns", []):
+        try:
+            re.compile(pattern)
+        except re.error as e:
+            raise ConfigValidationError(f"routing.simple_patterns: invalid regex {pattern!r}: {e}")
+
+
+def validate_llm_config(cfg: Any):
+    """校验配置结构与取值范围，不合法时抛出 ConfigValidationError"""
+    if not isinstance(cfg, dict):
+        raise ConfigValidationError("config root must be a JSON object")
+    model_cfg = cfg.get("config")
+    if not isinstance(model_cfg, dict):
+        raise ConfigValidationError("'config' must be an object")
+    if not isinstance(model_cfg.get("model"), str) or not model_cfg["model"].strip():
+        raise ConfigValidationError("config.model must be a non-empty string")
+    if not isinstance(cfg.get("sp"), str) or not cfg["sp"].strip():
+        raise ConfigValidationError("'sp' (system prompt) must be a non-empty string")
+    _check_model_params(model_cfg)
+    if "tools" in cfg and not isinstance(cfg["tools"], list):
+        raise ConfigValidationError("'tools' must be a list")
+    unknown = [name for name in cfg.get("tools") or [] if name not in AVAILABLE_TOOLS]
+    if unknown:
+        raise ConfigValidationError(f"unknown tools {unknown}, available: {sorted(AVAILABLE_TOOLS)}")
+    if cfg.get("sp_languages") is not None:
+        _validate_sp_languages(cfg["sp_languages"])
+    if cfg.get("routing") is not None:
+        _validate_routing(cfg["routing"])
+
+
+class AgentVersion:
+    """一个配置版本及其编译好的 Agent（创建后不再修改）"""
+
+    def __init__(self, config: Dict[str, Any], source: str, checkpointer=None):
+        self.config = config
+        self.config_hash = config_fingerprint(config)
+        self.source = source
+        self.loaded_at = time.time()
+        self.system_prompt_tokens = system_prompt_tokens(config)
+        self._prompt_tokens: Dict[Optional[str], int] = {None: self.system_prompt_tokens}
+        self.agent = compile_agent(config, checkpointer=checkpointer)
+        self._llm = None
+
+    @property
+    def model(self) -> str:
+        return self.config["config"].get("model")
+
+    def prompt_tokens(self, language: Optional[str]) -> int:
+        """按会话语言裁剪后的系统提示词 token 数"""
+        tokens = self._prompt_tokens.get(language)
+        if tokens is None:
+            tokens = self._prompt_tokens[language] = system_prompt_tokens(self.config, language)
+        return tokens
+
+    @property
+    def llm(self):
+        """与 Agent 同配置的 ChatOpenAI（预热、摘要等辅助调用使用），首次访问时创建"""
+        if self._llm is None:
+            self._llm = build_llm(self.config)
+        return self._llm
+
+
+class ConfigManager:
+    """持有当前生效的 AgentVersion，并在配置文件变化时热替换"""
+
+    def __init__(self, path: Optional[str] = None, interval: float = CONFIG_RELOAD_INTERVAL):
+        self.path = path or llm_config_path()
+        self.interval = interval
+        self.active: Optional[AgentVersion] = None
+        self._lock = threading.Lock()
+        self._stat = None
+        self._watcher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        # 首次加载时解析的 checkpointer，热更新编译新版本时复用
+        self._checkpointer = None
+        self.reloads = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+
+    def current(self) -> AgentVersion:
+        """当前生效的版本；首次调用时加载配置并启动文件监听"""
+        version = self.active
+        if version is not None:
+            return version
+        with self._lock:
+            if self.active is None:
+                self._load_initial()
+                self.start_watching()
+            return self.active
+
+    async def acurrent(self) -> AgentVersion:
+        """
+        current() 的异步版本：首次加载时建表与编译 Agent 都在线程池中执行，不阻塞事件循环
+
+        checkpointer 在当前循环上解析（caller 模式下连接池要绑定到调用方的循环），
+        此时 schema 已建好，只创建（不打开）连接池
+        """
+        version = self.active
+        if version is not None:
+            return version
+        if self._checkpointer is None:
+            await asyncio.to_thread(get_memory_manager().prepare)
+            self._checkpointer = get_memory_manager().get_checkpointer()
+        return await asyncio.to_thread(self.current)
+
+    def _resolve_checkpointer(self):
+        if self._checkpointer is None:
+            self._checkpointer = get_memory_manager().get_checkpointer()
+        return self._checkpointer
+
+    def _file_stat(self):
+        try:
+            st = os.stat(self.path)
+            return st.st_mtime_ns, st.st_size
+        except OSError:
+            return None
+
+    def _read(self) -> Dict[str, Any]:
+        with open(self.path, "r", encoding="utf-8") as f:
+            cfg = json.load(f)
+        validate_llm_config(cfg)
+        return cfg
+
+    def _load_initial(self):
+        self._stat = self._file_stat()
+        try:
+            cfg, source = self._read(), self.path
+            logger.info(f"Loaded agent config from {self.path}")
+        except (OSError, ValueError) as e:
+            # 启动时配置文件缺失或不合法：使用硬编码配置
+            logger.warning(f"Failed to load config file ({e}), using hardcoded default config")
+            self.last_error = str(e)
+            cfg, source = DEFAULT_CONFIG, "default"
+        self.active = AgentVersion(cfg, source, self._resolve_checkpointer())
+        logger.info(f"Active agent config {self.active.config_hash} (model: {self.active.model}, source: {source})")
+
+    def reload(self, force: bool = False) -> bool:
+        """
+        配置文件有变化时加载新版本，返回是否发生了替换
+
+        内容哈希未变化（如只 touch 了文件）时不重建 Agent
+        """
+        with self._lock:
+            stat = self._file_stat()
+            if not force and stat == self._stat:
+                return False
+            self._stat = stat
+            if stat is None:
+                # 文件被删除或正在被替换：保留当前版本
+                return False
+            try:
+                cfg = self._read()
+                if self.active is not None and config_fingerprint(cfg) == self.active.config_hash:
+                    return False
+                version = AgentVersion(cfg, self.path, self._resolve_checkpointer())
+            except Exception as e:
+                self.failures += 1
+                self.last_error = f"{type(e).__name__}: {e}"
+                logger.error(f"Rejected agent config change, keeping {self.active.config_hash if self.active else None}: {e}")
+                return False
+
+            previous, self.active = self.active, version
+            self.reloads += 1
+            self.last_error = None
+            logger.info(
+                f"Agent config reloaded: {previous.config_hash if previous else None} -> {version.config_hash} "
+                f"(model: {version.model})"
+            )
+            return True
+
+    def start_watching(self):
+        if self.interval <= 0 or self._watcher is not None:
+            return
+        self._watcher = threading.Thread(target=self._watch, name="agent-config-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self):
+        self._stop.set()
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.reload()
+            except Exception as e:
+                logger.error(f"Agent config watcher error: {e}", exc_info=True)
+
+    def stats(self) -> Dict[str, Any]:
+        version = self.active
+        return {
+            "config_hash": version.config_hash if version else None,
+            "model": version.model if version else None,
+            "tiers": {
+                name: tier.get("model", version.model)
+                for name, tier in version.config.get("routing", {}).get("tiers", {}).items()
+            } if version else None,
+            "source": version.source if version else None,
+            "loaded_at": version.loaded_at if version else None,
+            "reloads": self.reloads,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "watching": self._watcher is not None and self._watcher.is_alive(),
+        }
+
+
+_config_manager = ConfigManager()
+
+
+def get_config_manager() -> ConfigManager:
+    return _config_manager
+
+
+def get_agent():
+    """当前配置版本的 Agent（进程内共享，调用头通过 context=ctx 或 llm_request_headers 传入）"""
+    return _config_manager.current().agent
+
+
+async def aget_agent():
+    """get_agent() 的异步版本，首次加载不阻塞事件循环"""
+    return (await _config_manager.acurrent()).agent
@@ -0,0 +1,420 @@
+"""
+Hedged LLM Requests
+首 token 截止时间（TTFT deadline）+ 对冲请求 + 有上限的抖动重试
+
+- 首个 token 指第一个有内容（content 或 tool_call_chunks）的片段；只带角色 / 空内容的开头片段先缓存，
+  不算首 token（其后卡住仍会对冲），请求胜出时随首 token 一起推送
+- 发出请求后 LLM_TTFT_DEADLINE 秒内没有收到首个 token 时，再发出一个对冲请求
+  （配置了 LLM_FALLBACK_MODEL / LLM_FALLBACK_BASE_URL 时发往备用模型 / 地址），
+  先返回首个 token 的请求胜出，其余请求取消，只有胜出请求的 token 会流式推送给客户端
+- 收到首个 token 之前失败的请求按指数退避 + 随机抖动重试，最多 LLM_RETRY_MAX 次（4xx 参数错误不重试）；
+  首个 token 之后的失败直接抛出（已推送的内容无法撤回）
+- 每次调用的 TTFT、对冲次数、对冲胜出次数与重试次数记录在 get_hedge_stats() 中（/api/stats 的 llm_latency）
+"""
+
+import asyncio
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.language_models.chat_models import agenerate_from_stream, generate_from_stream
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+
+logger = logging.getLogger(__name__)
+
+LLM_HEDGING_ENABLED = os.getenv("LLM_HEDGING_ENABLED", "1").lower() in ("1", "true")
+# 首 token 截止时间（秒），超过后发出对冲请求；0 表示不对冲（仍然重试）
+LLM_TTFT_DEADLINE = float(os.getenv("LLM_TTFT_DEADLINE", "8"))
+# 每次调用最多追加的对冲请求数
+LLM_MAX_HEDGES = int(os.getenv("LLM_MAX_HEDGES", "1"))
+# 首 token 之前失败时的最大重试次数与退避参数（秒）
+LLM_RETRY_MAX = int(os.getenv("LLM_RETRY_MAX", "2"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "4"))
+# 对冲 / 重试请求使用的备用模型与地址（缺省时发往主模型）
+LLM_FALLBACK_MODEL = os.getenv("LLM_FALLBACK_MODEL", "")
+LLM_FALLBACK_BASE_URL = os.getenv("LLM_FALLBACK_BASE_URL", "")
+# 统计 TTFT 分位数时保留的最近样本数
+LLM_TTFT_SAMPLES = int(os.getenv("LLM_TTFT_SAMPLES", "2048"))
+
+# 队列中的流结束标记
+_DONE = object()
+
+
+def is_retryable(error: BaseException) -> bool:
+    """请求参数 / 鉴权类的 4xx 错误重试也不会成功，超时、限流、5xx 与连接错误可以重试"""
+    status = getattr(error, "status_code", None)
+    if isinstance(status, int) and 400 <= status < 500:
+        return status in (408, 409, 429)
+    return True
+
+
+def backoff_delay(retry: int) -> float:
+    """第 retry 次重试前的等待时间：指数退避，在上限的 [1/2, 1] 区间内随机抖动"""
+    delay = min(LLM_RETRY_MAX_DELAY, LLM_RETRY_BASE_DELAY * (2 ** retry))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def is_first_token(chunk: ChatGenerationChunk) -> bool:
+    """片段是否带有实际输出（文本或工具调用），只有角色 / 空内容的开头片段不算"""
+    message = chunk.message
+    return bool(message.content) or bool(getattr(message, "tool_call_chunks", None))
+
+
+def _percentile(samples: List[float], q: float) -> Optional[float]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class HedgeStats:
+    """TTFT 分位数（最近 LLM_TTFT_SAMPLES 次调用）与对冲 / 重试计数"""
+
+    def __init__(self, samples: int = LLM_TTFT_SAMPLES):
+        self._lock = threading.Lock()
+        self._ttft: deque = deque(maxlen=samples)
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.retries = 0
+        self.failures = 0
+
+    def record(self, ttft: Optional[float], hedges: int, retries: int, hedge_won: bool):
+        with self._lock:
+            self.calls += 1
+            self.hedged += int(hedges > 0)
+            self.hedge_wins += int(hedge_won)
+            self.retries += retries
+            if ttft is None:
+                self.failures += 1
+            else:
+                self._ttft.append(ttft)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            samples = list(self._ttft)
+            calls = self.calls
+            result = {
+                "calls": calls,
+                "hedged": self.hedged,
+                "hedge_rate": round(self.hedged / calls, 4) if calls else 0.0,
+                "hedge_wins": self.hedge_wins,
+                "retries": self.retries,
+                "failures": self.failures,
+                "ttft_deadline": LLM_TTFT_DEADLINE,
+            }
+        for name, q in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99)):
+            value = _percentile(samples, q)
+            result[f"ttft_{name}_ms"] = round(value * 1000, 1) if value is not None else None
+        return result
+
+
+_hedge_stats = HedgeStats()
+
+
+def get_hedge_stats() -> HedgeStats:
+    return _hedge_stats
+
+
+class _Attempt:
+    """一次请求：序号、目标模型与是否为对冲请求"""
+
+    __slots__ = ("number", "model", "hedge", "started", "cancelled", "task", "leading")
+
+    def __init__(self, number: int, model: BaseChatModel, hedge: bool):
+        self.number = number
+        self.model = model
+        self.hedge = hedge
+        self.started = time.monotonic()
+        self.cancelled = threading.Event()
+        self.task = None
+        # 首 token 之前收到的空片段（角色等），胜出时先推送
+        self.leading: List[ChatGenerationChunk] = []
+
+
+class _Race:
+    """
+    一次调用内的请求调度（同步 / 异步实现共用）
+
+    请求依次轮流发往 [主模型, 备用模型]；对冲与重试都计入序号
+    """
+
+    def __init__(self, owner: "HedgedChatModel"):
+        self.owner = owner
+        self.started = time.monotonic()
+        self.launched = 0
+        self.hedges = 0
+        self.retries = 0
+        self.active: Dict[int, _Attempt] = {}
+        self.last_error: Optional[BaseException] = None
+
+    def next_attempt(self, hedge: bool) -> _Attempt:
+        models = [self.owner.primary] + ([self.owner.fallback] if self.owner.fallback is not None else [])
+        attempt = _Attempt(self.launched, models[self.launched % len(models)], hedge)
+        self.launched += 1
+        self.hedges += int(hedge)
+        self.active[attempt.number] = attempt
+        return attempt
+
+    def hedge_timeout(self) -> Optional[float]:
+        """距离发出下一个对冲请求的剩余时间；不再对冲时返回 None"""
+        if self.owner.ttft_deadline <= 0 or self.hedges >= self.owner.max_hedges or not self.active:
+            return None
+        latest = max(a.started for a in self.active.values())
+        return max(0.0, latest + self.owner.ttft_deadline - time.monotonic())
+
+    def on_error(self, number: int, error: BaseException) -> Optional[float]:
+        """
+        首 token 之前失败：仍有其他请求在进行时继续等待（返回 None），
+        否则返回重试前的等待时间；不可重试时抛出原错误
+        """
+        attempt = self.active.pop(number, None)
+        self.last_error = error
+        logger.warning(f"LLM attempt {number} ({_model_name(attempt.model) if attempt else '?'}) failed before first token: {error}")
+        if self.active:
+            return None
+        if self.retries >= self.owner.max_retries or not is_retryable(error):
+            self.finish(None)
+            raise error
+        delay = backoff_delay(self.retries)
+        self.retries += 1
+        return delay
+
+    def on_chunk(self, number: int, chunk: Any) -> Optional[List[ChatGenerationChunk]]:
+        """
+        首 token 之前收到片段：空片段缓存后返回 None（继续等待），
+        带内容的片段或流结束时 number 胜出，返回需要先推送的缓存片段
+        """
+        attempt = self.active[number]
+        if chunk is not _DONE and not is_first_token(chunk):
+            attempt.leading.append(chunk)
+            return None
+        return attempt.leading
+
+    def on_first_token(self, number: int) -> List[_Attempt]:
+        """number 胜出：返回需要取消的其余请求，并记录 TTFT"""
+        winner = self.active.pop(number)
+        losers = list(self.active.values())
+        self.active.clear()
+        for attempt in losers:
+            attempt.cancelled.set()
+        ttft = time.monotonic() - self.started
+        self.finish(ttft, hedge_won=winner.hedge)
+        if self.hedges or self.retries:
+            logger.info(
+                f"LLM first token after {ttft * 1000:.0f}ms from attempt {number} ({_model_name(winner.model)}), "
+                f"hedges={self.hedges} retries={self.retries}"
+            )
+        return losers
+
+    def finish(self, ttft: Optional[float], hedge_won: bool = False):
+        _hedge_stats.record(ttft, self.hedges, self.retries, hedge_won)
+
+
+def _model_name(model: BaseChatModel) -> str:
+    return getattr(model, "model_name", None) or type(model).__name__
+
+
+class HedgedChatModel(BaseChatModel):
+    """
+    包装主模型（及可选的备用模型），按首 token 截止时间对冲、失败重试
+
+    内层模型以 run_manager=None 调用，回调（流式 token 推送、usage 统计）只由本包装层
+    针对胜出请求触发，对冲中落败的请求不会产生任何输出
+    """
+
+    primary: BaseChatModel
+    fallback: Optional[BaseChatModel] = None
+    ttft_deadline: float = LLM_TTFT_DEADLINE
+    max_hedges: int = LLM_MAX_HEDGES
+    max_retries: int = LLM_RETRY_MAX
+    streaming: bool = True
+
+    @property
+    def _llm_type(self) -> str:
+        return f"hedged-{self.primary._llm_type}"
+
+    @property
+    def model_name(self) -> str:
+        return _model_name(self.primary)
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {
+            "primary": self.primary._identifying_params,
+            "fallback": self.fallback._identifying_params if self.fallback is not None else None,
+        }
+
+    def bind_tools(self, tools, **kwargs):
+        """工具按主模型的格式转换后作为调用参数绑定，主 / 备模型共用"""
+        binding = self.primary.bind_tools(tools, **kwargs)
+        return self.bind(**getattr(binding, "kwargs", {}))
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        race = _Race(self)
+        events: asyncio.Queue = asyncio.Queue()
+
+        async def pump(attempt: _Attempt):
+            try:
+                async for chunk in attempt.model._astream(messages, stop=stop, **kwargs):
+                    events.put_nowait((attempt.number, chunk, None))
+                events.put_nowait((attempt.number, _DONE, None))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                events.put_nowait((attempt.number, None, e))
+
+        def launch(hedge: bool):
+            attempt = race.next_attempt(hedge)
+            attempt.task = asyncio.ensure_future(pump(attempt))
+            tasks.append(attempt.task)
+
+        tasks: List[asyncio.Task] = []
+        try:
+            launch(hedge=False)
+            while True:
+                try:
+                    number, chunk, error = await asyncio.wait_for(events.get(), race.hedge_timeout())
+                except asyncio.TimeoutError:
+                    launch(hedge=True)
+                    continue
+                if number not in race.active:
+                    continue
+                if error is not None:
+                    delay = race.on_error(number, error)
+                    if delay is not None:
+                        await asyncio.sleep(delay)
+                        launch(hedge=False)
+                    continue
+                leading = race.on_chunk(number, chunk)
+                if leading is None:
+                    continue
+                for loser in race.on_first_token(number):
+                    loser.task.cancel()
+                winner = number
+                break
+
+            for buffered in leading:
+                yield buffered
+            while chunk is not _DONE:
+                yield chunk
+                number, chunk, error = await events.get()
+                while number != winner:
+                    number, chunk, error = await events.get()
+                if error is not None:
+                    raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        # 同步调用（graph.stream）：每个请求在独立线程中读取流；
+        # 阻塞在等待首 token 的落败请求无法立即中断，收到数据后检查取消标记并关闭流
+        race = _Race(self)
+        events: queue.Queue = queue.Queue()
+
+        def pump(attempt: _Attempt):
+            stream = attempt.model._stream(messages, stop=stop, **kwargs)
+            try:
+                for chunk in stream:
+                    if attempt.cancelled.is_set():
+                        return
+                    events.put((attempt.number, chunk, None))
+                events.put((attempt.number, _DONE, None))
+            except Exception as e:
+                events.put((attempt.number, None, e))
+            finally:
+                stream.close()
+
+        def launch(hedge: bool):
+            attempt = race.next_attempt(hedge)
+            attempts.append(attempt)
+            threading.Thread(target=pump, args=(attempt,), name=f"llm-attempt-{attempt.number}", daemon=True).start()
+
+        attempts: List[_Attempt] = []
+        try:
+            launch(hedge=False)
+            while True:
+                try:
+                    number, chunk, error = events.get(timeout=race.hedge_timeout())
+                except queue.Empty:
+                    launch(hedge=True)
+                    continue
+                if number not in race.active:
+                    continue
+                if error is not None:
+                    delay = race.on_error(number, error)
+                    if delay is not None:
+                        time.sleep(delay)
+                        launch(hedge=False)
+                    continue
+                leading = race.on_chunk(number, chunk)
+                if leading is None:
+                    continue
+                race.on_first_token(number)
+                winner = number
+                break
+
+            for buffered in leading:
+                yield buffered
+            while chunk is not _DONE:
+                yield chunk
+                number, chunk, error = events.get()
+                while number != winner:
+                    number, chunk, error = events.get()
+                if error is not None:
+                    raise error
+        finally:
+            for attempt in attempts:
+                attempt.cancelled.set()
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        return await agenerate_from_stream(self._astream(messages, stop=stop, **kwargs))
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        return generate_from_stream(self._stream(messages, stop=stop, **kwargs))
+
+
+def unwrap_model(model: BaseChatModel) -> BaseChatModel:
+    """取得被包装的主模型（需要访问 ChatOpenAI 客户端时使用）"""
+    return model.primary if isinstance(model, HedgedChatModel) else model
+
+
+def with_hedging(primary: BaseChatModel, fallback: Optional[BaseChatModel] = None) -> BaseChatModel:
+    """LLM_HEDGING_ENABLED 时包装为 HedgedChatModel，否则原样返回主模型"""
+    if not LLM_HEDGING_ENABLED:
+        return primary
+    return HedgedChatModel(primary=primary, fallback=fallback)
@@ -0,0 +1,219 @@
+"""
+Conversation History Policy
+按 token 预算管理会话历史：
+
+- 单条用户消息超过 HISTORY_MESSAGE_MAX_TOKENS 时截断（写入状态前，由 AgentState 的 reducer 执行）
+- 历史超过 HISTORY_TOKEN_BUDGET 时，最早的若干轮折叠进一条滚动摘要消息（固定在历史最前面），
+  摘要在一轮对话结束后于后台生成，不占用回复的响应时间
+
+每轮提示词大小因此有上限：系统提示词 + 摘要 + 预算内的历史 + 截断后的当前消息
+"""
+
+import asyncio
+import contextlib
+import logging
+import os
+from typing import Any, AsyncContextManager, Callable, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.messages import (
+    AnyMessage,
+    BaseMessage,
+    HumanMessage,
+    RemoveMessage,
+    SystemMessage,
+)
+from langgraph.graph.message import REMOVE_ALL_MESSAGES
+
+from utils.token_counter import count_message_tokens, count_tokens, message_text, truncate_tokens
+
+logger = logging.getLogger(__name__)
+
+HISTORY_SUMMARY_ENABLED = os.getenv("HISTORY_SUMMARY_ENABLED", "1").lower() in ("1", "true")
+# 历史消息（不含系统提示词与摘要）的 token 预算，超过后触发折叠
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "6000"))
+# 折叠后保留的最近历史 token 数，低于预算留出余量，避免每轮都触发摘要
+HISTORY_KEEP_TOKENS = int(os.getenv("HISTORY_KEEP_TOKENS", str(HISTORY_TOKEN_BUDGET * 3 // 5)))
+# 单条用户消息的 token 上限（粘贴的规格书等超长内容）
+HISTORY_MESSAGE_MAX_TOKENS = int(os.getenv("HISTORY_MESSAGE_MAX_TOKENS", "2000"))
+# 摘要的最大输出 token 数与生成超时（秒）
+HISTORY_SUMMARY_MAX_TOKENS = int(os.getenv("HISTORY_SUMMARY_MAX_TOKENS", "400"))
+HISTORY_SUMMARY_TIMEOUT = float(os.getenv("HISTORY_SUMMARY_TIMEOUT", "30"))
+
+# 摘要消息使用固定 ID：更新时按 ID 替换，窗口裁剪时保留
+SUMMARY_MESSAGE_ID = "history-summary"
+SUMMARY_PREFIX = "Summary of the earlier conversation with this customer:\n"
+TRUNCATED_MARKER = "\n[... message truncated, {omitted} tokens omitted ...]"
+
+_SUMMARY_INSTRUCTION = (
+    "You maintain a running summary of a sales chat between a customer and Larry Chen "
+    "(paper packaging adhesives). Merge the previous summary and the new messages into one "
+    "concise summary in the customer's language. Keep every concrete fact the conversation "
+    "may need later: customer name and company, contact details shared, application, "
+    "machine model and speed, coating method, paper type, climate, quantities, products "
+    "recommended, prices or samples discussed, open questions. Omit greetings and small talk. "
+    "Output only the summary."
+)
+
+
+def is_summary(message: BaseMessage) -> bool:
+    return message.id == SUMMARY_MESSAGE_ID
+
+
+def truncate_message(message: AnyMessage) -> AnyMessage:
+    """超长用户消息截断到 HISTORY_MESSAGE_MAX_TOKENS，并注明省略的 token 数"""
+    if (
+        HISTORY_MESSAGE_MAX_TOKENS <= 0
+        or not isinstance(message, HumanMessage)
+        or not isinstance(message.content, str)
+        # token 数不会超过字符数，短消息无需计数
+        or len(message.content) <= HISTORY_MESSAGE_MAX_TOKENS
+        or message.additional_kwargs.get("truncated")
+    ):
+        return message
+    total = count_tokens(message.content)
+    if total <= HISTORY_MESSAGE_MAX_TOKENS:
+        return message
+    content = truncate_tokens(message.content, HISTORY_MESSAGE_MAX_TOKENS)
+    content += TRUNCATED_MARKER.format(omitted=total - HISTORY_MESSAGE_MAX_TOKENS)
+    logger.info(f"Truncated user message from {total} to {HISTORY_MESSAGE_MAX_TOKENS} tokens")
+    return message.model_copy(update={
+        "content": content,
+        "additional_kwargs": {**message.additional_kwargs, "truncated": True},
+    })
+
+
+def split_history(messages: Sequence[AnyMessage]) -> Optional[Tuple[Optional[AnyMessage], List[AnyMessage], List[AnyMessage]]]:
+    """
+    检查历史是否超出预算
+
+    未超出时返回 None；超出时返回 (当前摘要, 待折叠的消息, 保留的消息)。
+    保留部分从一条用户消息开始，不会把一轮对话拆开
+    """
+    summary = messages[0] if messages and is_summary(messages[0]) else None
+    history = list(messages[1:] if summary is not None else messages)
+    if count_message_tokens(history) <= HISTORY_TOKEN_BUDGET:
+        return None
+
+    # 从最新的消息往前累计，直到达到保留量
+    kept_tokens = 0
+    cut = len(history)
+    for i in range(len(history) - 1, -1, -1):
+        kept_tokens += count_message_tokens([history[i]])
+        if kept_tokens > HISTORY_KEEP_TOKENS:
+            break
+        cut = i
+    # 对齐到轮次边界，至少保留最近一轮
+    while cut < len(history) and not isinstance(history[cut], HumanMessage):
+        cut += 1
+    if cut >= len(history):
+        cut = max((i for i, m in enumerate(history) if isinstance(m, HumanMessage)), default=0)
+    if cut == 0:
+        return None
+    return summary, history[:cut], history[cut:]
+
+
+def _format_transcript(messages: Sequence[AnyMessage]) -> str:
+    lines = []
+    for m in messages:
+        text = message_text(m.content).strip()
+        if text:
+            role = "Customer" if isinstance(m, HumanMessage) else "Larry"
+            lines.append(f"{role}: {text}")
+    return "\n".join(lines)
+
+
+async def summarize(llm, previous: Optional[str], messages: Sequence[AnyMessage]) -> str:
+    """把上一版摘要与待折叠的消息合并成新摘要"""
+    prompt = (
+        f"Previous summary:\n{previous or '(none)'}\n\n"
+        f"New messages:\n{_format_transcript(messages)}"
+    )
+    result = await llm.ainvoke([SystemMessage(content=_SUMMARY_INSTRUCTION), HumanMessage(content=prompt)])
+    return message_text(result.content).strip()
+
+
+class HistoryCompactor:
+    """
+    会话历史折叠：一轮对话结束后检查 token 预算，超出时生成摘要并改写 checkpoint
+
+    摘要生成期间不占用会话，新一轮可以照常开始；改写前在 guard（会话锁）内确认 checkpoint
+    仍是生成摘要时读取的那个，会话已有新的轮次（或正在运行）时放弃本次改写，下一轮结束后重新检查
+    """
+
+    def __init__(self, llm_factory):
+        # llm_factory() 返回用于生成摘要的模型（随配置热更新变化，每次折叠时获取）
+        self._llm_factory = llm_factory
+        self.compactions = 0
+        self.failures = 0
+        self.deferred = 0
+        self.folded_messages = 0
+        self.folded_tokens = 0
+
+    async def compact(
+        self,
+        agent,
+        config: Dict[str, Any],
+        guard: Optional[Callable[[], AsyncContextManager[Any]]] = None,
+    ) -> bool:
+        """
+        历史超出预算时折叠最早的若干轮，返回是否改写了历史
+
+        guard() 返回改写时持有的会话锁，无法立即获取时抛出 TimeoutError（视为会话已有新的轮次）
+        """
+        if not HISTORY_SUMMARY_ENABLED:
+            return False
+        state = await agent.aget_state(config)
+        checkpoint_id = state.config["configurable"].get("checkpoint_id")
+        messages = state.values.get("messages") or []
+        split = split_history(messages)
+        if split is None:
+            return False
+
+        summary, folded, kept = split
+        previous = message_text(summary.content)[len(SUMMARY_PREFIX):] if summary is not None else None
+        folded_tokens = count_message_tokens(folded)
+        try:
+            llm = self._llm_factory().bind(max_tokens=HISTORY_SUMMARY_MAX_TOKENS)
+            text = await asyncio.wait_for(summarize(llm, previous, folded), HISTORY_SUMMARY_TIMEOUT)
+        except Exception as e:
+            # 摘要失败时仍然丢弃最早的消息（保留上一版摘要），保证提示词大小有上限
+            self.failures += 1
+            logger.warning(f"History summarization failed, dropping {len(folded)} messages without summary: {e}")
+            text = previous
+
+        new_messages: List[AnyMessage] = [RemoveMessage(id=REMOVE_ALL_MESSAGES)]
+        if text:
+            new_messages.append(SystemMessage(content=SUMMARY_PREFIX + text, id=SUMMARY_MESSAGE_ID))
+        new_messages.extend(kept)
+        thread_id = config["configurable"]["thread_id"]
+        try:
+            async with guard() if guard is not None else contextlib.nullcontext():
+                current = await agent.aget_state(config)
+                if current.config["configurable"].get("checkpoint_id") != checkpoint_id:
+                    self.deferred += 1
+                    logger.info(f"History moved on while summarizing, compaction deferred (thread: {thread_id})")
+                    return False
+                await agent.aupdate_state(config, {"messages": new_messages}, as_node="model")
+        except TimeoutError:
+            self.deferred += 1
+            logger.info(f"Session is busy, history compaction deferred (thread: {thread_id})")
+            return False
+
+        self.compactions += 1
+        self.folded_messages += len(folded)
+        self.folded_tokens += folded_tokens
+        logger.info(
+            f"Folded {len(folded)} messages (~{folded_tokens} tokens) into history summary "
+            f"(~{count_tokens(text)} tokens), kept {len(kept)} messages "
+            f"(thread: {thread_id})"
+        )
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "compactions": self.compactions,
+            "failures": self.failures,
+            "deferred": self.deferred,
+            "folded_messages": self.folded_messages,
+            "folded_tokens": self.folded_tokens,
+        }
@@ -0,0 +1,122 @@
+"""
+Language-Aware System Prompt
+按会话语言裁剪系统提示词：公共核心 + 该会话语言的参考段，而不是每轮都发送全部语言的问候表
+
+- 每次模型调用前对最新的用户消息做本地语言识别（utils.language，微秒级）
+- 识别结果按会话（thread_id）缓存：之后的短消息（"ok"、"thanks"）识别不出语言时沿用会话语言；
+  可靠识别到另一种语言时切换
+- 会话语言未知（识别失败且无缓存）或语言没有独立段落时，使用包含全部语言的完整提示词
+"""
+
+import logging
+import os
+import threading
+from typing import Any, Dict, Optional
+
+from cachetools import TTLCache
+from langchain.agents.middleware import AgentMiddleware
+from langgraph.config import get_config
+
+from agents.model_router import last_user_text
+from agents.prompting import assemble_system_prompt, language_codes
+from utils.language import detect_language
+
+logger = logging.getLogger(__name__)
+
+LANGUAGE_PROMPT_ENABLED = os.getenv("LANGUAGE_PROMPT_ENABLED", "1").lower() in ("1", "true")
+# 会话语言缓存的容量与过期时间（秒）
+LANGUAGE_SESSION_CACHE_SIZE = int(os.getenv("LANGUAGE_SESSION_CACHE_SIZE", "10000"))
+LANGUAGE_SESSION_TTL = float(os.getenv("LANGUAGE_SESSION_TTL", "86400"))
+
+
+class SessionLanguages:
+    """thread_id -> 会话语言（进程内共享，配置热更新后沿用）"""
+
+    def __init__(self, maxsize: int = LANGUAGE_SESSION_CACHE_SIZE, ttl: float = LANGUAGE_SESSION_TTL):
+        self._cache: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self.detections = 0
+        self.switches = 0
+        self.sliced = 0
+        self.full = 0
+
+    def get(self, thread_id: Optional[str]) -> Optional[str]:
+        if thread_id is None:
+            return None
+        with self._lock:
+            return self._cache.get(thread_id)
+
+    def resolve(self, thread_id: Optional[str], text: str, supported) -> Optional[str]:
+        """识别本轮语言并更新会话缓存，返回本次调用使用的语言（未知时为 None）"""
+        detected = detect_language(text) if text else None
+        if detected not in supported:
+            detected = None
+        with self._lock:
+            cached = self._cache.get(thread_id) if thread_id is not None else None
+            if detected is None:
+                language = cached
+            else:
+                self.detections += 1
+                if cached is not None and cached != detected:
+                    self.switches += 1
+                    logger.info(f"Session language switched {cached} -> {detected} (thread: {thread_id})")
+                if thread_id is not None:
+                    self._cache[thread_id] = detected
+                language = detected
+            if language is None:
+                self.full += 1
+            else:
+                self.sliced += 1
+            return language
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "sessions": len(self._cache),
+                "detections": self.detections,
+                "switches": self.switches,
+                "sliced_calls": self.sliced,
+                "full_prompt_calls": self.full,
+            }
+
+
+_session_languages = SessionLanguages()
+
+
+def get_session_languages() -> SessionLanguages:
+    return _session_languages
+
+
+def _thread_id() -> Optional[str]:
+    try:
+        return get_config().get("configurable", {}).get("thread_id")
+    except RuntimeError:
+        # 不在图执行上下文中
+        return None
+
+
+class LanguagePromptMiddleware(AgentMiddleware):
+    """模型调用前把系统提示词替换为核心 + 会话语言段（各语言的提示词在编译 Agent 时生成）"""
+
+    def __init__(self, cfg: Dict[str, Any]):
+        super().__init__()
+        self.prompts = {code: assemble_system_prompt(cfg, code) for code in language_codes(cfg)}
+
+    def _slice(self, request):
+        language = _session_languages.resolve(_thread_id(), last_user_text(request.messages), self.prompts)
+        if language is None:
+            return request
+        return request.override(system_prompt=self.prompts[language])
+
+    def wrap_model_call(self, request, handler):
+        return handler(self._slice(request))
+
+    async def awrap_model_call(self, request, handler):
+        return await handler(self._slice(request))
+
+
+def build_language_prompt(cfg: Dict[str, Any]) -> Optional[LanguagePromptMiddleware]:
+    """配置了 sp_languages 且未关闭时返回中间件，否则返回 None（始终使用完整提示词）"""
+    if not LANGUAGE_PROMPT_ENABLED or not language_codes(cfg):
+        return None
+    return LanguagePromptMiddleware(cfg)
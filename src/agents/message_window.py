@@ -0,0 +1,145 @@
+"""
+Message Window
+AgentState.messages 的增量窗口 reducer
+
+add_messages 每次更新都会重新转换、重新编号整个历史列表并按 ID 重新匹配，再切片复制一次；
+MessageWindow 在列表之外维护 ID 索引（ID -> 绝对序号），Python 层只处理新消息：
+
+- 追加 / 按 ID 替换：只转换、匹配新消息，不重新扫描历史
+- 超出窗口时淘汰最早的消息：只移动基准序号，无需重新编号
+
+每次更新返回新的窗口对象，复制一次指针数组与索引字典（O(窗口大小)，均为 C 层操作，窗口大小有上限）。
+这是 reducer 的约定要求的：LangGraph 把 reducer 的返回值直接作为 checkpoint 快照与 values 流的内容，
+上一版可能仍在后台序列化或在写回缓冲中，原地修改会改变已生成的快照。
+checkpoint 仍保存完整的消息列表（按 channel 版本整体序列化）
+"""
+
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from langchain_core.messages import (
+    AnyMessage,
+    BaseMessageChunk,
+    RemoveMessage,
+    ToolMessage,
+    convert_to_messages,
+    message_chunk_to_message,
+)
+from langgraph.graph.message import REMOVE_ALL_MESSAGES
+
+
+class MessageWindow(list):
+    """
+    有上限的消息列表（list 子类，对 Agent 与序列化透明）
+
+    pinned 条固定在开头的消息（如历史摘要）不参与淘汰；
+    其余消息的位置 = pinned + 序号 - base
+    """
+
+    __slots__ = ("_index", "_base", "pinned")
+
+    def __init__(self, messages: Iterable[AnyMessage] = (), pinned: int = 0):
+        super().__init__(messages)
+        self.pinned = pinned
+        self._base = 0
+        self._index: Dict[str, int] = {m.id: i - pinned for i, m in enumerate(self) if i >= pinned}
+
+    def position(self, message_id: str) -> Optional[int]:
+        if self.pinned and self[0].id == message_id:
+            return 0
+        seq = self._index.get(message_id)
+        return None if seq is None else self.pinned + seq - self._base
+
+    @classmethod
+    def _from_parts(cls, items: List[AnyMessage], index: Dict[str, int], base: int, pinned: int) -> "MessageWindow":
+        """直接使用已维护好的索引构造，不重新扫描"""
+        window = cls.__new__(cls)
+        list.__init__(window, items)
+        window._index = index
+        window._base = base
+        window.pinned = pinned
+        return window
+
+
+def coerce_messages(new: Any) -> List[AnyMessage]:
+    """只转换本次新增的消息（add_messages 会连同整个历史一起转换）"""
+    messages = convert_to_messages(new if isinstance(new, list) else [new])
+    return [message_chunk_to_message(m) if isinstance(m, BaseMessageChunk) else m for m in messages]
+
+
+def merge_window(
+    old: Optional[Sequence[AnyMessage]],
+    new: Any,
+    max_messages: int,
+    is_pinned=lambda message: False,
+) -> MessageWindow:
+    """
+    把新消息合并进窗口，语义与 add_messages + 保留最近 max_messages 条一致
+
+    old 来自 checkpoint 反序列化时是普通 list，首次合并时建立一次索引；
+    返回新窗口，old 保持不变（见模块说明）
+    """
+    if isinstance(old, MessageWindow):
+        window = old
+    else:
+        old = old or []
+        window = MessageWindow(old, pinned=1 if old and is_pinned(old[0]) else 0)
+
+    items = list(window)
+    index = dict(window._index)
+    base = window._base
+    pinned = window.pinned
+    to_remove = set()
+
+    for m in coerce_messages(new):
+        if m.id is None:
+            m.id = str(uuid.uuid4())
+        if isinstance(m, RemoveMessage) and m.id == REMOVE_ALL_MESSAGES:
+            items, index, base, pinned = [], {}, 0, 0
+            to_remove.clear()
+            continue
+
+        if pinned and items[0].id == m.id:
+            if isinstance(m, RemoveMessage):
+                to_remove.add(m.id)
+            else:
+                items[0] = m
+                to_remove.discard(m.id)
+            continue
+
+        seq = index.get(m.id)
+        if seq is not None:
+            if isinstance(m, RemoveMessage):
+                to_remove.add(m.id)
+            else:
+                items[pinned + seq - base] = m
+                to_remove.discard(m.id)
+        elif isinstance(m, RemoveMessage):
+            raise ValueError(f"Attempting to delete a message with an ID that doesn't exist ('{m.id}')")
+        elif not items and is_pinned(m):
+            items.append(m)
+            pinned = 1
+        else:
+            index[m.id] = base + len(items) - pinned
+            items.append(m)
+
+    if to_remove:
+        # 按 ID 删除中间的消息较少见（摘要折叠使用 REMOVE_ALL），直接重建
+        kept = [m for m in items if m.id not in to_remove]
+        head = 1 if pinned and kept and kept[0] is items[0] else 0
+        result = MessageWindow(kept, pinned=head)
+        items, index, base, pinned = list(result), result._index, result._base, result.pinned
+
+    # 超出窗口：淘汰固定消息之后最早的若干条
+    excess = len(items) - max_messages
+    if excess > 0:
+        # 窗口不能以工具结果开头（对应的 tool_calls 已被淘汰，模型接口会拒绝）
+        while pinned + excess < len(items) and isinstance(items[pinned + excess], ToolMessage):
+            excess += 1
+        evicted = items[pinned:pinned + excess]
+        items = items[:pinned] + items[pinned + excess:]
+        for m in evicted:
+            index.pop(m.id, None)
+        base += excess
+
+    return MessageWindow._from_parts(items, index, base, pinned)
@@ -0,0 +1,228 @@
+"""
+Model Tier Router
+每轮对话在调用模型前按本地启发式规则（长度、语言、关键词、轮次）选择模型档位：
+问候、致谢、索要联系方式等简单轮次使用 lite 模型，技术选型等复杂轮次使用 full 模型
+
+配置（agent_llm_config.json 的 routing 段，缺省时不路由，所有轮次使用 config.model）：
+
+    "routing": {
+        "default_tier": "full",
+        "simple_tier": "lite",
+        "simple_max_chars": 80,
+        "tiers": {
+            "lite": {"model": "...", "timeout": 30, "max_completion_tokens": 300},
+            "full": {"model": "...", "timeout": 120, "max_completion_tokens": 1000}
+        }
+    }
+
+档位内的键覆盖 config 中的同名模型参数（model/temperature/timeout/max_completion_tokens/thinking 等），
+max_completion_tokens 只在档位内显式设置时作为该档位的输出上限。
+每次路由决策与该档位的耗时、token 用量记录在日志与 get_routing_stats() 中，用于评估延迟与成本收益
+"""
+
+import logging
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from langchain.agents.middleware import AgentMiddleware
+from langchain_core.messages import AIMessage, AnyMessage, HumanMessage
+
+from utils.language import detect_script
+from utils.token_counter import message_text
+
+logger = logging.getLogger(__name__)
+
+# 简单轮次的默认字符上限（超过即视为复杂）
+DEFAULT_SIMPLE_MAX_CHARS = 80
+
+# 出现即需要 full 模型的技术 / 选型关键词（不区分大小写）
+DEFAULT_COMPLEX_KEYWORDS = (
+    "glue", "adhesive", "machine", "speed", "m/min", "coating", "roller", "spray", "nozzle",
+    "viscosity", "solid content", "temperature", "humidity", "drying", "bond", "laminat",
+    "paper", "bag", "carton", "tube", "kraft", "coated", "film", "sample", "spec", "datasheet",
+    "recommend", "compare", "difference", "problem", "issue",
+    "ql-", "side glue",
+    "胶", "粘", "机器", "机速", "速度", "涂胶", "喷胶", "粘度", "固含", "温度", "湿度", "干燥",
+    "纸", "袋", "样品", "推荐", "区别", "问题",
+)
+
+# 可由 lite 模型处理的简单意图：问候、致谢、确认、联系方式
+DEFAULT_SIMPLE_PATTERNS = (
+    r"^(hi|hello|hey|good (morning|afternoon|evening)|greetings|how are you)\b",
+    r"\b(thanks?|thank you|thx|appreciate)\b",
+    r"^(ok(ay)?|sure|yes|no|got it|great|nice|cool|fine|bye|goodbye|see you)\b",
+    r"\b(whatsapp|wechat|e-?mail|phone|contact|number)\b",
+    r"^(你好|您好|嗨|哈喽|早上好|下午好|晚上好)",
+    r"(谢谢|感谢|多谢|好的|收到|明白|再见|拜拜)",
+    r"(微信|电话|邮箱|联系方式)",
+)
+
+_CJK = re.compile(r"[㐀-鿿豈-﫿]")
+_NUMBER_WITH_UNIT = re.compile(r"\d+(\.\d+)?\s*(m/min|mm|cm|gsm|g/m|kg|ton|tons|pcs|%|°c|cps|mpa)", re.IGNORECASE)
+
+
+def last_user_text(messages: Sequence[AnyMessage]) -> str:
+    for m in reversed(messages):
+        if isinstance(m, HumanMessage):
+            return message_text(m.content).strip()
+    return ""
+
+
+def turn_index(messages: Sequence[AnyMessage]) -> int:
+    """当前是第几轮（从 1 开始，按窗口内的用户消息数计）"""
+    return sum(1 for m in messages if isinstance(m, HumanMessage))
+
+
+def _keyword_pattern(keywords: Sequence[str]) -> "re.Pattern":
+    """拉丁字母关键词按词首匹配（"how" 不命中 "show"，"laminat" 命中 "laminated"），中文按子串匹配"""
+    parts = []
+    for keyword in keywords:
+        escaped = re.escape(keyword.lower())
+        parts.append(escaped if _CJK.match(keyword[:1]) else rf"\b{escaped}")
+    return re.compile("|".join(parts) or r"(?!)", re.IGNORECASE)
+
+
+class TierRule:
+    """由 routing 配置构造的分类规则"""
+
+    def __init__(self, routing: Dict[str, Any]):
+        self.default_tier: str = routing.get("default_tier") or next(iter(routing["tiers"]))
+        self.simple_tier: str = routing.get("simple_tier", self.default_tier)
+        self.simple_max_chars: int = routing.get("simple_max_chars", DEFAULT_SIMPLE_MAX_CHARS)
+        # 书写系统不在此列表中的消息（如阿拉伯语、俄语）使用默认档位，lite 模型的小语种能力较弱
+        self.simple_scripts = tuple(routing.get("simple_scripts", ("latin", "cjk")))
+        # 前若干轮之后只有命中简单意图的短消息才降级（对话深入后上下文更复杂）
+        self.max_simple_turn: Optional[int] = routing.get("max_simple_turn")
+        self.complex_keywords = _keyword_pattern(routing.get("complex_keywords", DEFAULT_COMPLEX_KEYWORDS))
+        self.simple_patterns = [re.compile(p, re.IGNORECASE) for p in routing.get("simple_patterns", DEFAULT_SIMPLE_PATTERNS)]
+
+    def classify(self, text: str, turn: int) -> Tuple[str, str]:
+        """返回 (档位, 原因)"""
+        if not text:
+            return self.default_tier, "empty"
+        if len(text) > self.simple_max_chars:
+            return self.default_tier, "long"
+        if detect_script(text) not in self.simple_scripts:
+            return self.default_tier, "language"
+        if _NUMBER_WITH_UNIT.search(text):
+            return self.default_tier, "specs"
+        match = self.complex_keywords.search(text)
+        if match:
+            return self.default_tier, f"keyword:{match.group(0).lower()}"
+        if self.max_simple_turn is not None and turn > self.max_simple_turn:
+            return self.default_tier, "late_turn"
+        for pattern in self.simple_patterns:
+            if pattern.search(text):
+                return self.simple_tier, "simple_intent"
+        return self.default_tier, "default"
+
+
+class RoutingStats:
+    """各档位的调用次数、耗时与 token 用量（进程内累计，所有配置版本共享）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tiers: Dict[str, Dict[str, Any]] = {}
+        self._reasons: Dict[str, int] = {}
+
+    def record(self, tier: str, model: str, reason: str, elapsed: float, usage: Dict[str, int], failed: bool = False):
+        with self._lock:
+            entry = self._tiers.setdefault(tier, {
+                "model": model, "calls": 0, "failures": 0, "seconds": 0.0,
+                "input_tokens": 0, "output_tokens": 0,
+            })
+            entry["model"] = model
+            entry["calls"] += 1
+            entry["failures"] += int(failed)
+            entry["seconds"] += elapsed
+            entry["input_tokens"] += usage.get("input_tokens", 0)
+            entry["output_tokens"] += usage.get("output_tokens", 0)
+            reason_key = reason.split(":", 1)[0]
+            self._reasons[reason_key] = self._reasons.get(reason_key, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            tiers = {}
+            for name, entry in self._tiers.items():
+                calls = entry["calls"]
+                tiers[name] = {
+                    **{k: v for k, v in entry.items() if k != "seconds"},
+                    "avg_latency_ms": round(entry["seconds"] / calls * 1000, 1) if calls else None,
+                    "avg_output_tokens": round(entry["output_tokens"] / calls, 1) if calls else None,
+                }
+            return {"tiers": tiers, "reasons": dict(self._reasons)}
+
+
+_routing_stats = RoutingStats()
+
+
+def get_routing_stats() -> RoutingStats:
+    return _routing_stats
+
+
+def _response_usage(response) -> Dict[str, int]:
+    usage = {"input_tokens": 0, "output_tokens": 0}
+    messages: List[AnyMessage] = getattr(response, "result", None) or []
+    for m in messages:
+        if isinstance(m, AIMessage) and m.usage_metadata:
+            usage["input_tokens"] += m.usage_metadata.get("input_tokens", 0)
+            usage["output_tokens"] += m.usage_metadata.get("output_tokens", 0)
+    return usage
+
+
+class ModelRouterMiddleware(AgentMiddleware):
+    """模型调用前按规则选择档位，替换本次调用使用的模型"""
+
+    def __init__(self, rule: TierRule, models: Dict[str, Any]):
+        super().__init__()
+        self.rule = rule
+        # 档位名 -> ChatOpenAI（编译 Agent 时创建，请求间共享）
+        self.models = models
+
+    def _route(self, request) -> Tuple[Any, str, str, str]:
+        messages = request.messages
+        text = last_user_text(messages)
+        turn = turn_index(messages)
+        tier, reason = self.rule.classify(text, turn)
+        model = self.models[tier]
+        logger.info(f"Model route: tier={tier} model={model.model_name} reason={reason} chars={len(text)} turn={turn}")
+        return request.override(model=model), tier, model.model_name, reason
+
+    def _record(self, tier: str, model: str, reason: str, started: float, response=None, failed: bool = False):
+        elapsed = time.perf_counter() - started
+        usage = _response_usage(response)
+        _routing_stats.record(tier, model, reason, elapsed, usage, failed)
+        logger.info(
+            f"Model call done: tier={tier} model={model} {elapsed * 1000:.0f}ms "
+            f"input={usage['input_tokens']} output={usage['output_tokens']}{' FAILED' if failed else ''}"
+        )
+
+    def wrap_model_call(self, request, handler):
+        request, tier, model, reason = self._route(request)
+        started = time.perf_counter()
+        try:
+            response = handler(request)
+        except Exception:
+            self._record(tier, model, reason, started, failed=True)
+            raise
+        self._record(tier, model, reason, started, response)
+        return response
+
+    async def awrap_model_call(self, request, handler):
+        request, tier, model, reason = self._route(request)
+        started = time.perf_counter()
+        try:
+            response = await handler(request)
+        except Exception:
+            self._record(tier, model, reason, started, failed=True)
+            raise
+        self._record(tier, model, reason, started, response)
+        return response
+
+
+def tier_config(cfg: Dict[str, Any], tier: str) -> Dict[str, Any]:
+    """档位的完整配置：档位参数覆盖 config 中的同名参数，其余（提示词等）不变"""
+    overrides = cfg["routing"]["tiers"][tier]
+    return {**cfg, "config": {**cfg["config"], **overrides}}
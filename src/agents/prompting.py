@@ -0,0 +1,118 @@
+"""
+Prompt Assembly
+系统提示词组装与提示词 token 统计
+
+系统提示词作为请求的第一条消息，内容在同一配置版本内逐字节不变（不拼接时间、会话等动态信息），
+模型服务端的前缀缓存（prefix cache）因此可以在所有会话、所有轮次之间复用；
+PROMPT_CACHE_HINT 控制是否额外携带缓存提示字段
+"""
+
+import hashlib
+import logging
+import os
+from typing import Any, Dict, Iterable, List, Optional
+
+from utils.token_counter import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# 前缀缓存提示："none" 不携带；"prompt_cache_key" 以系统提示词哈希作为 prompt_cache_key
+# （OpenAI 接口字段，相同 key 的请求路由到同一缓存；仅在模型服务支持该字段时开启）
+# 也可在 agent_llm_config.json 的 config.prompt_cache_hint 中按配置覆盖
+PROMPT_CACHE_HINT = os.getenv("PROMPT_CACHE_HINT", "none")
+
+
+def _normalize(text: str) -> str:
+    """
+    规范化提示词文本：统一换行符、去掉行尾空白与首尾空行
+
+    只做与语义无关的规范化，保证编辑器差异（CRLF、行尾空格）不会产生不同的前缀
+    """
+    lines = text.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip("\n")
+
+
+def language_codes(cfg: Dict[str, Any]) -> List[str]:
+    """配置中有独立语言段（sp_languages.blocks）的语言代码"""
+    return list((cfg.get("sp_languages") or {}).get("blocks", {}))
+
+
+def assemble_system_prompt(cfg: Dict[str, Any], language: Optional[str] = None) -> str:
+    """
+    系统提示词 = 公共核心（sp）+ 语言参考段（sp_languages）
+
+    language 为有独立语言段的代码时只附加该语言的段落，否则附加全部语言（未识别语言时的完整提示词）。
+    语言段放在核心之后：所有会话共享逐字节相同的核心前缀
+    """
+    core = _normalize(cfg.get("sp") or "")
+    section = cfg.get("sp_languages")
+    if not section:
+        return core
+    blocks = section.get("blocks", {})
+    rows = [blocks[language]] if language in blocks else list(blocks.values())
+    return core + "\n\n" + _normalize("\n".join([section.get("header", "")] + rows))
+
+
+def prompt_cache_key(system_prompt: str) -> str:
+    return "sp-" + hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()[:16]
+
+
+def prompt_cache_params(cfg: Dict[str, Any], system_prompt: str) -> Dict[str, Any]:
+    """按配置返回需要并入请求体（extra_body）的前缀缓存提示字段"""
+    hint = cfg.get("config", {}).get("prompt_cache_hint", PROMPT_CACHE_HINT)
+    if hint == "prompt_cache_key":
+        return {"prompt_cache_key": prompt_cache_key(system_prompt)}
+    if hint not in ("none", "", None):
+        logger.warning(f"Unknown prompt_cache_hint {hint!r}, ignored")
+    return {}
+
+
+def message_usage(messages: Iterable[Any]) -> Dict[str, int]:
+    """
+    汇总 AI 消息上的 usage_metadata：input / cached（前缀缓存命中）/ output tokens
+
+    流式调用需开启 stream_usage，服务端才会在最后一个分片返回 usage
+    """
+    usage = {"input": 0, "cached": 0, "output": 0, "calls": 0}
+    for message in messages:
+        metadata: Optional[Dict[str, Any]] = getattr(message, "usage_metadata", None)
+        if not metadata:
+            continue
+        usage["input"] += metadata.get("input_tokens", 0)
+        usage["output"] += metadata.get("output_tokens", 0)
+        usage["cached"] += (metadata.get("input_token_details") or {}).get("cache_read", 0) or 0
+        usage["calls"] += 1
+    return usage
+
+
+class TokenUsage:
+    """进程内累计的 token 用量（/api/stats）"""
+
+    def __init__(self):
+        self.requests = 0
+        self.input = 0
+        self.cached = 0
+        self.output = 0
+        self.prompt_estimate = 0
+
+    def record(self, usage: Dict[str, int], prompt_estimate: int):
+        self.requests += 1
+        self.input += usage["input"]
+        self.cached += usage["cached"]
+        self.output += usage["output"]
+        self.prompt_estimate += prompt_estimate
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "input_tokens": self.input,
+            "cached_tokens": self.cached,
+            "output_tokens": self.output,
+            "cache_hit_rate": round(self.cached / self.input, 4) if self.input else 0.0,
+            "avg_input_tokens": round(self.input / self.requests, 1) if self.requests else 0.0,
+            "avg_prompt_estimate": round(self.prompt_estimate / self.requests, 1) if self.requests else 0.0,
+        }
+
+
+def system_prompt_tokens(cfg: Dict[str, Any], language: Optional[str] = None) -> int:
+    return count_tokens(assemble_system_prompt(cfg, language))
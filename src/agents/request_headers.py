@@ -0,0 +1,55 @@
+"""
+Per-Request LLM Headers
+编译好的 Agent 与 ChatOpenAI 在请求间共享，随请求变化的调用头（日志 ID、环境路由等）
+在每次模型调用时注入，不再为每个请求重建 LLM 客户端
+
+请求头来源：
+- 运行时上下文：graph.invoke/stream(..., context=ctx) 传入的 Context，按 default_headers(ctx) 生成
+- llm_request_headers()：调用方在当前协程 / 线程内临时指定的额外请求头
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Mapping, Optional
+
+from langchain.agents.middleware import AgentMiddleware
+from coze_coding_utils.runtime_ctx.context import Context, default_headers
+
+_extra_headers: ContextVar[Optional[Mapping[str, str]]] = ContextVar("llm_request_headers", default=None)
+
+
+@contextmanager
+def llm_request_headers(headers: Mapping[str, str]) -> Iterator[None]:
+    """with llm_request_headers({...}): 块内发起的模型调用携带这些请求头"""
+    token = _extra_headers.set(headers)
+    try:
+        yield
+    finally:
+        _extra_headers.reset(token)
+
+
+def resolve_headers(runtime: Any) -> Dict[str, str]:
+    context = getattr(runtime, "context", None)
+    headers = default_headers(context) if isinstance(context, Context) else {}
+    extra = _extra_headers.get()
+    if extra:
+        headers.update(extra)
+    return headers
+
+
+class RequestHeadersMiddleware(AgentMiddleware):
+    """把当前请求的调用头以 extra_headers 传给本次模型调用（OpenAI SDK 的单次请求参数）"""
+
+    def _with_headers(self, request):
+        headers = resolve_headers(request.runtime)
+        if not headers:
+            return request
+        settings = dict(request.model_settings)
+        settings["extra_headers"] = {**settings.get("extra_headers", {}), **headers}
+        return request.override(model_settings=settings)
+
+    def wrap_model_call(self, request, handler):
+        return handler(self._with_headers(request))
+
+    async def awrap_model_call(self, request, handler):
+        return await handler(self._with_headers(request))
@@ -1,22 +1,31 @@
 """
 Flask API Service for Customer Support Agent
-提供客服智能体的HTTP API接口
+提供客服智能体的HTTP API接口（开发 / 兼容用途）
+
+对话提交到后台事件循环执行，但每个聊天请求在整轮对话期间（含流式输出）占用一个 WSGI 线程，
+并发会话数受线程数限制。生产环境使用 ASGI 版本：python src/api/server.py（api.asgi:app，接口完全一致）
 """
 
-from flask import Flask, request, jsonify, Response, stream_with_context, send_from_directory
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
-import uuid
-import asyncio
-from typing import Dict, Any
 import logging
 import os
 import sys
-import json
 
 # 添加项目根目录到Python路径
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from agents.agent import build_agent
+from api.chat_service import (
+    AgentUnavailableError,
+    ChatDeadlineError,
+    ChatRequestError,
+    EmptyReplyError,
+    chat_service,
+    parse_chat_request,
+)
+from api.static_assets import LOADER_NAME, StaticAssetStore
+from utils.admission import AdmissionRejected, client_ip
+from utils.loop_runner import get_loop_runner
 
 # 配置日志
 logging.basicConfig(
@@ -25,42 +34,40 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-app = Flask(__name__)
+logger.warning(
+    "The Flask app is meant for development: each chat request blocks a WSGI thread until the turn finishes. "
+    "Run src/api/server.py (ASGI) in production"
+)
+
+app = Flask(__name__, static_folder=None)  # 静态文件由 serve_static 提供（哈希文件名 + 预压缩）
 CORS(app)  # 允许跨域请求
 
-# 全局Agent实例
-agent_instance = None
-agent_config = None
+# 启动时构建静态资源（哈希文件名 + 预压缩），运行期间只读
+static_assets = StaticAssetStore(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static'))
+
+# Agent 调用统一提交到后台事件循环执行（ainvoke/astream），与 ASGI 版本共用同一套逻辑
+loop_runner = get_loop_runner()
 
 
 def initialize_agent():
-    """初始化Agent实例"""
-    global agent_instance, agent_config
-    
+    """初始化Agent实例（在后台事件循环线程内执行，保证连接池绑定到该循环）"""
     try:
-        logger.info("Initializing agent...")
-        agent_instance = build_agent()
-        
-        # 读取配置
-        config_path = os.path.join(os.getenv('COZE_WORKSPACE_PATH', '/workspace/projects'), 
-                                   'config/agent_llm_config.json')
-        with open(config_path, 'r', encoding='utf-8') as f:
-            agent_config = json.load(f)
-        
-        logger.info("Agent initialized successfully")
+        loop_runner.run(chat_service.ensure_agent())
         return True
-    except Exception as e:
-        logger.error(f"Failed to initialize agent: {e}")
+    except AgentUnavailableError:
         return False
 
 
+def _rejected_response(e: AdmissionRejected):
+    """准入拒绝：429 + Retry-After"""
+    return jsonify({'error': str(e), 'retry_after': e.retry_after}), 429, {'Retry-After': str(e.retry_after)}
+
+
 @app.route('/health', methods=['GET'])
 def health_check():
-    """健康检查接口"""
-    return jsonify({
-        'status': 'healthy',
-        'agent_loaded': agent_instance is not None
-    })
+    """健康检查接口，启动预热完成前返回 503"""
+    payload, status_code = chat_service.health_status()
+    return jsonify(payload), status_code
 
 
 @app.route('/api/chat', methods=['POST'])
@@ -86,36 +93,27 @@ def chat():
     }
     """
     try:
-        data = request.json
-        message = data.get('message', '').strip()
-        session_id = data.get('session_id', str(uuid.uuid4()))
-        customer_info = data.get('customer_info', {})
-        
-        if not message:
-            return jsonify({'error': 'Message is required'}), 400
-        
-        if not agent_instance:
-            if not initialize_agent():
-                return jsonify({'error': 'Agent initialization failed'}), 500
-        
-        # 同步调用Agent
-        logger.info(f"Received message: {message[:50]}... (session: {session_id})")
-        
-        result = agent_instance.invoke(
-            {"messages": [("user", message)]},
-            config={"configurable": {"thread_id": session_id}}
-        )
-        
-        # 提取AI回复
-        response = result["messages"][-1].content
-        
-        logger.info(f"Response: {response[:50]}... (session: {session_id})")
-        
+        message, session_id, customer_info = parse_chat_request(request.json)
+        loop_runner.run(chat_service.admit(client_ip(request.headers, request.remote_addr), session_id))
+
+        if not initialize_agent():
+            return jsonify({'error': 'Agent initialization failed'}), 500
+
+        response = loop_runner.run(chat_service.chat(message, session_id))
+
         return jsonify({
             'response': response,
             'session_id': session_id
         })
-        
+
+    except ChatRequestError as e:
+        return jsonify({'error': str(e)}), 400
+    except ChatDeadlineError as e:
+        return jsonify({'error': str(e)}), 504
+    except EmptyReplyError as e:
+        return jsonify({'error': str(e)}), 502
+    except AdmissionRejected as e:
+        return _rejected_response(e)
     except Exception as e:
         logger.error(f"Error in chat: {e}", exc_info=True)
         return jsonify({'error': str(e)}), 500
@@ -141,49 +139,18 @@ def chat_stream():
     返回：SSE流式响应
     """
     try:
-        data = request.json
-        message = data.get('message', '').strip()
-        session_id = data.get('session_id', str(uuid.uuid4()))
-        customer_info = data.get('customer_info', {})
-        
-        if not message:
-            return jsonify({'error': 'Message is required'}), 400
-        
-        if not agent_instance:
-            if not initialize_agent():
-                return jsonify({'error': 'Agent initialization failed'}), 500
-        
-        logger.info(f"Received stream message: {message[:50]}... (session: {session_id})")
-        
-        def generate():
-            try:
-                # 流式调用Agent
-                full_response = ""
-                
-                for chunk in agent_instance.stream(
-                    {"messages": [("user", message)]},
-                    config={"configurable": {"thread_id": session_id}},
-                    stream_mode="messages"
-                ):
-                    # 提取消息内容
-                    if hasattr(chunk, 'content'):
-                        content = chunk.content
-                        if content:
-                            full_response += content
-                            # 发送SSE事件
-                            yield f"data: {json.dumps({'content': content, 'done': False})}\n\n"
-                
-                logger.info(f"Stream response completed (session: {session_id})")
-                
-                # 发送完成事件
-                yield f"data: {json.dumps({'content': '', 'done': True, 'session_id': session_id})}\n\n"
-                
-            except Exception as e:
-                logger.error(f"Error in stream: {e}", exc_info=True)
-                yield f"data: {json.dumps({'error': str(e), 'done': True})}\n\n"
-        
+        message, session_id, customer_info = parse_chat_request(request.json)
+        loop_runner.run(chat_service.admit(client_ip(request.headers, request.remote_addr), session_id))
+
+        if not initialize_agent():
+            return jsonify({'error': 'Agent initialization failed'}), 500
+
+        # 流式调用Agent：异步生成器在后台事件循环上执行，这里逐帧转发；
+        # 客户端断开时 Werkzeug 关闭迭代器，异步生成器随之关闭并中止模型调用
+        frames = loop_runner.iterate(chat_service.stream_sse(message, session_id))
+
         return Response(
-            stream_with_context(generate()),
+            stream_with_context(frames),
             mimetype='text/event-stream',
             headers={
                 'Cache-Control': 'no-cache',
@@ -191,6 +158,10 @@ def chat_stream():
             }
         )
         
+    except ChatRequestError as e:
+        return jsonify({'error': str(e)}), 400
+    except AdmissionRejected as e:
+        return _rejected_response(e)
     except Exception as e:
         logger.error(f"Error in chat_stream: {e}", exc_info=True)
         return jsonify({'error': str(e)}), 500
@@ -199,12 +170,14 @@ def chat_stream():
 @app.route('/api/config', methods=['GET'])
 def get_config():
     """获取Agent配置信息（不含敏感信息）"""
+    agent_config = chat_service.agent_config
     if not agent_config:
         return jsonify({'error': 'Agent not initialized'}), 500
     
     # 只返回非敏感配置
     return jsonify({
         'model': agent_config['config'].get('model'),
+        'config_hash': chat_service.version.config_hash,
         'company_info': {
             'website': 'www.paperbagglue.com',
             'whatsapp': '+8613323273311',
@@ -213,6 +186,12 @@ def get_config():
     })
 
 
+@app.route('/api/stats', methods=['GET'])
+def get_stats():
+    """运行时统计：准入队列深度、排队耗时、限流与缓存命中等"""
+    return jsonify(chat_service.stats())
+
+
 @app.route('/')
 def index():
     """
@@ -225,7 +204,9 @@ def index():
             'health': '/health',
             'chat': '/api/chat',
             'chat_stream': '/api/chat/stream',
-            'config': '/api/config'
+            'config': '/api/config',
+            'stats': '/api/stats',
+            'widget_loader': f'/static/{LOADER_NAME}'
         }
     })
 
@@ -234,20 +215,30 @@ def index():
 def serve_static(filename):
     """
     提供静态文件服务
-    用于提供聊天组件的JavaScript文件
+    用于提供聊天组件的JavaScript文件：哈希文件名长期缓存，loader.js / 原始文件名按 ETag 协商
     """
-    try:
-        static_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
-        return send_from_directory(static_dir, filename, cache_timeout=0)
-    except Exception as e:
-        logger.error(f"Error serving static file {filename}: {e}")
+    result = static_assets.respond(
+        filename,
+        request.headers.get('Accept-Encoding'),
+        request.headers.get('If-None-Match')
+    )
+    if result is None:
+        logger.error(f"Error serving static file {filename}: not found")
         return jsonify({'error': 'File not found'}), 404
+    status_code, body, headers = result
+    return Response(body, status=status_code, headers=headers)
+
+
+def start_warm_up():
+    """在后台事件循环上启动预热，不阻塞服务启动"""
+    return loop_runner.submit(chat_service.warm_up())
 
 
 if __name__ == '__main__':
-    # 初始化Agent
-    initialize_agent()
+    # 预热Agent（后台执行，完成前 /health 返回未就绪）
+    start_warm_up()
     
-    # 启动Flask服务
+    # 启动Flask开发服务（生产环境请使用 src/api/server.py）
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port, debug=True, threaded=True)
+    debug = os.environ.get('FLASK_DEBUG', '').lower() in ('1', 'true')
+    app.run(host='0.0.0.0', port=port, debug=debug, threaded=True)
@@ -0,0 +1,236 @@
+"""
+ASGI API Service for Customer Support Agent
+客服智能体的异步HTTP API接口，与 Flask 版本 (app.py) 的请求/响应格式完全一致
+
+所有对话在同一个事件循环上通过 ainvoke/astream 执行，
+等待模型响应的会话不占用线程，单进程即可承载数百个并发会话
+"""
+
+import asyncio
+import logging
+import os
+import sys
+from contextlib import asynccontextmanager
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.chat_service import (
+    AgentUnavailableError,
+    ChatDeadlineError,
+    ChatRequestError,
+    EmptyReplyError,
+    chat_service,
+    parse_chat_request,
+)
+from api.static_assets import LOADER_NAME, StaticAssetStore
+from storage.memory.memory_saver import get_memory_manager
+from storage.memory.retention import CHECKPOINT_RETENTION_INTERVAL, retention_loop
+from utils.admission import AdmissionRejected, client_ip
+
+# 配置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+STATIC_DIR = os.path.realpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static'))
+# 启动时构建静态资源（哈希文件名 + 预压缩），运行期间只读
+static_assets = StaticAssetStore(STATIC_DIR)
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    """启动时在后台预热 Agent，完成前 /health 返回未就绪；按需定期执行保留策略；退出时关闭会话锁连接与连接池"""
+    warm_up_task = asyncio.create_task(chat_service.warm_up())
+    retention_task = asyncio.create_task(retention_loop()) if CHECKPOINT_RETENTION_INTERVAL > 0 else None
+    yield
+    if not warm_up_task.done():
+        warm_up_task.cancel()
+    if retention_task is not None:
+        retention_task.cancel()
+    await chat_service.session_lock.close()
+    await get_memory_manager().close_pool()
+
+
+app = FastAPI(title='Paperbagglue Chat API', lifespan=lifespan)
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=['*'],
+    allow_methods=['*'],
+    allow_headers=['*'],
+)  # 允许跨域请求
+
+
+async def _read_json(request: Request):
+    """读取请求体 JSON，格式错误时按空请求处理（与 Flask request.json 行为一致）"""
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+def _request_ip(request: Request):
+    return client_ip(request.headers, request.client.host if request.client else None)
+
+
+def _rejected_response(e: AdmissionRejected) -> JSONResponse:
+    """准入拒绝：429 + Retry-After"""
+    return JSONResponse(
+        {'error': str(e), 'retry_after': e.retry_after},
+        status_code=429,
+        headers={'Retry-After': str(e.retry_after)}
+    )
+
+
+async def _until_disconnected(request: Request):
+    """请求体读取完毕后继续监听，客户端断开时返回"""
+    while True:
+        message = await request.receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+
+async def _run_until_disconnected(request: Request, coro):
+    """执行协程，客户端提前断开时取消它（进而中止模型调用）并抛出 CancelledError"""
+    task = asyncio.create_task(coro)
+    watcher = asyncio.create_task(_until_disconnected(request))
+    try:
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+        if not task.done():
+            task.cancel()
+    return task.result()
+
+
+@app.get('/health')
+async def health_check():
+    """健康检查接口，启动预热完成前返回 503"""
+    payload, status_code = chat_service.health_status()
+    return JSONResponse(payload, status_code=status_code)
+
+
+@app.post('/api/chat')
+async def chat(request: Request):
+    """聊天接口（非流式），请求/响应格式见 app.py"""
+    try:
+        message, session_id, _customer_info = parse_chat_request(await _read_json(request))
+        await chat_service.admit(_request_ip(request), session_id)
+        response = await _run_until_disconnected(request, chat_service.chat(message, session_id))
+        return {
+            'response': response,
+            'session_id': session_id
+        }
+    except asyncio.CancelledError:
+        logger.info("Client disconnected before chat response was ready")
+        raise
+    except ChatRequestError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+    except AgentUnavailableError as e:
+        return JSONResponse({'error': str(e)}, status_code=500)
+    except ChatDeadlineError as e:
+        return JSONResponse({'error': str(e)}, status_code=504)
+    except EmptyReplyError as e:
+        return JSONResponse({'error': str(e)}, status_code=502)
+    except AdmissionRejected as e:
+        return _rejected_response(e)
+    except Exception as e:
+        logger.error(f"Error in chat: {e}", exc_info=True)
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+@app.post('/api/chat/stream')
+async def chat_stream(request: Request):
+    """聊天接口（SSE 流式响应），请求/响应格式见 app.py"""
+    try:
+        message, session_id, _customer_info = parse_chat_request(await _read_json(request))
+        await chat_service.admit(_request_ip(request), session_id)
+        await chat_service.ensure_agent()
+    except ChatRequestError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+    except AdmissionRejected as e:
+        return _rejected_response(e)
+    except AgentUnavailableError as e:
+        return JSONResponse({'error': str(e)}, status_code=500)
+    except Exception as e:
+        logger.error(f"Error in chat_stream: {e}", exc_info=True)
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+    return StreamingResponse(
+        chat_service.stream_sse(message, session_id),
+        media_type='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # 禁用Nginx缓冲
+        }
+    )
+
+
+@app.get('/api/config')
+async def get_config():
+    """获取Agent配置信息（不含敏感信息）"""
+    agent_config = chat_service.agent_config
+    if not agent_config:
+        return JSONResponse({'error': 'Agent not initialized'}, status_code=500)
+
+    # 只返回非敏感配置
+    return {
+        'model': agent_config['config'].get('model'),
+        'config_hash': chat_service.version.config_hash,
+        'company_info': {
+            'website': 'www.paperbagglue.com',
+            'whatsapp': '+8613323273311',
+            'email': 'LarryChen@paperbagglue.com'
+        }
+    }
+
+
+@app.get('/api/stats')
+async def get_stats():
+    """运行时统计：准入队列深度、排队耗时、限流与缓存命中等"""
+    return chat_service.stats()
+
+
+@app.get('/')
+async def index():
+    """首页 - 返回简单的欢迎信息"""
+    return {
+        'message': 'Paperbagglue Chat API',
+        'version': '1.0.0',
+        'endpoints': {
+            'health': '/health',
+            'chat': '/api/chat',
+            'chat_stream': '/api/chat/stream',
+            'config': '/api/config',
+            'stats': '/api/stats',
+            'widget_loader': f'/static/{LOADER_NAME}'
+        }
+    }
+
+
+@app.get('/static/{filename:path}')
+async def serve_static(filename: str, request: Request):
+    """提供静态文件服务：哈希文件名长期缓存，loader.js / 原始文件名按 ETag 协商"""
+    result = static_assets.respond(
+        filename,
+        request.headers.get('accept-encoding'),
+        request.headers.get('if-none-match')
+    )
+    if result is None:
+        logger.error(f"Error serving static file {filename}: not found")
+        return JSONResponse({'error': 'File not found'}, status_code=404)
+    status_code, body, headers = result
+    return Response(content=body, status_code=status_code, headers=headers)
+
+
+if __name__ == '__main__':
+    # 单进程启动（生产环境多进程模式见 src/api/server.py）
+    port = int(os.environ.get('PORT', 5000))
+    uvicorn.run(app, host='0.0.0.0', port=port)
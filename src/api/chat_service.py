@@ -0,0 +1,465 @@
+"""
+Chat Service Core
+客服对话的异步核心逻辑，Flask 与 ASGI 两种服务形态共用
+"""
+
+import asyncio
+import contextlib
+import logging
+import os
+import time
+import uuid
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+from agents.config_manager import AgentVersion, get_config_manager
+from agents.hedging import get_hedge_stats, unwrap_model
+from agents.history import HistoryCompactor
+from agents.language_prompt import get_session_languages
+from agents.model_router import get_routing_stats
+from agents.prompting import TokenUsage, message_usage
+from api.response_cache import (
+    RESPONSE_CACHE_ENABLED,
+    RESPONSE_CACHE_REPLAY_DELAY_MS,
+    ResponseCache,
+    split_for_replay,
+)
+from api.session_lock import SessionLock
+from api.session_scheduler import SessionScheduler, Turn
+from api.sse import SSEStreamWriter
+from storage.memory.memory_saver import get_memory_manager
+from tools.product_catalog import get_catalog_store
+from utils.token_counter import count_message_tokens, load_tokenizer
+from utils.admission import (
+    RATE_LIMIT_IP_BURST,
+    RATE_LIMIT_IP_RATE,
+    RATE_LIMIT_SESSION_BURST,
+    RATE_LIMIT_SESSION_RATE,
+    AdmissionController,
+    AdmissionRejected,
+    RateLimiter,
+)
+
+logger = logging.getLogger(__name__)
+
+# 预热时探测模型服务的超时时间（秒），只用于建立 TLS 连接，失败不影响就绪
+LLM_PRIME_TIMEOUT = float(os.getenv("LLM_PRIME_TIMEOUT", "10"))
+# 单轮对话的墙钟截止时间（秒），需小于 agent_llm_config.json 中的模型 timeout
+CHAT_REQUEST_DEADLINE = float(os.getenv("CHAT_REQUEST_DEADLINE", "60"))
+
+
+class ChatRequestError(ValueError):
+    """请求参数不合法（对应 HTTP 400）"""
+
+
+class AgentUnavailableError(RuntimeError):
+    """Agent 初始化失败（对应 HTTP 500）"""
+
+
+class ChatDeadlineError(TimeoutError):
+    """单轮对话超过截止时间（对应 HTTP 504）"""
+
+
+class EmptyReplyError(RuntimeError):
+    """Agent 没有产生回复（对应 HTTP 502）"""
+
+
+def parse_chat_request(data: Optional[Dict[str, Any]]) -> Tuple[str, str, Dict[str, Any]]:
+    """
+    解析聊天请求体
+
+    返回 (message, session_id, customer_info)，message 为空时抛出 ChatRequestError
+    """
+    data = data or {}
+    message = (data.get('message') or '').strip()
+    session_id = data.get('session_id') or str(uuid.uuid4())
+    customer_info = data.get('customer_info', {})
+
+    if not message:
+        raise ChatRequestError('Message is required')
+    return message, session_id, customer_info
+
+
+class ChatService:
+    """
+    客服对话服务
+
+    所有 Agent 调用都通过 astream 在同一个事件循环上执行，等待模型响应的会话不占用线程；
+    同一会话的请求经 SessionScheduler 串行化，运行期间到达的消息合并进下一轮，
+    每轮持有 SessionLock，多个 worker 进程之间同一会话同一时刻也只有一轮在运行
+    """
+
+    def __init__(self):
+        self.config_manager = get_config_manager()
+        self.token_usage = TokenUsage()
+        self.ready = False
+        self._init_lock: Optional[asyncio.Lock] = None
+        self.scheduler = SessionScheduler(self._run_turn, after_turn=self._after_turn)
+        self.session_lock = SessionLock()
+        # 会话 -> 正在后台执行的历史折叠任务
+        self._compactions: Dict[str, asyncio.Task] = {}
+        self.history = HistoryCompactor(lambda: self.config_manager.current().llm)
+        self.response_cache = ResponseCache() if RESPONSE_CACHE_ENABLED else None
+        self.admission = AdmissionController()
+        self.ip_limiter = RateLimiter("ip", RATE_LIMIT_IP_RATE, RATE_LIMIT_IP_BURST)
+        self.session_limiter = RateLimiter("session", RATE_LIMIT_SESSION_RATE, RATE_LIMIT_SESSION_BURST)
+
+    @property
+    def version(self) -> Optional[AgentVersion]:
+        """当前生效的配置版本（配置文件变化时由 ConfigManager 原子替换）"""
+        return self.config_manager.active
+
+    @property
+    def agent(self):
+        version = self.version
+        return version.agent if version else None
+
+    @property
+    def agent_config(self) -> Optional[Dict[str, Any]]:
+        version = self.version
+        return version.config if version else None
+
+    async def initialize(self) -> bool:
+        """
+        初始化Agent实例
+
+        需在事件循环线程内调用：AsyncPostgresSaver 的连接池要绑定到当前运行的循环；
+        建表与编译 Agent 在线程池中执行，不阻塞该循环
+        """
+        try:
+            logger.info("Initializing agent...")
+            version = await self.config_manager.acurrent()
+            logger.info(f"System prompt: ~{version.system_prompt_tokens} tokens (config: {version.config_hash})")
+
+            logger.info("Agent initialized successfully")
+            return True
+        except Exception as e:
+            logger.error(f"Failed to initialize agent: {e}")
+            return False
+
+    async def ensure_agent(self) -> AgentVersion:
+        """确保 Agent 已初始化（并发请求只会触发一次初始化），返回当前配置版本"""
+        version = self.version
+        if version is not None:
+            return version
+        if self._init_lock is None:
+            self._init_lock = asyncio.Lock()
+        async with self._init_lock:
+            if self.version is None and not await self.initialize():
+                raise AgentUnavailableError('Agent initialization failed')
+        return self.version
+
+    async def warm_up(self) -> bool:
+        """
+        启动预热：构建 Agent、打开 checkpointer 连接池、建立到模型服务的 HTTP 连接
+
+        预热完成前 /health 返回未就绪，负载均衡只会把流量路由到已预热的实例
+        """
+        started = time.monotonic()
+        memory_manager = get_memory_manager()
+        try:
+            # 数据库连接与建表可能阻塞数十秒，放到线程池执行，期间 /health 仍可响应
+            await asyncio.to_thread(memory_manager.prepare)
+            # 分词器首次加载可能需要下载编码文件，同样放到线程池
+            await asyncio.to_thread(load_tokenizer)
+            await self.ensure_agent()
+        except Exception as e:
+            logger.error(f"Agent warm-up failed: {e}", exc_info=True)
+            return False
+
+        # 连接池与模型服务预热失败时退化为冷启动（首个请求时再建立连接），不影响就绪
+        try:
+            await memory_manager.open_pool()
+        except Exception as e:
+            logger.warning(f"Checkpointer pool warm-up failed, connecting on first use: {e}")
+        try:
+            await self._prime_llm_connection()
+        except Exception as e:
+            logger.warning(f"LLM connection warm-up failed, connecting on first use: {e}")
+
+        self.ready = True
+        logger.info(f"Agent warm-up completed in {time.monotonic() - started:.2f}s")
+        return True
+
+    async def _prime_llm_connection(self):
+        """向模型服务发起一次轻量请求，提前完成 DNS/TLS 握手（与 Agent 共享 HTTP 连接池）"""
+        try:
+            client = unwrap_model(self.version.llm).root_async_client.with_options(timeout=LLM_PRIME_TIMEOUT, max_retries=0)
+            await client.models.list()
+        except Exception as e:
+            # 模型服务不一定实现 /models，只要连接已建立即可
+            logger.info(f"LLM connection primed ({type(e).__name__})")
+        else:
+            logger.info("LLM connection primed")
+
+    def health_status(self) -> Tuple[Dict[str, Any], int]:
+        """健康检查结果，预热完成前返回 503"""
+        if self.ready:
+            return {'status': 'healthy', 'ready': True, 'agent_loaded': True, 'config_hash': self.version.config_hash}, 200
+        return {'status': 'not ready', 'ready': False, 'agent_loaded': self.agent is not None}, 503
+
+    async def admit(self, client_ip: Optional[str], session_id: str):
+        """请求准入：按 IP / 会话限流，执行槽位与等待队列均已满时直接拒绝（AdmissionRejected）"""
+        self.ip_limiter.check(client_ip)
+        self.session_limiter.check(session_id)
+        self.admission.check_capacity()
+
+    def stats(self) -> Dict[str, Any]:
+        """运行时统计（/api/stats）"""
+        return {
+            'admission': self.admission.stats(),
+            'rate_limit': {
+                'ip': self.ip_limiter.stats(),
+                'session': self.session_limiter.stats(),
+            },
+            'active_sessions': self.scheduler.active_sessions,
+            'session_lock': self.session_lock.stats(),
+            'response_cache': self.response_cache.stats() if self.response_cache else None,
+            'token_usage': self.token_usage.stats(),
+            'history': self.history.stats(),
+            'routing': get_routing_stats().stats(),
+            'llm_latency': get_hedge_stats().stats(),
+            'prompt_language': get_session_languages().stats(),
+            'product_catalog': get_catalog_store().stats(),
+            'checkpointer': get_memory_manager().stats(),
+            'agent_config': self.config_manager.stats(),
+        }
+
+    @staticmethod
+    def _run_config(session_id: str) -> Dict[str, Any]:
+        return {"configurable": {"thread_id": session_id}}
+
+    async def _run_turn(self, turn: Turn) -> Optional[str]:
+        """
+        持有会话锁执行一轮对话，超过 CHAT_REQUEST_DEADLINE 或被取消（等待者全部断开）时
+        中止模型调用，并在 checkpoint 中记录取消标记
+
+        其他 worker 正在处理同一会话时等待其完成，等待时间计入截止时间
+        """
+        # 本轮固定使用开始时的配置版本，期间发生热更新不影响本轮
+        version = await self.ensure_agent()
+        agent = version.agent
+        held = False
+        async with contextlib.AsyncExitStack() as stack:
+            try:
+                async with asyncio.timeout(CHAT_REQUEST_DEADLINE):
+                    lease = await stack.enter_async_context(self.session_lock.hold(turn.session_id))
+                    held = True
+                    reply = await self._execute_turn(version, turn)
+                    # 锁所在的连接在本轮期间断开时，其他 worker 可能已并发运行同一会话，本轮按失败返回
+                    await lease.verify()
+                    return reply
+            except asyncio.CancelledError:
+                await self._abort_turn(agent, turn, "client_disconnected", held)
+                raise
+            except TimeoutError:
+                await self._abort_turn(agent, turn, "deadline_exceeded", held)
+                raise ChatDeadlineError("Request deadline exceeded")
+
+    async def _abort_turn(self, agent, turn: Turn, reason: str, held: bool):
+        """中止的一轮：持有会话锁时记录取消标记（还在等锁时不写入，避免与其他 worker 的运行并发写）"""
+        if not held:
+            logger.info(f"Turn aborted ({reason}) while waiting for the session lock (session: {turn.session_id})")
+            return
+        await self._record_cancelled(agent, turn, reason)
+        await get_memory_manager().flush(turn.session_id)
+
+    async def _after_turn(self, turn: Turn):
+        """
+        一轮结束后（回复已返回）把本轮缓冲的 checkpoint 写入数据库（写回模式），
+        历史折叠在后台任务中执行，不占用会话的执行槽位，后续消息无需等待摘要生成
+        """
+        await get_memory_manager().flush(turn.session_id)
+        session_id = turn.session_id
+        if session_id in self._compactions:
+            return
+        task = asyncio.create_task(self._compact_history(session_id))
+        self._compactions[session_id] = task
+        task.add_done_callback(lambda _task: self._compactions.pop(session_id, None))
+
+    async def _compact_history(self, session_id: str):
+        """检查历史 token 预算，超出时折叠为摘要；会话已有新的轮次时推迟到下一轮结束后"""
+        try:
+            compacted = await self.history.compact(
+                self.agent,
+                self._run_config(session_id),
+                guard=lambda: self.session_lock.hold(session_id, timeout=0),
+            )
+            if compacted:
+                await get_memory_manager().flush(session_id)
+        except Exception as e:
+            logger.warning(f"History compaction failed (session: {session_id}): {e}", exc_info=True)
+
+    async def _record_cancelled(self, agent, turn: Turn, reason: str):
+        """
+        中止的一轮写入 checkpoint：本轮用户消息（按 ID 去重）+ 已输出的部分回复，
+        回复带 finish_reason=cancelled 标记，下一轮对话从一致的状态继续
+        """
+        if turn.committed:
+            return
+        logger.info(f"Turn cancelled ({reason}) after {len(turn.chunks)} chunks (session: {turn.session_id})")
+        try:
+            await agent.aupdate_state(
+                self._run_config(turn.session_id),
+                {"messages": [
+                    *turn.messages,
+                    AIMessage(
+                        content="".join(turn.chunks),
+                        response_metadata={"finish_reason": "cancelled", "cancel_reason": reason}
+                    ),
+                ]},
+                as_node="model"
+            )
+            turn.committed = True
+        except Exception as e:
+            logger.warning(f"Failed to record cancelled turn (session: {turn.session_id}): {e}")
+
+    async def _execute_turn(self, version: AgentVersion, turn: Turn) -> Optional[str]:
+        """会话首轮的短消息优先走回复缓存，其余直接调用 Agent"""
+        if self.response_cache is None or len(turn.messages) != 1:
+            return await self._run_agent(version, turn)
+
+        key = self.response_cache.key(turn.messages[0].content, version.config_hash)
+        if key is None or await self._has_history(version.agent, turn.session_id):
+            return await self._run_agent(version, turn)
+
+        reply, computed = await self.response_cache.get_or_compute(key, lambda: self._run_agent(version, turn))
+        if not computed:
+            logger.info(f"Response cache hit: {key[0][:50]} (session: {turn.session_id})")
+            await self._apply_cached_reply(version.agent, turn, reply)
+        return reply
+
+    async def _run_agent(self, version: AgentVersion, turn: Turn) -> Optional[str]:
+        """调用 Agent（占用一个准入槽位）：逐段广播模型输出，返回最终 AI 消息内容"""
+        final_state = None
+
+        async with self.admission.slot():
+            # "messages" 模式产出 (message_chunk, metadata)，"values" 模式产出每步后的完整状态
+            async for mode, payload in version.agent.astream(
+                {"messages": turn.messages},
+                config=self._run_config(turn.session_id),
+                stream_mode=["messages", "values"]
+            ):
+                if mode == "messages":
+                    chunk, _metadata = payload
+                    if isinstance(chunk, AIMessageChunk) and chunk.content:
+                        turn.publish(chunk.content)
+                else:
+                    final_state = payload
+
+        turn.committed = True
+        if final_state and final_state.get("messages"):
+            self._record_usage(version, turn, final_state["messages"])
+            return final_state["messages"][-1].content
+        return None
+
+    def _record_usage(self, version: AgentVersion, turn: Turn, messages: list):
+        """
+        统计本轮的 token 用量：接口返回的 input/cached/output tokens，
+        以及本地估算的提示词大小（系统提示词 + 历史消息）
+        """
+        turn_ids = {m.id for m in turn.messages}
+        start = next((i for i in range(len(messages) - 1, -1, -1) if messages[i].id in turn_ids), None)
+        if start is None:
+            return
+        language = get_session_languages().get(turn.session_id)
+        system_tokens = version.prompt_tokens(language)
+        prompt_estimate = system_tokens + count_message_tokens(messages[:start + 1])
+        usage = message_usage(messages[start + 1:])
+        self.token_usage.record(usage, prompt_estimate)
+        logger.info(
+            f"Token usage (session: {turn.session_id}): input={usage['input']}, cached={usage['cached']}, "
+            f"output={usage['output']}, model_calls={usage['calls']}, "
+            f"prompt_estimate={prompt_estimate} (system={system_tokens}, language={language}, history={len(messages[:start + 1])} msgs)"
+        )
+
+    async def _has_history(self, agent, session_id: str) -> bool:
+        """会话是否已有 checkpoint（有历史的对话回复依赖上下文，不能走缓存）"""
+        state = await agent.aget_state(self._run_config(session_id))
+        return bool(state.values.get("messages"))
+
+    async def _apply_cached_reply(self, agent, turn: Turn, reply: str):
+        """把缓存回复写入会话 checkpoint（后续对话照常延续），并按正常流式节奏回放"""
+        await agent.aupdate_state(
+            self._run_config(turn.session_id),
+            {"messages": [*turn.messages, AIMessage(content=reply)]},
+            as_node="model"
+        )
+        turn.committed = True
+        delay = RESPONSE_CACHE_REPLAY_DELAY_MS / 1000
+        for piece in split_for_replay(reply):
+            turn.publish(piece)
+            if delay:
+                await asyncio.sleep(delay)
+
+    async def chat(self, message: str, session_id: str) -> str:
+        """非流式对话，返回完整回复"""
+        await self.ensure_agent()
+        logger.info(f"Received message: {message[:50]}... (session: {session_id})")
+
+        turn = self.scheduler.submit(session_id, message)
+        try:
+            response = await turn.result()
+        finally:
+            # 请求被取消（客户端断开）时，若已无其他等待者则中止本轮
+            self.scheduler.release(turn)
+
+        if not response:
+            # 模型没有输出最终 AI 消息（如只产生了工具调用），不返回空回复
+            logger.warning(f"Agent returned no reply (session: {session_id})")
+            raise EmptyReplyError('Agent returned no reply')
+        logger.info(f"Response: {response[:50]}... (session: {session_id})")
+        return response
+
+    async def stream_sse(self, message: str, session_id: str) -> AsyncIterator[bytes]:
+        """
+        流式对话的 SSE 帧序列，与 /api/chat/stream 的响应格式一致
+
+        模型片段按 SSEStreamWriter 的时间窗口 / 字节阈值合并成帧，减少慢速链路上的小帧开销；
+        客户端断开时生成器被关闭，若本轮已无其他等待者则中止模型调用
+        """
+        writer = SSEStreamWriter(session_id)
+        turn = None
+        try:
+            await self.ensure_agent()
+            logger.info(f"Received stream message: {message[:50]}... (session: {session_id})")
+
+            turn = self.scheduler.submit(session_id, message)
+            index = 0
+            while True:
+                for content in turn.chunks[index:]:
+                    writer.write(content)
+                index = len(turn.chunks)
+                if turn.done:
+                    break
+                frame = writer.poll()
+                if frame:
+                    yield frame
+                await turn.wait(index, writer.time_until_due())
+
+            frame = writer.flush()
+            if frame:
+                yield frame
+            turn.raise_if_failed()
+            logger.info(f"Stream response completed (session: {session_id})")
+
+            # 发送完成事件
+            yield writer.done_frame()
+
+        except ChatDeadlineError as e:
+            logger.warning(f"Stream deadline exceeded (session: {session_id})")
+            yield writer.error_frame(e)
+        except AdmissionRejected as e:
+            logger.warning(f"Stream rejected by admission control: {e.reason} (session: {session_id})")
+            yield writer.error_frame(e, retry_after=e.retry_after)
+        except Exception as e:
+            logger.error(f"Error in stream: {e}", exc_info=True)
+            yield writer.error_frame(e)
+        finally:
+            if turn is not None:
+                self.scheduler.release(turn)
+            writer.log_stats()
+
+
+chat_service = ChatService()
@@ -0,0 +1,113 @@
+"""
+Response Cache
+首轮短消息（问候、常见问题）的回复缓存：按归一化消息 + 配置哈希索引，TTL/LRU 淘汰，
+并发的相同未命中只触发一次 LLM 调用（single-flight）
+"""
+
+import asyncio
+import logging
+import os
+import re
+import unicodedata
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from cachetools import TTLCache
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "1").lower() in ("1", "true")
+# 缓存条目存活时间（秒）与最大条目数（超过后按 LRU 淘汰）
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "512"))
+# 只缓存归一化后不超过该长度的消息，长消息几乎不会重复
+RESPONSE_CACHE_MAX_MESSAGE_CHARS = int(os.getenv("RESPONSE_CACHE_MAX_MESSAGE_CHARS", "64"))
+# 命中缓存时按该间隔（毫秒）逐段回放，与模型正常流式输出的节奏接近
+RESPONSE_CACHE_REPLAY_DELAY_MS = int(os.getenv("RESPONSE_CACHE_REPLAY_DELAY_MS", "20"))
+
+_WHITESPACE = re.compile(r"\s+")
+# 回放分段：每段约等于一个 token（前导空白 + 最多 4 个非空白字符）
+_REPLAY_PIECE = re.compile(r"\s*\S{1,4}|\s+")
+
+
+def normalize_message(message: str) -> str:
+    """归一化消息：全半角统一、大小写折叠、合并空白、去掉首尾标点"""
+    text = unicodedata.normalize("NFKC", message).casefold()
+    text = _WHITESPACE.sub(" ", text).strip()
+    return text.strip(" !?.,;:~。！？，；：、…")
+
+
+def split_for_replay(text: str) -> list:
+    """把缓存的回复切成接近 token 粒度的片段，拼接后与原文完全一致"""
+    return _REPLAY_PIECE.findall(text)
+
+
+class ResponseCache:
+    """首轮回复缓存（单事件循环内使用，无需加锁）"""
+
+    def __init__(
+        self,
+        maxsize: int = RESPONSE_CACHE_MAX_ENTRIES,
+        ttl: float = RESPONSE_CACHE_TTL,
+        max_message_chars: int = RESPONSE_CACHE_MAX_MESSAGE_CHARS,
+    ):
+        self._cache: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+        self._max_message_chars = max_message_chars
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+
+    def key(self, message: str, config_hash: str) -> Optional[Tuple[str, str]]:
+        """生成缓存键，消息不适合缓存时返回 None"""
+        normalized = normalize_message(message)
+        if not normalized or len(normalized) > self._max_message_chars:
+            return None
+        return normalized, config_hash
+
+    async def get_or_compute(self, key: Tuple[str, str], compute: Callable[[], Awaitable[str]]) -> Tuple[str, bool]:
+        """
+        读取缓存，未命中时执行 compute 并写入缓存
+
+        返回 (reply, computed)：computed 为 False 表示回复来自缓存或同键的并发调用
+        """
+        reply = self._cache.get(key)
+        if reply is not None:
+            self.hits += 1
+            return reply, False
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            # 同键请求正在调用 LLM，等待其结果；对方失败或被取消时自行调用
+            await asyncio.wait([inflight])
+            if not inflight.cancelled() and inflight.exception() is None:
+                self.shared += 1
+                return inflight.result(), False
+            return await compute(), True
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            reply = await compute()
+            if reply:
+                self._cache[key] = reply
+            future.set_result(reply)
+            return reply, True
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # 标记异常已读取，没有等待者时不产生 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "shared": self.shared,
+        }
@@ -0,0 +1,19 @@
+"""
+Production Server Entry
+生产环境启动入口：以多个 worker 进程运行 ASGI 版本的客服 API (api.asgi:app)
+
+本模块只做启动参数解析，不导入应用代码：worker 进程（spawn）启动时会重新导入
+主模块，保持主模块轻量可以缩短 worker 就绪时间
+"""
+
+import os
+import sys
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.serving import run_server
+
+if __name__ == '__main__':
+    port = int(os.environ.get('PORT', 5000))
+    run_server('api.asgi:app', port)
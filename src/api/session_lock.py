@@ -0,0 +1,238 @@
+"""
+Cross-Process Session Lock
+同一会话的 checkpoint 读改写（一轮对话、历史折叠）在所有 worker 进程间互斥：
+
+- 进程内：按会话的 asyncio.Lock
+- 进程间：Postgres 会话级 advisory lock（pg_try_advisory_lock(类别键, hashtext(thread_id))）。
+  advisory lock 属于数据库连接，一个连接可同时持有多个会话的锁，因此每个进程只占用一个连接；
+  获取时轮询 pg_try_advisory_lock，不会阻塞共用的连接
+- 连接断开时数据库自动释放它持有的全部锁（不会留下死锁），下次获取时重连；
+  此时正在运行的轮次已失去互斥保证，hold() 返回的 SessionLease.verify() 在提交一轮结果前确认锁仍然有效，
+  连接已断开时抛出 SessionLockLost 使该轮失败
+- 数据库不可用（内存 checkpointer 兜底）时只做进程内互斥
+"""
+
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+
+import psycopg
+
+from storage.memory.memory_saver import get_memory_manager
+
+logger = logging.getLogger(__name__)
+
+# 是否启用跨进程会话锁（关闭后只做进程内互斥）
+SESSION_LOCK_ENABLED = os.getenv("SESSION_LOCK", "1").lower() in ("1", "true")
+# 其他进程持有锁时的轮询间隔（秒）
+SESSION_LOCK_POLL_INTERVAL = float(os.getenv("SESSION_LOCK_POLL_INTERVAL", "0.05"))
+
+# advisory lock 两参数形式的类别键，与其他 advisory lock 使用方区分
+_LOCK_CLASS = 0x5E55
+# 连接失败后多久（秒）再尝试重连，期间只做进程内互斥
+_RECONNECT_INTERVAL = 30.0
+
+
+class SessionLockLost(RuntimeError):
+    """持有期间跨进程锁所在的数据库连接断开，锁已被数据库释放（对应 HTTP 500）"""
+
+
+class _LocalLock:
+    __slots__ = ("lock", "users")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+
+class SessionLease:
+    """一次 hold() 持有的会话锁"""
+
+    __slots__ = ("_owner", "session_id", "conn")
+
+    def __init__(self, owner: "SessionLock", session_id: str, conn: Optional[psycopg.AsyncConnection]):
+        self._owner = owner
+        self.session_id = session_id
+        # 持有 advisory lock 的连接，只做进程内互斥时为 None
+        self.conn = conn
+
+    async def verify(self):
+        """
+        确认跨进程锁仍然有效：持有锁的连接未被关闭或替换，且仍能完成一次往返
+
+        psycopg 的连接断开后不会自动重连，同一连接对象往返成功即说明数据库会话（及其持有的锁）仍在
+        """
+        conn = self.conn
+        if conn is None:
+            return
+        if not conn.closed and conn is self._owner._conn:
+            try:
+                await conn.execute("SELECT 1")
+                return
+            except psycopg.Error as e:
+                self._owner.errors += 1
+                await self._owner._drop_connection(conn)
+                logger.warning(f"Session lock connection lost (session: {self.session_id}): {e}")
+        self._owner.lost += 1
+        raise SessionLockLost(f"session {self.session_id} lost its cross-worker lock (database connection dropped)")
+
+
+class SessionLock:
+    """按会话的跨进程互斥锁，hold(session_id) 期间其他协程 / worker 进程无法持有同一会话的锁"""
+
+    def __init__(self, connect: Optional[Callable[[], Awaitable[Optional[psycopg.AsyncConnection]]]] = None):
+        # connect() 返回 autocommit 的异步连接，数据库不可用时返回 None
+        self._connect = connect or get_memory_manager().aconnect
+        self._conn: Optional[psycopg.AsyncConnection] = None
+        self._conn_lock: Optional[asyncio.Lock] = None
+        self._retry_at = 0.0
+        self._locals: Dict[str, _LocalLock] = {}
+        self.acquired = 0
+        self.contended = 0
+        self.wait_seconds = 0.0
+        self.timeouts = 0
+        self.errors = 0
+        self.lost = 0
+
+    async def _connection(self) -> Optional[psycopg.AsyncConnection]:
+        if self._conn is not None and not self._conn.closed:
+            return self._conn
+        if not SESSION_LOCK_ENABLED or time.monotonic() < self._retry_at:
+            return None
+        if self._conn_lock is None:
+            self._conn_lock = asyncio.Lock()
+        async with self._conn_lock:
+            if self._conn is None or self._conn.closed:
+                self._conn = await self._connect()
+                if self._conn is None:
+                    self._retry_at = time.monotonic() + _RECONNECT_INTERVAL
+        return self._conn
+
+    async def _drop_connection(self, conn: psycopg.AsyncConnection):
+        """关闭连接：数据库随之释放该连接持有的全部会话锁"""
+        if self._conn is conn:
+            self._conn = None
+        try:
+            await conn.close()
+        except Exception:
+            pass
+
+    async def _try_lock(self, conn: psycopg.AsyncConnection, session_id: str) -> bool:
+        cur = await conn.execute("SELECT pg_try_advisory_lock(%s, hashtext(%s))", (_LOCK_CLASS, session_id))
+        return (await cur.fetchone())[0]
+
+    async def _acquire_remote(self, session_id: str, deadline: Optional[float]) -> Optional[psycopg.AsyncConnection]:
+        """获取 advisory lock，返回持有锁的连接；数据库不可用时返回 None（只做进程内互斥）"""
+        waited = False
+        retried = False
+        while True:
+            conn = await self._connection()
+            if conn is None:
+                return None
+            try:
+                if await self._try_lock(conn, session_id):
+                    return conn
+            except psycopg.Error as e:
+                # 连接已断开（如数据库重启、空闲超时），重连后再试一次
+                self.errors += 1
+                await self._drop_connection(conn)
+                if retried:
+                    logger.warning(f"Session lock unavailable, serializing within this process only (session: {session_id}): {e}")
+                    return None
+                retried = True
+                continue
+            if not waited:
+                waited = True
+                self.contended += 1
+                logger.info(f"Session is running in another worker, waiting (session: {session_id})")
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                raise TimeoutError(f"session {session_id} is locked by another worker")
+            await asyncio.sleep(SESSION_LOCK_POLL_INTERVAL if remaining is None else min(SESSION_LOCK_POLL_INTERVAL, remaining))
+
+    async def _release_remote(self, conn: psycopg.AsyncConnection, session_id: str):
+        if conn.closed or conn is not self._conn:
+            # 连接已断开，锁已由数据库释放
+            return
+        try:
+            await conn.execute("SELECT pg_advisory_unlock(%s, hashtext(%s))", (_LOCK_CLASS, session_id))
+        except Exception as e:
+            # 释放失败时关闭连接，避免锁一直留在数据库中
+            self.errors += 1
+            logger.warning(f"Failed to release session lock, reconnecting (session: {session_id}): {e}")
+            await self._drop_connection(conn)
+
+    async def _acquire_local(self, lock: asyncio.Lock, deadline: Optional[float]):
+        if deadline is None:
+            await lock.acquire()
+            return
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            if lock.locked():
+                raise TimeoutError("session is locked in this process")
+            await lock.acquire()
+            return
+        try:
+            await asyncio.wait_for(lock.acquire(), remaining)
+        except asyncio.TimeoutError:
+            raise TimeoutError("session is locked in this process") from None
+
+    @asynccontextmanager
+    async def hold(self, session_id: str, timeout: Optional[float] = None) -> AsyncIterator[SessionLease]:
+        """
+        持有会话锁；timeout 秒内未获取时抛出 TimeoutError（0 表示只尝试一次，None 为一直等待）
+
+        返回的 SessionLease 用于在写入结果前确认锁没有随连接断开而丢失
+        """
+        started = time.monotonic()
+        deadline = None if timeout is None else started + timeout
+        entry = self._locals.get(session_id)
+        if entry is None:
+            entry = self._locals[session_id] = _LocalLock()
+        entry.users += 1
+        try:
+            try:
+                await self._acquire_local(entry.lock, deadline)
+            except TimeoutError:
+                self.timeouts += 1
+                raise
+            try:
+                try:
+                    conn = await self._acquire_remote(session_id, deadline)
+                except TimeoutError:
+                    self.timeouts += 1
+                    raise
+                self.acquired += 1
+                self.wait_seconds += time.monotonic() - started
+                try:
+                    yield SessionLease(self, session_id, conn)
+                finally:
+                    if conn is not None:
+                        # 本轮被取消时也要释放，释放过程不随之取消
+                        await asyncio.shield(self._release_remote(conn, session_id))
+            finally:
+                entry.lock.release()
+        finally:
+            entry.users -= 1
+            if entry.users == 0:
+                self._locals.pop(session_id, None)
+
+    async def close(self):
+        if self._conn is not None:
+            await self._drop_connection(self._conn)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": "postgres" if self._conn is not None and not self._conn.closed else "process",
+            "held": sum(1 for entry in self._locals.values() if entry.lock.locked()),
+            "acquired": self.acquired,
+            "contended": self.contended,
+            "avg_wait_ms": round(self.wait_seconds / self.acquired * 1000, 2) if self.acquired else None,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            # 持有期间连接断开、锁被数据库释放的次数（对应的轮次以 SessionLockLost 失败）
+            "lost": self.lost,
+        }
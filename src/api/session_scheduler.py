@@ -0,0 +1,216 @@
+"""
+Per-Session Scheduler
+按会话 (thread_id) 串行执行 Agent：同一会话同一时刻只有一个运行，
+运行期间到达的新消息合并进下一轮，避免并发写 checkpoint 和重复的 LLM 调用；
+一轮的所有等待者都离开（客户端断开）时取消该轮
+
+调度只在进程内生效，多个 worker 进程之间的互斥由 runner 持有的 SessionLock（api/session_lock.py）保证
+"""
+
+import asyncio
+import logging
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from langchain_core.messages import HumanMessage
+
+logger = logging.getLogger(__name__)
+
+
+class Turn:
+    """
+    一轮对话：包含本轮合并的全部用户消息，输出片段广播给所有等待者
+
+    已产出的片段会保留，迟到的订阅者从头回放，拼接即为完整回复
+    """
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.messages: List[HumanMessage] = []
+        self.chunks: List[str] = []
+        self._changed = asyncio.Event()
+        self._done = asyncio.Event()
+        self._result: Optional[str] = None
+        self._error: Optional[BaseException] = None
+        # 仍在等待本轮结果的请求数
+        self.waiters = 0
+        # 本轮的回复是否已写入 checkpoint
+        self.committed = False
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def add_message(self, message: str):
+        # 显式指定消息 ID：取消后补写 checkpoint 时，已写入的消息按 ID 去重而不会重复
+        self.messages.append(HumanMessage(content=message, id=str(uuid.uuid4())))
+
+    def _notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def publish(self, chunk: str):
+        """广播一段模型输出"""
+        self.chunks.append(chunk)
+        self._notify()
+
+    def finish(self, result: Optional[str]):
+        self._result = result if result is not None else "".join(self.chunks)
+        self._done.set()
+        self._notify()
+
+    def fail(self, error: BaseException):
+        self._error = error
+        self._done.set()
+        self._notify()
+
+    async def result(self) -> str:
+        """等待本轮结束并返回完整回复"""
+        await self._done.wait()
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+    async def wait(self, index: int, timeout: Optional[float] = None):
+        """等待产出第 index 个之后的片段或本轮结束，最多等待 timeout 秒（None 为不限时）"""
+        if index < len(self.chunks) or self.done:
+            return
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def raise_if_failed(self):
+        if self._error is not None:
+            raise self._error
+
+    async def subscribe(self):
+        """按顺序产出本轮的输出片段，本轮失败时抛出对应异常"""
+        index = 0
+        while True:
+            changed = self._changed
+            while index < len(self.chunks):
+                yield self.chunks[index]
+                index += 1
+            if self.done:
+                if self._error is not None:
+                    raise self._error
+                return
+            await changed.wait()
+
+
+class _SessionState:
+    __slots__ = ("pending", "running", "task", "run_task")
+
+    def __init__(self):
+        self.pending: Optional[Turn] = None
+        self.running: Optional[Turn] = None
+        self.task: Optional[asyncio.Task] = None
+        self.run_task: Optional[asyncio.Task] = None
+
+
+class SessionScheduler:
+    """
+    会话级调度器
+
+    runner(turn) 负责执行一轮对话：调用 turn.publish() 推送输出片段，返回最终回复文本。
+    每个 submit() 都必须对应一次 release()，等待者全部离开时未完成的轮次被取消
+
+    after_turn(turn) 在一轮成功结束、结果已返回给等待者之后执行（如写回模式的落库），
+    执行期间该会话的新消息照常排队，下一轮在其完成后开始
+    """
+
+    def __init__(
+        self,
+        runner: Callable[[Turn], Awaitable[Any]],
+        after_turn: Optional[Callable[[Turn], Awaitable[Any]]] = None,
+    ):
+        self._runner = runner
+        self._after_turn = after_turn
+        self._sessions: Dict[str, _SessionState] = {}
+
+    @property
+    def active_sessions(self) -> int:
+        return len(self._sessions)
+
+    def submit(self, session_id: str, message: str) -> Turn:
+        """
+        提交一条用户消息，返回承载它的 Turn（调用方成为该轮的等待者）
+
+        会话空闲时立即开始新一轮；正在运行时合并进下一轮（多条消息按到达顺序进入同一轮）
+        """
+        state = self._sessions.get(session_id)
+        if state is None:
+            state = self._sessions[session_id] = _SessionState()
+
+        if state.pending is None:
+            state.pending = Turn(session_id)
+        turn = state.pending
+        turn.add_message(message)
+        turn.waiters += 1
+
+        if len(turn.messages) > 1:
+            logger.info(f"Coalesced {len(turn.messages)} messages into next turn (session: {session_id})")
+
+        if state.task is None:
+            state.task = asyncio.create_task(self._drive(session_id, state))
+        return turn
+
+    def release(self, turn: Turn):
+        """等待者离开；最后一个等待者离开时取消尚未完成的轮次"""
+        turn.waiters -= 1
+        if turn.waiters > 0 or turn.done:
+            return
+        state = self._sessions.get(turn.session_id)
+        if state is None:
+            return
+        if state.pending is turn:
+            state.pending = None
+            turn.fail(asyncio.CancelledError())
+            logger.info(f"Dropped queued turn, all requesters left (session: {turn.session_id})")
+        elif state.running is turn and state.run_task is not None:
+            state.run_task.cancel()
+            logger.info(f"Cancelling turn, all requesters left (session: {turn.session_id})")
+
+    async def _drive(self, session_id: str, state: _SessionState):
+        """依次执行该会话的待运行轮次，全部完成后释放会话状态"""
+        try:
+            while state.pending is not None:
+                turn, state.pending = state.pending, None
+                state.running = turn
+                run_task = state.run_task = asyncio.create_task(self._runner(turn))
+                try:
+                    # 单独的任务执行本轮，取消本轮不会中断后续轮次
+                    await asyncio.wait([run_task])
+                except asyncio.CancelledError:
+                    run_task.cancel()
+                    turn.fail(asyncio.CancelledError())
+                    raise
+                finally:
+                    state.running = None
+                    state.run_task = None
+
+                if run_task.cancelled():
+                    turn.fail(asyncio.CancelledError())
+                elif run_task.exception() is not None:
+                    turn.fail(run_task.exception())
+                else:
+                    turn.finish(run_task.result())
+                    await self._run_after_turn(turn)
+        finally:
+            state.task = None
+            if state.pending is not None:
+                # 驱动任务被取消（如进程退出），未开始的轮次一并失败
+                state.pending.fail(asyncio.CancelledError())
+                state.pending = None
+            self._sessions.pop(session_id, None)
+
+    async def _run_after_turn(self, turn: Turn):
+        if self._after_turn is None:
+            return
+        try:
+            await self._after_turn(turn)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"after_turn failed (session: {turn.session_id}): {e}", exc_info=True)
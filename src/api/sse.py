@@ -0,0 +1,109 @@
+"""
+SSE Stream Writer
+/api/chat/stream 的帧编码与合并策略：按时间窗口 / 字节阈值把多个 token 合并成一帧，
+帧直接编码为 bytes，回复文本用列表累积
+"""
+
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 合并窗口（毫秒）：首个未发送片段到达后最多等待这么久再发送，0 表示不按时间合并
+SSE_FLUSH_INTERVAL_MS = int(os.getenv("SSE_FLUSH_INTERVAL_MS", "40"))
+# 字节阈值：缓冲的文本达到该字节数立即发送，0 表示不按大小合并
+SSE_FLUSH_BYTES = int(os.getenv("SSE_FLUSH_BYTES", "256"))
+
+_CONTENT_PREFIX = b'data: {"content": '
+_CONTENT_SUFFIX = b', "done": false}\n\n'
+
+
+def sse_frame(payload: Dict[str, Any]) -> bytes:
+    """编码单条 SSE 事件"""
+    return b"data: " + json.dumps(payload, ensure_ascii=False).encode("utf-8") + b"\n\n"
+
+
+class SSEStreamWriter:
+    """
+    单个流式响应的帧合并器
+
+    write() 缓冲模型输出片段，poll() 在达到字节阈值或时间窗口时产出合并后的帧；
+    两个阈值都为 0 时每个片段单独成帧（与合并前的行为一致）
+    """
+
+    def __init__(self, session_id: str, flush_interval_ms: int = SSE_FLUSH_INTERVAL_MS, flush_bytes: int = SSE_FLUSH_BYTES):
+        self.session_id = session_id
+        self._interval = flush_interval_ms / 1000
+        self._flush_bytes = flush_bytes
+        self._pending: List[str] = []
+        self._pending_bytes = 0
+        self._pending_since: Optional[float] = None
+        self._parts: List[str] = []
+        self._started = time.monotonic()
+        self.frames = 0
+        self.bytes = 0
+        self.tokens = 0
+
+    @property
+    def text(self) -> str:
+        """已写入的完整回复"""
+        return "".join(self._parts)
+
+    def write(self, content: str):
+        self._pending.append(content)
+        self._parts.append(content)
+        self._pending_bytes += len(content.encode("utf-8"))
+        self.tokens += 1
+        if self._pending_since is None:
+            self._pending_since = time.monotonic()
+
+    def time_until_due(self) -> Optional[float]:
+        """距离按时间窗口发送还剩多少秒，无缓冲内容或不按时间合并时返回 None（无限等待）"""
+        if self._pending_since is None or self._interval <= 0:
+            return None
+        return max(0.0, self._pending_since + self._interval - time.monotonic())
+
+    def poll(self) -> Optional[bytes]:
+        """缓冲内容达到发送条件时返回合并后的帧"""
+        if not self._pending:
+            return None
+        if self._interval <= 0 and self._flush_bytes <= 0:
+            return self.flush()
+        if self._flush_bytes > 0 and self._pending_bytes >= self._flush_bytes:
+            return self.flush()
+        if self._interval > 0 and time.monotonic() - self._pending_since >= self._interval:
+            return self.flush()
+        return None
+
+    def flush(self) -> Optional[bytes]:
+        """立即发送全部缓冲内容"""
+        if not self._pending:
+            return None
+        content = "".join(self._pending)
+        self._pending.clear()
+        self._pending_bytes = 0
+        self._pending_since = None
+        frame = _CONTENT_PREFIX + json.dumps(content, ensure_ascii=False).encode("utf-8") + _CONTENT_SUFFIX
+        return self._count(frame)
+
+    def done_frame(self) -> bytes:
+        return self._count(sse_frame({'content': '', 'done': True, 'session_id': self.session_id}))
+
+    def error_frame(self, error: BaseException, **extra: Any) -> bytes:
+        return self._count(sse_frame({'error': str(error), 'done': True, **extra}))
+
+    def _count(self, frame: bytes) -> bytes:
+        self.frames += 1
+        self.bytes += len(frame)
+        return frame
+
+    def log_stats(self):
+        """输出本次响应的帧统计，用于调整合并参数"""
+        logger.info(
+            f"SSE stream stats (session: {self.session_id}): frames={self.frames}, bytes={self.bytes}, "
+            f"tokens={self.tokens}, chars={sum(len(p) for p in self._parts)}, "
+            f"duration={time.monotonic() - self._started:.2f}s"
+        )
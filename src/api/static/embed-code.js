@@ -9,7 +9,8 @@
     s = d.createElement('script'),
     head = d.getElementsByTagName('head')[0] || d.documentElement;
   s.async = true;
-  s.src = 'https://paperbagglue-chat-v1.fly.dev/static/chat-widget.js?v=' + Date.now();
+  // loader.js 短时缓存并指向当前版本的 chat-widget.<hash>.js（长期缓存），无需 ?v= 破坏缓存
+  s.src = 'https://paperbagglue-chat-v1.fly.dev/static/loader.js';
   s.charset = 'UTF-8';
   s.onerror = function() {
     console.error('Failed to load chat widget');
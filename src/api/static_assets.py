@@ -0,0 +1,181 @@
+"""
+Static Asset Store
+聊天组件静态资源：启动时一次性读取 static 目录，生成内容哈希文件名与 gzip / brotli 预压缩版本
+
+- chat-widget.<hash>.js 等哈希文件名：内容变化即换 URL，长期缓存（immutable）
+- loader.js：稳定的加载入口，指向当前哈希文件名，短时缓存 + ETag 协商
+- 原始文件名（chat-widget.js）：兼容已嵌入的旧代码，每次协商（304）
+"""
+
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # brotli 为可选依赖，缺失时只提供 gzip
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# 稳定加载入口的缓存时间（秒），发布新版本后最多这么久所有页面切换到新哈希
+STATIC_LOADER_MAX_AGE = int(os.getenv("STATIC_LOADER_MAX_AGE", "300"))
+# 小于该字节数的文件不压缩
+STATIC_COMPRESS_MIN_BYTES = int(os.getenv("STATIC_COMPRESS_MIN_BYTES", "512"))
+
+LOADER_NAME = "loader.js"
+WIDGET_NAME = "chat-widget.js"
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+_COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml")
+# 协商优先级：同等 q 值时优先 brotli
+_ENCODING_PREFERENCE = ("br", "gzip")
+
+_LOADER_TEMPLATE = (
+    "(function(){{var d=document,c=d.currentScript,s=d.createElement('script');"
+    "s.async=true;s.charset='UTF-8';"
+    "s.src=(c&&c.src?c.src.replace(/[^\\/?#]*([?#].*)?$/,''):'/static/')+'{widget}';"
+    "s.onerror=function(){{console.error('Failed to load chat widget');}};"
+    "(d.head||d.documentElement).appendChild(s);}})();\n"
+)
+
+
+class StaticAsset:
+    """单个资源的全部编码版本：encoding -> (body, etag)"""
+
+    __slots__ = ("name", "content_type", "cache_control", "variants")
+
+    def __init__(self, name: str, body: bytes, digest: str, cache_control: str):
+        self.name = name
+        self.content_type = _content_type(name)
+        self.cache_control = cache_control
+        self.variants: Dict[str, Tuple[bytes, str]] = {"identity": (body, f'"{digest}"')}
+        if len(body) < STATIC_COMPRESS_MIN_BYTES or not self.content_type.startswith(_COMPRESSIBLE_TYPES):
+            return
+        # mtime=0 保证同一内容每次启动生成完全相同的压缩结果
+        self.variants["gzip"] = (gzip.compress(body, compresslevel=9, mtime=0), f'"{digest}-gzip"')
+        if brotli is not None:
+            self.variants["br"] = (brotli.compress(body, quality=11), f'"{digest}-br"')
+
+    def select(self, accept_encoding: Optional[str]) -> Tuple[str, bytes, str]:
+        """按 Accept-Encoding 选择编码，返回 (encoding, body, etag)"""
+        encoding = negotiate_encoding(accept_encoding, [e for e in self.variants if e != "identity"])
+        body, etag = self.variants[encoding]
+        return encoding, body, etag
+
+
+class StaticAssetStore:
+    """static 目录的内存快照（启动时构建，运行期间只读）"""
+
+    def __init__(self, static_dir: str):
+        self.static_dir = static_dir
+        self._assets: Dict[str, StaticAsset] = {}
+        # 原始文件名 -> 哈希文件名
+        self.manifest: Dict[str, str] = {}
+        self._build()
+
+    def _build(self):
+        total = compressed = 0
+        for name in sorted(os.listdir(self.static_dir)):
+            path = os.path.join(self.static_dir, name)
+            if not os.path.isfile(path) or name.startswith("."):
+                continue
+            with open(path, "rb") as f:
+                body = f.read()
+            digest = hashlib.sha256(body).hexdigest()[:12]
+            stem, ext = os.path.splitext(name)
+            hashed_name = f"{stem}.{digest}{ext}"
+            self.manifest[name] = hashed_name
+            self._assets[hashed_name] = StaticAsset(hashed_name, body, digest, IMMUTABLE_CACHE_CONTROL)
+            self._assets[name] = StaticAsset(name, body, digest, REVALIDATE_CACHE_CONTROL)
+            total += len(body)
+            compressed += len(self._assets[name].select("br, gzip")[1])
+
+        if WIDGET_NAME in self.manifest:
+            loader = _LOADER_TEMPLATE.format(widget=self.manifest[WIDGET_NAME]).encode("utf-8")
+            digest = hashlib.sha256(loader).hexdigest()[:12]
+            self._assets[LOADER_NAME] = StaticAsset(
+                LOADER_NAME, loader, digest,
+                f"public, max-age={STATIC_LOADER_MAX_AGE}, must-revalidate"
+            )
+
+        logger.info(
+            f"Static assets built: files={len(self.manifest)}, bytes={total}, compressed={compressed}, "
+            f"brotli={'on' if brotli is not None else 'off'}, manifest={self.manifest}"
+        )
+
+    def get(self, name: str) -> Optional[StaticAsset]:
+        return self._assets.get(name)
+
+    def respond(
+        self, name: str, accept_encoding: Optional[str], if_none_match: Optional[str]
+    ) -> Optional[Tuple[int, bytes, Dict[str, str]]]:
+        """
+        生成响应：返回 (status, body, headers)，资源不存在时返回 None
+
+        If-None-Match 命中当前编码版本的 ETag 时返回 304（空 body）
+        """
+        asset = self._assets.get(name)
+        if asset is None:
+            return None
+        encoding, body, etag = asset.select(accept_encoding)
+        headers = {
+            "Cache-Control": asset.cache_control,
+            "ETag": etag,
+            "Vary": "Accept-Encoding",
+        }
+        if etag_matches(if_none_match, etag):
+            return 304, b"", headers
+        headers["Content-Type"] = asset.content_type
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return 200, body, headers
+
+
+def _content_type(name: str) -> str:
+    content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    if content_type == "text/javascript":
+        content_type = "application/javascript"
+    if content_type.startswith(("text/", "application/javascript", "application/json")):
+        content_type += "; charset=utf-8"
+    return content_type
+
+
+def negotiate_encoding(accept_encoding: Optional[str], available: List[str]) -> str:
+    """按 Accept-Encoding 的 q 值选择压缩编码，没有可用编码时返回 identity"""
+    if not accept_encoding or not available:
+        return "identity"
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[token.strip().lower()] = q
+
+    best, best_q = "identity", 0.0
+    for encoding in _ENCODING_PREFERENCE:
+        if encoding not in available:
+            continue
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """弱比较 If-None-Match（忽略 W/ 前缀，支持多个值与 *）"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
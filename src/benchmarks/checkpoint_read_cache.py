@@ -0,0 +1,139 @@
+"""
+checkpoint 读缓存基准
+
+模拟多个会话的多轮对话（每轮开始读取最新 checkpoint，之后每一步写入 writes 与新 checkpoint），比较：
+不缓存 / 缓存 + 每次命中核对数据库（多 worker）/ 缓存 + 信任本进程写入（单 worker）的每轮读取耗时。
+
+默认使用内存 checkpointer 并为每次数据库访问加上模拟的往返延迟；指定 --db 时在真实的 Postgres 上运行。
+
+运行：python src/benchmarks/checkpoint_read_cache.py [--sessions 50] [--turns 10] [--rtt-ms 1.0]
+      [--db postgresql://...]   使用真实数据库（写入 memory schema，结束后删除测试会话）
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from typing import Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langgraph.checkpoint.base import empty_checkpoint
+from langgraph.checkpoint.memory import InMemorySaver
+
+from benchmarks.checkpoint_serde import make_turn
+from storage.memory.read_cache import ReadCachedSaver
+
+
+class LatencySaver(InMemorySaver):
+    """每次异步访问前等待一次模拟的数据库往返"""
+
+    def __init__(self, rtt: float):
+        super().__init__()
+        self.rtt = rtt
+
+    async def aget_tuple(self, config):
+        await asyncio.sleep(self.rtt)
+        return self.get_tuple(config)
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        await asyncio.sleep(self.rtt)
+        return self.put(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        await asyncio.sleep(self.rtt)
+        return self.put_writes(config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id):
+        self.delete_thread(thread_id)
+
+
+class SimulatedReadCache(ReadCachedSaver):
+    """核对查询按一次往返计（真实环境中是一次走主键索引的查询，不读取 blob）"""
+
+    async def _alatest_version(self, key) -> Optional[Tuple[str, int]]:
+        await asyncio.sleep(self.backend.rtt)
+        thread_id, checkpoint_ns = key
+        checkpoints = self.backend.storage[thread_id][checkpoint_ns]
+        if not checkpoints:
+            return None
+        latest = max(checkpoints)
+        return latest, len(self.backend.writes.get((thread_id, checkpoint_ns, latest), {}))
+
+
+async def run_conversations(saver, sessions: int, turns: int, steps: int, seed: int = 7) -> Tuple[float, int]:
+    """返回 (每轮开始读取的总耗时, 读取次数)"""
+    rng = random.Random(seed)
+    read_seconds, reads = 0.0, 0
+    for session in range(sessions):
+        thread_id = f"read-cache-bench-{session}"
+        config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+        await saver.adelete_thread(thread_id)
+        await saver.aput(config, empty_checkpoint(), {"step": -1}, {})
+        messages = []
+        for turn in range(turns):
+            started = time.perf_counter()
+            latest = await saver.aget_tuple(config)
+            read_seconds += time.perf_counter() - started
+            reads += 1
+            current = latest.config
+            messages.extend(make_turn(turn, rng))
+            for step in range(steps):
+                await saver.aput_writes(current, [("messages", messages[-2:])], task_id=f"t{turn}-{step}")
+                checkpoint = empty_checkpoint()
+                checkpoint["channel_values"] = {"messages": list(messages)}
+                checkpoint["channel_versions"] = {"messages": saver.get_next_version(None, None)}
+                current = await saver.aput(current, checkpoint, {"step": step}, checkpoint["channel_versions"])
+        await saver.adelete_thread(thread_id)
+    return read_seconds, reads
+
+
+async def main_async(args):
+    pool = None
+    if args.db:
+        from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+        from storage.memory.pool import create_pool
+
+        url = f"{args.db}{'&' if '?' in args.db else '?'}options=-csearch_path%3Dmemory"
+        pool = create_pool(url)
+        await pool.open(wait=True)
+        async with pool.connection() as conn:
+            await conn.execute("CREATE SCHEMA IF NOT EXISTS memory")
+        await AsyncPostgresSaver(pool).setup()
+
+    def backend():
+        return AsyncPostgresSaver(pool) if pool is not None else LatencySaver(args.rtt_ms / 1000)
+
+    cache_cls = ReadCachedSaver if pool is not None else SimulatedReadCache
+    variants = {
+        "no cache": lambda: backend(),
+        "cache + validate": lambda: cache_cls(backend(), validate=True),
+        "cache (single worker)": lambda: cache_cls(backend(), validate=False),
+    }
+    where = "postgres" if pool is not None else f"simulated, rtt {args.rtt_ms} ms"
+    print(f"{args.sessions} sessions x {args.turns} turns, {args.steps} steps per turn ({where})")
+    try:
+        for name, make in variants.items():
+            saver = make()
+            read_seconds, reads = await run_conversations(saver, args.sessions, args.turns, args.steps)
+            hit_rate = saver.stats()["hit_rate"] if isinstance(saver, ReadCachedSaver) else None
+            print(f"  {name:<24} {read_seconds / reads * 1000:8.3f} ms/read  hit rate {hit_rate}")
+    finally:
+        if pool is not None:
+            await pool.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Checkpoint read cache benchmark")
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--steps", type=int, default=2)
+    parser.add_argument("--rtt-ms", type=float, default=1.0)
+    parser.add_argument("--db", type=str, default="")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
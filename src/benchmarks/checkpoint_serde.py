@@ -0,0 +1,151 @@
+"""
+checkpoint 序列化压缩基准
+
+对典型的会话状态（消息列表，带 ID、用量与响应元数据）比较：
+默认序列化器 / zstd / zstd + 训练字典 的存储大小与序列化、反序列化耗时，并验证压缩前写入的旧数据仍可读取。
+
+运行：python src/benchmarks/checkpoint_serde.py [--turns 20] [--samples 300] [--rounds 200]
+      [--from-db 1000]          从 memory schema 抽样真实的 checkpoint blob / writes 作为训练与测试数据
+      [--save-dict PATH]        保存训练好的字典（配合 CHECKPOINT_ZSTD_DICT 使用）
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+import uuid
+from typing import Any, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+from storage.memory.serde import ZSTD_SUFFIX, ZstdSerializer, train_dictionary
+
+QUESTIONS = [
+    "Which glue fits a {speed} m/min paper bag machine with roller coating?",
+    "Do you have an adhesive for side seam pasting on a semi-automatic line?",
+    "What is the price of QL-118GH for {speed} kg per month?",
+    "我们的纸袋机速度是 {speed} 米/分钟，推荐哪款胶水？",
+    "Can you send the product page for QL-306P?",
+]
+ANSWERS = [
+    "For a {speed} m/min machine I recommend QL-118GH: stable roller application and strong bonding. "
+    "Product page: www.paperbagglue.com/products/ql-118gh. May I know your machine brand?",
+    "Side Glue 98 is designed for side seam pasting. Could you share your daily output?",
+    "Our sales engineer Larry will quote you directly. WhatsApp: +86 138 0000 0000.",
+]
+
+
+def make_turn(i: int, rng: random.Random) -> List[Any]:
+    speed = rng.choice([80, 120, 180, 200, 300])
+    return [
+        HumanMessage(content=rng.choice(QUESTIONS).format(speed=speed), id=str(uuid.uuid4())),
+        AIMessage(
+            content=rng.choice(ANSWERS).format(speed=speed),
+            id=f"lc_run--{uuid.uuid4()}",
+            response_metadata={"finish_reason": "stop", "model_name": "doubao-seed-1-6-251015", "turn": i},
+            usage_metadata={"input_tokens": 900 + i * 40, "output_tokens": 60, "total_tokens": 960 + i * 40},
+        ),
+    ]
+
+
+def synthetic_values(samples: int, turns: int, seed: int = 7) -> List[Any]:
+    """每个样本是一个会话某一时刻的 messages 通道值（长度 1..turns 轮）"""
+    rng = random.Random(seed)
+    values = []
+    for _ in range(samples):
+        messages: List[Any] = []
+        for i in range(rng.randint(1, turns)):
+            messages.extend(make_turn(i, rng))
+        values.append(messages)
+    return values
+
+
+def db_samples(limit: int) -> List[Tuple[str, bytes]]:
+    """从 memory schema 抽样未压缩的 (type, bytes)"""
+    from storage.memory.memory_saver import get_memory_manager
+
+    conn = get_memory_manager().connect()
+    if conn is None:
+        raise SystemExit("Database is not available")
+    try:
+        rows = conn.execute(
+            "SELECT type, blob FROM ("
+            "  SELECT type, blob FROM checkpoint_blobs WHERE blob IS NOT NULL"
+            "  UNION ALL SELECT type, blob FROM checkpoint_writes"
+            ") t WHERE type NOT LIKE %s ORDER BY random() LIMIT %s",
+            (f"%{ZSTD_SUFFIX}", limit),
+        ).fetchall()
+    finally:
+        conn.close()
+    return [(typ, bytes(blob)) for typ, blob in rows]
+
+
+def measure(name: str, serde, typed_values: List[Tuple[str, bytes]], raw_total: int, rounds: int):
+    base = JsonPlusSerializer()
+    objects = [base.loads_typed(t) for t in typed_values]
+    stored = [serde.dumps_typed(o) for o in objects]
+    size = sum(len(data or b"") for _, data in stored)
+
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for o in objects:
+            serde.dumps_typed(o)
+    dumps_us = (time.perf_counter() - started) / (rounds * len(objects)) * 1e6
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for t in stored:
+            serde.loads_typed(t)
+    loads_us = (time.perf_counter() - started) / (rounds * len(objects)) * 1e6
+    print(f"  {name:<22} {size:>10} bytes  ratio {raw_total / size:5.2f}x  dumps {dumps_us:8.1f} us  loads {loads_us:8.1f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Checkpoint serializer compression benchmark")
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--samples", type=int, default=300)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--dict-size", type=int, default=64 * 1024)
+    parser.add_argument("--from-db", type=int, default=0)
+    parser.add_argument("--save-dict", type=str, default="")
+    args = parser.parse_args()
+
+    base = JsonPlusSerializer()
+    if args.from_db:
+        typed_values = db_samples(args.from_db)
+    else:
+        typed_values = [base.dumps_typed(v) for v in synthetic_values(args.samples, args.turns)]
+    if len(typed_values) < 10:
+        raise SystemExit(f"Not enough samples ({len(typed_values)})")
+
+    # 一半训练字典，一半测试，避免在训练集上评估
+    train, test = typed_values[::2], typed_values[1::2]
+    dictionary = train_dictionary([data for _, data in train], args.dict_size)
+    raw_total = sum(len(data) for _, data in test)
+    print(f"{len(test)} values, {raw_total} raw bytes (avg {raw_total // len(test)}), dictionary {len(dictionary.as_bytes())} bytes")
+
+    measure("jsonplus (current)", base, test, raw_total, args.rounds)
+    for level in (1, 3, 9):
+        measure(f"zstd level {level}", ZstdSerializer(level=level, min_bytes=0), test, raw_total, args.rounds)
+    measure("zstd level 3 + dict", ZstdSerializer(level=3, min_bytes=0, dictionary=dictionary), test, raw_total, args.rounds)
+
+    # 兼容性：未压缩的旧数据、无字典压缩的数据都能由带字典的序列化器读取
+    reader = ZstdSerializer(dictionary=dictionary)
+    plain = ZstdSerializer()
+    for typ, data in test[:20]:
+        expected = base.loads_typed((typ, data))
+        assert reader.loads_typed((typ, data)) == expected
+        assert reader.loads_typed(plain.dumps_typed(expected)) == expected
+    print("  legacy rows readable: ok")
+
+    if args.save_dict:
+        with open(args.save_dict, "wb") as f:
+            f.write(dictionary.as_bytes())
+        print(f"Saved dictionary {dictionary.dict_id()} to {args.save_dict}")
+
+
+if __name__ == "__main__":
+    main()
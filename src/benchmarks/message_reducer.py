@@ -0,0 +1,90 @@
+"""
+AgentState.messages reducer 微基准
+
+对比原实现（add_messages 后切片）与增量窗口 merge_window：
+稳态追加（窗口已满，每次追加一轮问答并淘汰最早的消息）与按 ID 替换的耗时。
+
+运行：python src/benchmarks/message_reducer.py [--window 40] [--rounds 2000]
+"""
+
+import argparse
+import os
+import sys
+import timeit
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.graph.message import add_messages
+
+from agents.message_window import merge_window
+
+
+def legacy_reducer(old, new, max_messages):
+    """原 _windowed_messages 的实现"""
+    return add_messages(old, new)[-max_messages:]
+
+
+def make_turn(i: int):
+    return [
+        HumanMessage(content=f"Question {i}: which glue fits a 200 m/min bag machine with roller coating?", id=str(uuid.uuid4())),
+        AIMessage(content=f"Answer {i}: I recommend QL-118GH for stable roller application. " * 3, id=str(uuid.uuid4())),
+    ]
+
+
+def check_equivalent(window: int):
+    """两种实现在追加、替换、淘汰后的结果一致"""
+    legacy, windowed = [], []
+    for i in range(window * 2):
+        turn = make_turn(i)
+        legacy = legacy_reducer(legacy, turn, window)
+        windowed = merge_window(windowed, turn, window)
+        replacement = AIMessage(content=f"edited {i}", id=turn[1].id)
+        legacy = legacy_reducer(legacy, [replacement], window)
+        windowed = merge_window(windowed, [replacement], window)
+        assert [(m.id, m.content) for m in legacy] == [(m.id, m.content) for m in windowed], f"mismatch at round {i}"
+
+
+def bench(window: int, rounds: int):
+    full = []
+    for i in range(window // 2):
+        full = legacy_reducer(full, make_turn(i), window)
+    turns = [make_turn(window + i) for i in range(rounds)]
+
+    def run(reducer):
+        state = list(full)
+        for turn in turns:
+            state = reducer(state, turn, window)
+        return state
+
+    results = {}
+    for name, reducer in (("add_messages + slice", legacy_reducer), ("merge_window", merge_window)):
+        elapsed = min(timeit.repeat(lambda: run(reducer), number=1, repeat=5))
+        results[name] = elapsed / rounds * 1e6
+        print(f"  {name:<22} {results[name]:8.2f} us/update")
+    print(f"  speedup                {results['add_messages + slice'] / results['merge_window']:8.2f}x")
+
+    # 单条替换（流式结束后按 ID 写回最终消息）
+    state = run(merge_window)
+    legacy_state = list(state)
+    replacement = [AIMessage(content="final", id=state[-1].id)]
+    legacy_us = min(timeit.repeat(lambda: legacy_reducer(legacy_state, replacement, window), number=rounds, repeat=5)) / rounds * 1e6
+    window_us = min(timeit.repeat(lambda: merge_window(state, replacement, window), number=rounds, repeat=5)) / rounds * 1e6
+    print(f"  replace by id          legacy {legacy_us:.2f} us, merge_window {window_us:.2f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AgentState.messages reducer microbenchmark")
+    parser.add_argument("--window", type=int, default=40)
+    parser.add_argument("--rounds", type=int, default=2000)
+    args = parser.parse_args()
+
+    check_equivalent(args.window)
+    for window in sorted({args.window, args.window * 5}):
+        print(f"window={window}, rounds={args.rounds}")
+        bench(window, args.rounds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""
+产品目录查询微基准
+
+对 config/product_catalog.json 执行典型的 search_products 查询（条件检索、型号查找、未命中），输出单次耗时。
+
+运行：python src/benchmarks/product_catalog.py [--rounds 100000]
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools.product_catalog import PRODUCT_CATALOG, ProductCatalog
+
+QUERIES = {
+    "search (4 criteria)": lambda c: c.search("paper bag machine", "semi-auto", 200, "roller coating"),
+    "search (alias, zh)": lambda c: c.search("纸袋", "", 0, "辊涂"),
+    "search (no match)": lambda c: c.search("bottle labels"),
+    "get by model": lambda c: c.get("ql 118gh"),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Product catalog lookup microbenchmark")
+    parser.add_argument("--rounds", type=int, default=100000)
+    args = parser.parse_args()
+
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    catalog = ProductCatalog.load(os.path.join(root, PRODUCT_CATALOG))
+    print(f"{len(catalog.products)} products, rounds={args.rounds}")
+    for name, query in QUERIES.items():
+        elapsed = min(timeit.repeat(lambda: query(catalog), number=args.rounds, repeat=3))
+        print(f"  {name:<22} {elapsed / args.rounds * 1e6:8.2f} us/lookup")
+
+
+if __name__ == "__main__":
+    main()
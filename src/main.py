@@ -4,9 +4,9 @@ import json
 import threading
 import traceback
 import logging
+from contextlib import asynccontextmanager
 from typing import Any, Dict, Iterable, AsyncIterable, AsyncGenerator, Optional
 import cozeloop
-import uvicorn
 import time
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.responses import StreamingResponse, JSONResponse
@@ -20,6 +20,22 @@ from coze_coding_utils.log.write_log import setup_logging, request_context
 from coze_coding_utils.log.config import LOG_LEVEL
 from coze_coding_utils.error.classifier import ErrorClassifier, classify_error
 from coze_coding_utils.helper.stream_runner import AgentStreamRunner, WorkflowStreamRunner,agent_stream_handler,workflow_stream_handler, RunOpt
+from utils.admission import (
+    RATE_LIMIT_IP_BURST,
+    RATE_LIMIT_IP_RATE,
+    AdmissionController,
+    AdmissionRejected,
+    RateLimiter,
+    client_ip,
+)
+from utils.serving import run_server
+from agents.config_manager import aget_agent, get_agent, get_config_manager
+from agents.hedging import get_hedge_stats
+from agents.language_prompt import get_session_languages
+from agents.model_router import get_routing_stats
+from storage.memory.memory_saver import get_memory_manager
+from storage.memory.retention import run_retention
+from tools.product_catalog import get_catalog_store
 
 setup_logging(
     log_file=LOG_FILE,
@@ -52,10 +68,32 @@ class GraphService:
         self._workflow_stream_runner = WorkflowStreamRunner()
         self._graph = None
         self._graph_lock = threading.Lock()
+        # 准入控制：全局并发上限 + 有界等待队列，按客户端 IP 限流
+        self.admission = AdmissionController()
+        self.ip_limiter = RateLimiter("ip", RATE_LIMIT_IP_RATE, RATE_LIMIT_IP_BURST)
+
+    def admit(self, request: Request):
+        """请求准入检查，超限时抛出 AdmissionRejected"""
+        self.ip_limiter.check(client_ip(request.headers, request.client.host if request.client else None))
+        self.admission.check_capacity()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "admission": self.admission.stats(),
+            "rate_limit": {"ip": self.ip_limiter.stats()},
+            "running_tasks": len(self.running_tasks),
+            "agent_config": get_config_manager().stats(),
+            "routing": get_routing_stats().stats(),
+            "llm_latency": get_hedge_stats().stats(),
+            "prompt_language": get_session_languages().stats(),
+            "product_catalog": get_catalog_store().stats(),
+            "checkpointer": get_memory_manager().stats(),
+        }
 
     def _get_graph(self, ctx=Context):
         if graph_helper.is_agent_proj():
-            return graph_helper.get_agent_instance("agents.agent", ctx)
+            # 按配置版本缓存的 Agent，ctx 中的调用头在运行时通过 context=ctx 注入
+            return get_agent()
 
         if self._graph is not None:
             return self._graph
@@ -65,6 +103,12 @@ class GraphService:
             self._graph = graph_helper.get_graph_instance("graphs.graph")
             return self._graph
 
+    async def _aget_graph(self, ctx=Context):
+        """_get_graph() 的异步版本：Agent 首次加载在线程池中完成，不阻塞事件循环"""
+        if graph_helper.is_agent_proj():
+            return await aget_agent()
+        return self._get_graph(ctx)
+
     @staticmethod
     def _sse_event(data: Any, event_id: Any = None) -> str:
         id_line = f"id: {event_id}\n" if event_id else ""
@@ -80,8 +124,11 @@ class GraphService:
     def stream(self, payload: Dict[str, Any], run_config: RunnableConfig, ctx=Context) -> Iterable[Any]:
         graph = self._get_graph(ctx)
         stream_runner = self._get_stream_runner()
-        for chunk in stream_runner.stream(payload, graph, run_config, ctx):
-            yield chunk
+        try:
+            for chunk in stream_runner.stream(payload, graph, run_config, ctx):
+                yield chunk
+        finally:
+            get_memory_manager().flush_sync(run_config.get("configurable", {}).get("thread_id"))
 
     # 同步运行：本地/HTTP 通用
     async def run(self, payload: Dict[str, Any], ctx=None) -> Dict[str, Any]:
@@ -92,7 +139,7 @@ class GraphService:
         logger.info(f"Starting run with run_id: {run_id}")
 
         try:
-            graph = self._get_graph(ctx)
+            graph = await self._aget_graph(ctx)
             # custom tracer
             run_config = init_run_config(graph, ctx)
             run_config["configurable"] = {"thread_id": ctx.run_id}
@@ -118,6 +165,8 @@ class GraphService:
         finally:
             # 清理任务记录
             self.running_tasks.pop(run_id, None)
+            # 写回模式下把本次运行缓冲的 checkpoint 写入数据库
+            await get_memory_manager().flush(run_id)
 
     # 流式运行（SSE 格式化）：HTTP 路由使用
     async def stream_sse(self, payload: Dict[str, Any], ctx=None, run_opt: Optional[RunOpt] = None) -> AsyncGenerator[str, None]:
@@ -128,7 +177,7 @@ class GraphService:
 
         run_id = ctx.run_id
         logger.info(f"Starting stream with run_id: {run_id}")
-        graph = self._get_graph(ctx)
+        graph = await self._aget_graph(ctx)
         if graph_helper.is_agent_proj():
             run_config = init_agent_config(graph, ctx)
         else:
@@ -137,15 +186,17 @@ class GraphService:
         is_workflow = not graph_helper.is_agent_proj()
 
         try:
-            async for chunk in self.astream(payload, graph, run_config=run_config, ctx=ctx, run_opt=run_opt):
-                if is_workflow and isinstance(chunk, tuple):
-                    event_id, data = chunk
-                    yield self._sse_event(data, event_id)
-                else:
-                    yield self._sse_event(chunk)
+            async with self.admission.slot():
+                async for chunk in self.astream(payload, graph, run_config=run_config, ctx=ctx, run_opt=run_opt):
+                    if is_workflow and isinstance(chunk, tuple):
+                        event_id, data = chunk
+                        yield self._sse_event(data, event_id)
+                    else:
+                        yield self._sse_event(chunk)
         finally:
             # 清理任务记录
             self.running_tasks.pop(run_id, None)
+            await get_memory_manager().flush(run_config.get("configurable", {}).get("thread_id"))
             cozeloop.flush()
 
     # 取消执行 - 使用asyncio的标准方式
@@ -191,7 +242,7 @@ class GraphService:
         if ctx is None or Context.run_id == "":
             ctx = new_context(method="node_run")
 
-        _graph = self._get_graph()
+        _graph = await self._aget_graph()
         node_func, input_cls, output_cls = graph_helper.get_graph_node_func_with_inout(_graph.get_graph(), node_id)
         if node_func is None or input_cls is None:
             raise KeyError(f"node_id '{node_id}' not found")
@@ -234,15 +285,46 @@ class GraphService:
 
 
 service = GraphService()
-app = FastAPI()
+
+
+async def _open_checkpointer_pool():
+    """建表（线程池中执行）后打开 checkpointer 连接池并预热到 min_size，首个请求不再承担建连耗时"""
+    memory_manager = get_memory_manager()
+    try:
+        if await asyncio.to_thread(memory_manager.prepare):
+            memory_manager.get_checkpointer()
+            await memory_manager.open_pool()
+    except Exception as e:
+        logger.warning(f"Checkpointer pool warm-up failed: {e}")
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    """启动时在后台预热 checkpointer 连接池；退出时写入缓冲的 checkpoint 并关闭连接池"""
+    warm_up_task = asyncio.create_task(_open_checkpointer_pool())
+    yield
+    if not warm_up_task.done():
+        warm_up_task.cancel()
+    await get_memory_manager().close_pool()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # OpenAI 兼容接口处理器
 openai_handler = OpenAIChatHandler(service)
 
 
+def _too_many_requests(e: AdmissionRejected) -> HTTPException:
+    return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+
 @app.post("/run")
 async def http_run(request: Request) -> Dict[str, Any]:
     global result
+    try:
+        service.admit(request)
+    except AdmissionRejected as e:
+        raise _too_many_requests(e)
     raw_body = await request.body()
     try:
         body_text = raw_body.decode("utf-8")
@@ -265,23 +347,25 @@ async def http_run(request: Request) -> Dict[str, Any]:
     try:
         payload = await request.json()
 
-        # 创建任务并记录 - 这是关键，让我们可以通过run_id取消任务
-        task = asyncio.create_task(service.run(payload, ctx))
-        service.running_tasks[run_id] = task
+        # 获取执行槽位后再创建任务，排队超时返回 429
+        async with service.admission.slot():
+            # 创建任务并记录 - 这是关键，让我们可以通过run_id取消任务
+            task = asyncio.create_task(service.run(payload, ctx))
+            service.running_tasks[run_id] = task
 
-        try:
-            result = await asyncio.wait_for(task, timeout=float(TIMEOUT_SECONDS))
-        except asyncio.TimeoutError:
-            logger.error(f"Run execution timeout after {TIMEOUT_SECONDS}s for run_id: {run_id}")
-            task.cancel()
             try:
-                result = await task
-            except asyncio.CancelledError:
-                return {
-                    "status": "timeout",
-                    "run_id": run_id,
-                    "message": f"Execution timeout: exceeded {TIMEOUT_SECONDS} seconds"
-                }
+                result = await asyncio.wait_for(task, timeout=float(TIMEOUT_SECONDS))
+            except asyncio.TimeoutError:
+                logger.error(f"Run execution timeout after {TIMEOUT_SECONDS}s for run_id: {run_id}")
+                task.cancel()
+                try:
+                    result = await task
+                except asyncio.CancelledError:
+                    return {
+                        "status": "timeout",
+                        "run_id": run_id,
+                        "message": f"Execution timeout: exceeded {TIMEOUT_SECONDS} seconds"
+                    }
 
         if not result:
             result = {}
@@ -298,6 +382,10 @@ async def http_run(request: Request) -> Dict[str, Any]:
         result = {"status": "cancelled", "run_id": run_id, "message": "Execution was cancelled"}
         return result
 
+    except AdmissionRejected as e:
+        logger.warning(f"Run rejected for run_id: {run_id}: {e}")
+        raise _too_many_requests(e)
+
     except Exception as e:
         # 使用错误分类器获取错误信息
         error_response = service.error_classifier.get_error_response(e, {"node_name": "http_run", "run_id": run_id})
@@ -326,6 +414,10 @@ def _register_task(run_id: str, task: asyncio.Task):
 
 @app.post("/stream_run")
 async def http_stream_run(request: Request):
+    try:
+        service.admit(request)
+    except AdmissionRejected as e:
+        raise _too_many_requests(e)
     ctx = new_context(method="stream_run", headers=request.headers)
     workflow_stream_mode = request.headers.get(HEADER_X_WORKFLOW_STREAM_MODE, "").lower()
     workflow_debug = workflow_stream_mode == "debug"
@@ -467,13 +559,19 @@ async def health_check():
         raise HTTPException(status_code=503, detail=str(e))
 
 
+@app.get("/stats")
+async def http_stats():
+    """准入队列深度、排队耗时与限流统计"""
+    return service.stats()
+
+
 @app.get(path="/graph_parameter")
 async def http_graph_inout_parameter(request: Request):
     return service.graph_inout_schema()
 
 def parse_args():
     parser = argparse.ArgumentParser(description="Start FastAPI server")
-    parser.add_argument("-m", type=str, default="http", help="Run mode, support http,flow,node")
+    parser.add_argument("-m", type=str, default="http", help="Run mode, support http,flow,node,agent,retention")
     parser.add_argument("-n", type=str, default="", help="Node ID for single node run")
     parser.add_argument("-p", type=int, default=5000, help="HTTP server port")
     parser.add_argument("-i", type=str, default="", help="Input JSON string for flow/node mode")
@@ -493,13 +591,12 @@ def parse_input(input_str: str) -> Dict[str, Any]:
         return {"text": input_str}
 
 def start_http_server(port):
-    workers = 1
     reload = False
     if graph_helper.is_dev_env():
         reload = True
 
-    logger.info(f"Start HTTP Server, Port: {port}, Workers: {workers}")
-    uvicorn.run("main:app", host="0.0.0.0", port=port, reload=reload, workers=workers)
+    # worker 数默认为可用 CPU 数（WEB_CONCURRENCY 可覆盖），开发环境热重载时为单进程
+    run_server("main:app", port=port, reload=reload)
 
 if __name__ == "__main__":
     args = parse_args()
@@ -513,6 +610,10 @@ if __name__ == "__main__":
         payload = parse_input(args.i)
         result = asyncio.run(service.run_node(args.n, payload))
         print(json.dumps(result, ensure_ascii=False, indent=2))
+    elif args.m == "retention":
+        # checkpoint 保留策略：-i 可传 JSON 覆盖参数，如 '{"keep": 10, "ttl_days": 7, "dry_run": true}'
+        options = json.loads(args.i) if args.i else {}
+        print(json.dumps(run_retention(**options), ensure_ascii=False, indent=2))
     elif args.m == "agent":
         agent_ctx = new_context(method="agent")
         for chunk in service.stream(
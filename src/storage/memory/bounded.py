@@ -0,0 +1,309 @@
+"""
+Bounded Memory Checkpointer
+数据库不可用时的内存兜底 checkpointer（替代 MemorySaver），内存占用有上限：
+
+- 每个会话只保留最新的 checkpoint 及其 pending writes（不保留历史，get_state_history 只返回最新一条）
+- 会话按 LRU 排序，空闲超过 MEMORY_CHECKPOINT_TTL 秒的会话被淘汰
+- 按序列化（启用压缩时为压缩后）的字节数估算每个会话的内存占用，总量超过 MEMORY_CHECKPOINT_MAX_BYTES
+  或会话数超过 MEMORY_CHECKPOINT_MAX_THREADS 时淘汰最久未使用的会话
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Sequence, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_serializable_checkpoint_metadata,
+)
+from langgraph.checkpoint.serde.base import SerializerProtocol
+
+logger = logging.getLogger(__name__)
+
+# 最多保留的会话数
+MEMORY_CHECKPOINT_MAX_THREADS = int(os.getenv("MEMORY_CHECKPOINT_MAX_THREADS", "10000"))
+# 所有会话合计的 checkpoint 字节数上限（序列化后估算）
+MEMORY_CHECKPOINT_MAX_BYTES = int(os.getenv("MEMORY_CHECKPOINT_MAX_BYTES", str(256 * 1024 * 1024)))
+# 会话空闲多久（秒）后淘汰
+MEMORY_CHECKPOINT_TTL = float(os.getenv("MEMORY_CHECKPOINT_TTL", "86400"))
+
+# 序列化后的值：(类型, 字节)
+Typed = Tuple[str, bytes]
+
+
+class _Saved:
+    """某个 namespace 的最新 checkpoint（已序列化）"""
+
+    __slots__ = ("checkpoint_id", "checkpoint", "metadata", "parent_id", "writes", "bytes")
+
+    def __init__(self, checkpoint_id: str, checkpoint: Typed, metadata: Typed, parent_id: Optional[str]):
+        self.checkpoint_id = checkpoint_id
+        self.checkpoint = checkpoint
+        self.metadata = metadata
+        self.parent_id = parent_id
+        # (task_id, idx) -> (task_id, channel, 序列化后的值)
+        self.writes: Dict[Tuple[str, int], Tuple[str, str, Typed]] = {}
+        self.bytes = len(checkpoint[1]) + len(metadata[1])
+
+
+class _Thread:
+    __slots__ = ("namespaces", "bytes", "last_used")
+
+    def __init__(self):
+        self.namespaces: Dict[str, _Saved] = {}
+        self.bytes = 0
+        self.last_used = time.monotonic()
+
+
+class BoundedMemorySaver(BaseCheckpointSaver):
+    """每个会话只保留最新 checkpoint、按 LRU / TTL / 字节上限淘汰的内存 checkpointer"""
+
+    def __init__(
+        self,
+        max_threads: int = MEMORY_CHECKPOINT_MAX_THREADS,
+        max_bytes: int = MEMORY_CHECKPOINT_MAX_BYTES,
+        ttl: float = MEMORY_CHECKPOINT_TTL,
+        serde: Optional[SerializerProtocol] = None,
+    ):
+        super().__init__(serde=serde)
+        self.max_threads = max(1, max_threads)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._threads: "OrderedDict[str, _Thread]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evicted_lru = 0
+        self.evicted_ttl = 0
+        self.evicted_bytes = 0
+
+    # ---- 淘汰 ----
+
+    def _drop(self, thread_id: str) -> Optional[_Thread]:
+        thread = self._threads.pop(thread_id, None)
+        if thread is not None:
+            self._bytes -= thread.bytes
+        return thread
+
+    def _evict(self, keep: Optional[str] = None):
+        """依次淘汰过期会话、超出会话数 / 字节上限的最久未使用会话（keep 为当前写入的会话，不淘汰）"""
+        if self.ttl > 0:
+            deadline = time.monotonic() - self.ttl
+            while self._threads:
+                thread_id, thread = next(iter(self._threads.items()))
+                if thread.last_used >= deadline or thread_id == keep:
+                    break
+                self._drop(thread_id)
+                self.evicted_ttl += 1
+        while len(self._threads) > self.max_threads or (self.max_bytes > 0 and self._bytes > self.max_bytes):
+            thread_id = next(iter(self._threads))
+            if thread_id == keep:
+                break
+            if len(self._threads) > self.max_threads:
+                self.evicted_lru += 1
+            else:
+                self.evicted_bytes += 1
+            self._drop(thread_id)
+
+    def _touch(self, thread_id: str, create: bool = False) -> Optional[_Thread]:
+        thread = self._threads.get(thread_id)
+        if thread is None:
+            if not create:
+                return None
+            thread = self._threads[thread_id] = _Thread()
+        self._threads.move_to_end(thread_id)
+        thread.last_used = time.monotonic()
+        return thread
+
+    def _resize(self, thread: _Thread, delta: int):
+        thread.bytes += delta
+        self._bytes += delta
+
+    # ---- 读写 ----
+
+    def _to_tuple(self, thread_id: str, checkpoint_ns: str, saved: _Saved) -> CheckpointTuple:
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": saved.checkpoint_id}},
+            checkpoint=self.serde.loads_typed(saved.checkpoint),
+            metadata=self.serde.loads_typed(saved.metadata),
+            parent_config=(
+                {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": saved.parent_id}}
+                if saved.parent_id
+                else None
+            ),
+            pending_writes=[(task_id, channel, self.serde.loads_typed(value)) for task_id, channel, value in saved.writes.values()],
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config)
+        with self._lock:
+            thread = self._touch(thread_id)
+            saved = thread.namespaces.get(checkpoint_ns) if thread is not None else None
+            if saved is None or (checkpoint_id and checkpoint_id != saved.checkpoint_id):
+                # 历史 checkpoint 不保留
+                return None
+        return self._to_tuple(thread_id, checkpoint_ns, saved)
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        configurable = (config or {}).get("configurable", {})
+        thread_id = configurable.get("thread_id")
+        checkpoint_ns = configurable.get("checkpoint_ns")
+        checkpoint_id = get_checkpoint_id(config) if config else None
+        before_id = get_checkpoint_id(before) if before else None
+        with self._lock:
+            if thread_id is not None:
+                threads = [(thread_id, self._threads[thread_id])] if thread_id in self._threads else []
+            else:
+                threads = list(self._threads.items())
+            candidates = [
+                (tid, ns, saved)
+                for tid, thread in threads
+                for ns, saved in thread.namespaces.items()
+                if (checkpoint_ns is None or ns == checkpoint_ns)
+                and (checkpoint_id is None or saved.checkpoint_id == checkpoint_id)
+                and (before_id is None or saved.checkpoint_id < before_id)
+            ]
+        count = 0
+        for tid, ns, saved in candidates:
+            if limit is not None and count >= limit:
+                return
+            item = self._to_tuple(tid, ns, saved)
+            if filter and not all(item.metadata.get(k) == v for k, v in filter.items()):
+                continue
+            count += 1
+            yield item
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        saved = _Saved(
+            checkpoint["id"],
+            self.serde.dumps_typed(checkpoint),
+            self.serde.dumps_typed(get_serializable_checkpoint_metadata(config, metadata)),
+            config["configurable"].get("checkpoint_id"),
+        )
+        with self._lock:
+            thread = self._touch(thread_id, create=True)
+            previous = thread.namespaces.get(checkpoint_ns)
+            # 新 checkpoint 替换旧的，旧 checkpoint 的 pending writes 一并丢弃
+            thread.namespaces[checkpoint_ns] = saved
+            self._resize(thread, saved.bytes - (previous.bytes if previous is not None else 0))
+            self._evict(keep=thread_id)
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        serialized = [(idx, channel, self.serde.dumps_typed(value)) for idx, (channel, value) in enumerate(writes)]
+        with self._lock:
+            thread = self._touch(thread_id)
+            saved = thread.namespaces.get(checkpoint_ns) if thread is not None else None
+            if saved is None or saved.checkpoint_id != config["configurable"]["checkpoint_id"]:
+                # 只保留最新 checkpoint 的 writes
+                return
+            delta = 0
+            for idx, channel, value in serialized:
+                key = (task_id, WRITES_IDX_MAP.get(channel, idx))
+                if key[1] >= 0 and key in saved.writes:
+                    continue
+                if key in saved.writes:
+                    delta -= len(saved.writes[key][2][1])
+                saved.writes[key] = (task_id, channel, value)
+                delta += len(value[1])
+            saved.bytes += delta
+            self._resize(thread, delta)
+            self._evict(keep=thread_id)
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            self._drop(thread_id)
+
+    def get_next_version(self, current: Optional[str], channel: None) -> str:
+        # 与 MemorySaver 相同的版本格式
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+    # ---- 异步接口：纯内存操作，直接调用同步版本 ----
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return self.get_tuple(config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        for item in self.list(config, filter=filter, before=before, limit=limit):
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return self.put(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        self.put_writes(config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        self.delete_thread(thread_id)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "threads": len(self._threads),
+                "max_threads": self.max_threads,
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "evicted_lru": self.evicted_lru,
+                "evicted_ttl": self.evicted_ttl,
+                "evicted_bytes": self.evicted_bytes,
+            }
@@ -1,27 +1,48 @@
 import psycopg
-from psycopg_pool import AsyncConnectionPool
 from langgraph.checkpoint.postgres import PostgresSaver
 from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
-from langgraph.checkpoint.memory import MemorySaver
 from langgraph.checkpoint.base import BaseCheckpointSaver
-from typing import Optional, Union
+from typing import Any, Coroutine, Dict, Optional, Union
+import asyncio
 import logging
+import os
 import time
 
+from storage.memory.bounded import BoundedMemorySaver
+from storage.memory.pool import CHECKPOINT_POOL_TIMEOUT, InstrumentedPool, create_pool
+from storage.memory.read_cache import CHECKPOINT_READ_CACHE_ENABLED, ReadCachedSaver
+from storage.memory.serde import ZstdSerializer, create_serializer
+from storage.memory.shared import SharedCheckpointer, on_loop, run_async, run_sync
+from storage.memory.write_behind import CHECKPOINT_WRITE_MODE, WriteBehindSaver
+from utils.loop_runner import get_loop_runner
+
 logger = logging.getLogger(__name__)
 
 # 数据库连接超时时间（秒），每次尝试 15 秒，共尝试 2 次
 DB_CONNECTION_TIMEOUT = 15
 DB_MAX_RETRIES = 2
+# 连接池所在的事件循环：shared（进程级后台循环，同步与任意循环上的异步调用共用一个连接池）/
+# caller（首次创建 checkpointer 的调用方循环，只支持该循环上的异步调用）
+CHECKPOINTER_LOOP = os.getenv("CHECKPOINTER_LOOP", "shared").lower()
+
+
+class CheckpointerLoopError(RuntimeError):
+    """CHECKPOINTER_LOOP=caller 时在没有运行中事件循环的线程上创建 checkpointer（配置错误，不退化为内存 checkpointer）"""
 
 
 class MemoryManager:
     """Memory Manager 单例类"""
 
     _instance: Optional['MemoryManager'] = None
-    _checkpointer: Optional[Union[AsyncPostgresSaver, MemorySaver]] = None
-    _pool: Optional[AsyncConnectionPool] = None
+    _checkpointer: Optional[Union[SharedCheckpointer, AsyncPostgresSaver, WriteBehindSaver, ReadCachedSaver, BoundedMemorySaver]] = None
+    _pool: Optional[InstrumentedPool] = None
+    # 连接池与 AsyncPostgresSaver 所在的事件循环
+    _loop: Optional[asyncio.AbstractEventLoop] = None
+    # checkpoint 序列化器（zstd 压缩，None 表示 langgraph 默认序列化器）
+    _serde: Optional[ZstdSerializer] = None
+    _serde_created: bool = False
     _setup_done: bool = False
+    _db_url: Optional[str] = None
 
     def __new__(cls):
         if cls._instance is None:
@@ -68,6 +89,27 @@ class MemoryManager:
         finally:
             conn.close()
 
+    def connect(self) -> Optional[psycopg.Connection]:
+        """新建一个 search_path 为 memory 的同步连接（autocommit，供维护任务使用），数据库不可用时返回 None"""
+        db_url = self._db_url or self._get_db_url_safe()
+        if not db_url:
+            return None
+        conn = self._connect_with_retry(db_url)
+        if conn is not None:
+            conn.execute("SET search_path TO memory")
+        return conn
+
+    async def aconnect(self) -> Optional[psycopg.AsyncConnection]:
+        """新建一个异步连接（autocommit，供跨进程会话锁使用），数据库不可用时返回 None"""
+        # prepare() 首次执行可能阻塞数十秒（之后立即返回），放到线程池
+        if not await asyncio.to_thread(self.prepare):
+            return None
+        try:
+            return await psycopg.AsyncConnection.connect(self._db_url, autocommit=True, connect_timeout=DB_CONNECTION_TIMEOUT)
+        except Exception as e:
+            logger.warning(f"Failed to open async database connection: {e}")
+            return None
+
     def _get_db_url_safe(self) -> Optional[str]:
         """安全获取 db_url，失败时返回 None"""
         try:
@@ -75,61 +117,187 @@ class MemoryManager:
             db_url = get_db_url()
             if db_url and db_url.strip():
                 return db_url
-            logger.warning("db_url is empty, will fallback to MemorySaver")
+            logger.warning("db_url is empty, will fallback to BoundedMemorySaver")
             return None
         except Exception as e:
-            logger.warning(f"Failed to get db_url: {e}, will fallback to MemorySaver")
+            logger.warning(f"Failed to get db_url: {e}, will fallback to BoundedMemorySaver")
             return None
 
-    def _create_fallback_checkpointer(self) -> MemorySaver:
-        """创建内存兜底 checkpointer"""
-        self._checkpointer = MemorySaver()
-        logger.warning("Using MemorySaver as fallback checkpointer (data will not persist across restarts)")
+    def _get_serde(self) -> Optional[ZstdSerializer]:
+        """checkpoint 序列化器（进程内共用一个，统计压缩率）"""
+        if not self._serde_created:
+            self._serde = create_serializer()
+            self._serde_created = True
+        return self._serde
+
+    def _create_fallback_checkpointer(self) -> BoundedMemorySaver:
+        """创建内存兜底 checkpointer（每个会话只保留最新 checkpoint，内存占用有上限）"""
+        self._checkpointer = BoundedMemorySaver(serde=self._get_serde())
+        logger.warning("Using BoundedMemorySaver as fallback checkpointer (data will not persist across restarts)")
         return self._checkpointer
 
-    def get_checkpointer(self) -> BaseCheckpointSaver:
-        """获取 checkpointer，优先使用 PostgresSaver，失败时退化为 MemorySaver"""
+    def prepare(self) -> bool:
+        """
+        同步完成 db_url 获取与 schema/表创建（带重试，可能阻塞数十秒）
+
+        可在线程池中提前执行，之后在事件循环内调用 get_checkpointer() 只需创建连接池。
+        失败时直接装配内存 checkpointer 兜底，返回 False
+        """
+        if self._db_url is not None:
+            return True
         if self._checkpointer is not None:
-            return self._checkpointer
+            return False
 
         # 1. 尝试获取 db_url
         db_url = self._get_db_url_safe()
         if not db_url:
-            return self._create_fallback_checkpointer()
+            self._create_fallback_checkpointer()
+            return False
 
         # 2. 尝试连接数据库并创建 schema/表（带重试）
         if not self._setup_schema_and_tables(db_url):
-            return self._create_fallback_checkpointer()
+            self._create_fallback_checkpointer()
+            return False
+
+        self._db_url = db_url
+        return True
+
+    def get_checkpointer(self) -> BaseCheckpointSaver:
+        """获取 checkpointer，优先使用 PostgresSaver，失败时退化为内存 checkpointer"""
+        if self._checkpointer is not None:
+            return self._checkpointer
+
+        # 1-2. 获取 db_url 并创建 schema/表，失败时已退化为内存 checkpointer
+        if not self.prepare():
+            return self._checkpointer
 
         # 3. 连接字符串加上 search_path
+        db_url = self._db_url
         if "?" in db_url:
             db_url = f"{db_url}&options=-csearch_path%3Dmemory"
         else:
             db_url = f"{db_url}?options=-csearch_path%3Dmemory"
 
-        # 4. 尝试创建连接池和 checkpointer
+        # 4. 尝试创建连接池和 checkpointer（AsyncPostgresSaver 需在事件循环内创建）
+        #    连接池容量与健康检查策略见 storage/memory/pool.py，由 open_pool() 在启动时打开并预热
+        if CHECKPOINTER_LOOP != "shared":
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                # 同步调用方（Flask 线程、CLI）没有可绑定的循环：明确报错，
+                # 而不是静默退化为内存 checkpointer 导致会话不再持久化
+                raise CheckpointerLoopError(
+                    "CHECKPOINTER_LOOP=caller requires the checkpointer to be created inside a running event loop; "
+                    "use CHECKPOINTER_LOOP=shared for synchronous callers (Flask, CLI)"
+                ) from None
         try:
-            self._pool = AsyncConnectionPool(
-                conninfo=db_url,
-                timeout=DB_CONNECTION_TIMEOUT,
-                min_size=1,
-                max_idle=300,
-                check=AsyncConnectionPool.check_connection,
-            )
-            self._checkpointer = AsyncPostgresSaver(self._pool)
-            logger.info("AsyncPostgresSaver initialized successfully")
+            if CHECKPOINTER_LOOP == "shared":
+                loop = get_loop_runner().loop
+                if on_loop(loop):
+                    saver = self._create_postgres_saver(db_url)
+                else:
+                    saver = run_sync(loop, self._acreate_postgres_saver(db_url))
+                self._checkpointer = SharedCheckpointer(saver, loop)
+            else:
+                loop = asyncio.get_running_loop()
+                self._checkpointer = self._create_postgres_saver(db_url)
+            self._loop = loop
         except Exception as e:
-            logger.warning(f"Failed to create AsyncPostgresSaver: {e}, will fallback to MemorySaver")
+            logger.warning(f"Failed to create AsyncPostgresSaver: {e}, will fallback to BoundedMemorySaver")
             return self._create_fallback_checkpointer()
 
         return self._checkpointer
 
+    def _create_postgres_saver(self, db_url: str) -> BaseCheckpointSaver:
+        """在当前事件循环上创建连接池与 AsyncPostgresSaver（写回模式下再包装一层缓冲，否则可选包装读缓存）"""
+        self._pool = create_pool(db_url)
+        saver: BaseCheckpointSaver = AsyncPostgresSaver(self._pool, serde=self._get_serde())
+        logger.info(f"AsyncPostgresSaver initialized successfully (loop: {CHECKPOINTER_LOOP})")
+        if CHECKPOINT_WRITE_MODE == "write_behind":
+            saver = WriteBehindSaver(saver)
+            logger.info("Checkpoint writes are buffered (write-behind mode)")
+        elif CHECKPOINT_READ_CACHE_ENABLED:
+            saver = ReadCachedSaver(saver)
+            logger.info("Checkpoint reads are cached in process (read-through mode)")
+        return saver
+
+    async def _acreate_postgres_saver(self, db_url: str) -> BaseCheckpointSaver:
+        return self._create_postgres_saver(db_url)
+
+    def _saver(self) -> Optional[BaseCheckpointSaver]:
+        """去掉 SharedCheckpointer 外壳后的 checkpointer"""
+        checkpointer = self._checkpointer
+        return checkpointer.backend if isinstance(checkpointer, SharedCheckpointer) else checkpointer
+
+    async def _on_pool_loop(self, coro: Coroutine[Any, Any, Any]) -> Any:
+        """连接池只能在创建它的事件循环上使用，其他循环上的调用投递过去执行"""
+        return await run_async(self._loop, coro)
+
+    async def open_pool(self) -> bool:
+        """预先打开连接池并等待 min_size 个连接就绪，无连接池（内存 checkpointer 兜底）时返回 False"""
+        if self._pool is None:
+            return False
+        try:
+            await self._on_pool_loop(self._pool.open(wait=True, timeout=CHECKPOINT_POOL_TIMEOUT))
+            logger.info(f"Checkpointer connection pool is ready ({self._pool.min_size}-{self._pool.max_size} connections, check={self._pool.check_policy})")
+            return True
+        except Exception as e:
+            logger.warning(f"Failed to open checkpointer connection pool: {e}")
+            return False
+
+    async def flush(self, thread_id: Optional[str] = None):
+        """写回模式下把缓冲的 checkpoint 写入数据库（一轮结束时调用），失败时保留缓冲稍后重试"""
+        saver = self._saver()
+        if not isinstance(saver, WriteBehindSaver):
+            return
+        try:
+            await self._on_pool_loop(saver.aflush(thread_id))
+        except Exception as e:
+            logger.warning(f"Failed to flush checkpoints (thread: {thread_id}), will retry: {e}")
+
+    def flush_sync(self, thread_id: Optional[str] = None):
+        """flush() 的同步版本（同步运行 Agent 后调用），caller 模式下没有可投递的循环，交给后台定时刷写"""
+        if isinstance(self._saver(), WriteBehindSaver) and isinstance(self._checkpointer, SharedCheckpointer):
+            run_sync(self._loop, self.flush(thread_id))
+
+    def stats(self) -> Dict[str, Any]:
+        """checkpointer 运行时统计"""
+        saver = self._saver()
+        if isinstance(saver, WriteBehindSaver):
+            stats = saver.stats()
+        elif isinstance(saver, BoundedMemorySaver):
+            stats = {"mode": "memory", **saver.stats()}
+        elif isinstance(saver, ReadCachedSaver):
+            stats = {"mode": "sync", "read_cache": saver.stats()}
+        else:
+            stats = {"mode": "sync"}
+        stats["loop"] = CHECKPOINTER_LOOP if self._pool is not None else None
+        stats["pool"] = self._pool.stats() if self._pool is not None else None
+        stats["compression"] = self._serde.stats() if self._serde is not None else None
+        return stats
+
+    async def close_pool(self):
+        """进程退出前写入缓冲的 checkpoint 并关闭连接池，归还数据库连接"""
+        if self._pool is None:
+            return
+        await self.flush()
+        try:
+            await self._on_pool_loop(self._pool.close())
+            logger.info("Checkpointer connection pool closed")
+        except Exception as e:
+            logger.warning(f"Failed to close checkpointer connection pool: {e}")
+
 _memory_manager: Optional[MemoryManager] = None
 
 
-def get_memory_saver() -> BaseCheckpointSaver:
-    """获取 checkpointer，优先使用 PostgresSaver，db_url 不可用或连接失败时退化为 MemorySaver"""
+def get_memory_manager() -> MemoryManager:
+    """获取 MemoryManager 单例"""
     global _memory_manager
     if _memory_manager is None:
         _memory_manager = MemoryManager()
-    return _memory_manager.get_checkpointer()
\ No newline at end of file
+    return _memory_manager
+
+
+def get_memory_saver() -> BaseCheckpointSaver:
+    """获取 checkpointer，优先使用 PostgresSaver，db_url 不可用或连接失败时退化为内存 checkpointer"""
+    return get_memory_manager().get_checkpointer()
\ No newline at end of file
@@ -0,0 +1,150 @@
+"""
+Checkpointer Connection Pool
+checkpointer 使用的 AsyncConnectionPool：容量、空闲 / 生命周期与检出时健康检查策略均可由环境变量配置，
+并统计等待中的请求、检出耗时、使用中的连接数与错误数（/api/stats 的 checkpointer.pool）
+
+检出时健康检查（CHECKPOINT_POOL_CHECK）：
+- always：每次检出都执行 SELECT 1（原行为，每次检出多一次数据库往返）
+- idle：只检查在池中空闲超过 CHECKPOINT_POOL_CHECK_IDLE 秒的连接（断连通常发生在长时间空闲之后）
+- never：不检查，坏连接在使用时报错并由连接池替换
+"""
+
+import logging
+import os
+import threading
+import time
+import weakref
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+from psycopg import AsyncConnection
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
+
+logger = logging.getLogger(__name__)
+
+# 连接池容量：启动时预先建立 min_size 个连接
+CHECKPOINT_POOL_MIN_SIZE = int(os.getenv("CHECKPOINT_POOL_MIN_SIZE", "2"))
+CHECKPOINT_POOL_MAX_SIZE = int(os.getenv("CHECKPOINT_POOL_MAX_SIZE", "10"))
+# 空闲连接保留时间与连接最长生命周期（秒）
+CHECKPOINT_POOL_MAX_IDLE = float(os.getenv("CHECKPOINT_POOL_MAX_IDLE", "300"))
+CHECKPOINT_POOL_MAX_LIFETIME = float(os.getenv("CHECKPOINT_POOL_MAX_LIFETIME", "3600"))
+# 检出等待超时（秒）与最大等待请求数（0 表示不限制，超出时立即报错）
+CHECKPOINT_POOL_TIMEOUT = float(os.getenv("CHECKPOINT_POOL_TIMEOUT", "15"))
+CHECKPOINT_POOL_MAX_WAITING = int(os.getenv("CHECKPOINT_POOL_MAX_WAITING", "0"))
+# 检出时健康检查策略：always / idle / never
+CHECKPOINT_POOL_CHECK = os.getenv("CHECKPOINT_POOL_CHECK", "idle").lower()
+# idle 策略下，空闲超过该时长（秒）的连接在检出时检查
+CHECKPOINT_POOL_CHECK_IDLE = float(os.getenv("CHECKPOINT_POOL_CHECK_IDLE", "30"))
+
+# 检出耗时样本数（用于 p50 / p99）
+_CHECKOUT_SAMPLES = 2048
+# AsyncPostgresSaver 要求的连接参数：autocommit（否则写入在连接归还时被回滚）、
+# 关闭服务端 prepared statement（兼容 PgBouncer 等事务级连接池）、按列名读取结果
+CONNECTION_KWARGS = {"autocommit": True, "prepare_threshold": 0, "row_factory": dict_row}
+
+
+class InstrumentedPool(AsyncConnectionPool):
+    """记录检出耗时、错误与健康检查次数的连接池"""
+
+    def __init__(self, conninfo: str, check_policy: str = CHECKPOINT_POOL_CHECK, check_idle: float = CHECKPOINT_POOL_CHECK_IDLE, **kwargs):
+        if check_policy not in ("always", "idle", "never"):
+            raise ValueError(f"unknown CHECKPOINT_POOL_CHECK policy {check_policy!r}")
+        self.check_policy = check_policy
+        self.check_idle = check_idle
+        # 连接 -> 最近一次建立或归还的时间
+        self._returned_at: "weakref.WeakKeyDictionary[AsyncConnection, float]" = weakref.WeakKeyDictionary()
+        self._checkout_samples: Deque[float] = deque(maxlen=_CHECKOUT_SAMPLES)
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.checkout_errors = 0
+        self.checks = 0
+        self.checks_skipped = 0
+        self.checks_failed = 0
+        super().__init__(
+            conninfo,
+            configure=self._mark_idle,
+            reset=self._mark_idle,
+            check=None if check_policy == "never" else self._check,
+            **kwargs,
+        )
+
+    async def _mark_idle(self, conn: AsyncConnection):
+        self._returned_at[conn] = time.monotonic()
+
+    async def _check(self, conn: AsyncConnection):
+        if self.check_policy == "idle":
+            returned_at = self._returned_at.get(conn)
+            if returned_at is not None and time.monotonic() - returned_at < self.check_idle:
+                self.checks_skipped += 1
+                return
+        self.checks += 1
+        try:
+            await AsyncConnectionPool.check_connection(conn)
+        except Exception:
+            self.checks_failed += 1
+            raise
+
+    async def getconn(self, timeout: Optional[float] = None) -> AsyncConnection:
+        started = time.perf_counter()
+        if self._closed and not self._opened:
+            # 启动时未预先打开（如命令行运行），首次检出时打开
+            await self.open()
+        try:
+            conn = await super().getconn(timeout=timeout)
+        except Exception:
+            with self._stats_lock:
+                self.checkout_errors += 1
+            raise
+        with self._stats_lock:
+            self.checkouts += 1
+            self._checkout_samples.append(time.perf_counter() - started)
+        return conn
+
+    def stats(self) -> Dict[str, Any]:
+        pool = self.get_stats()
+        with self._stats_lock:
+            samples = sorted(self._checkout_samples)
+
+        def percentile(p: float) -> Optional[float]:
+            if not samples:
+                return None
+            return round(samples[min(len(samples) - 1, int(p * len(samples)))] * 1000, 2)
+
+        size = pool.get("pool_size", 0)
+        return {
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            "size": size,
+            "in_use": size - pool.get("pool_available", 0),
+            "waiting": pool.get("requests_waiting", 0),
+            "checkouts": self.checkouts,
+            "checkout_p50_ms": percentile(0.5),
+            "checkout_p99_ms": percentile(0.99),
+            "checkout_max_ms": round(samples[-1] * 1000, 2) if samples else None,
+            "checkout_errors": self.checkout_errors,
+            "check_policy": self.check_policy,
+            "checks": self.checks,
+            "checks_skipped": self.checks_skipped,
+            "checks_failed": self.checks_failed,
+            "connections_opened": pool.get("connections_num", 0),
+            "connection_errors": pool.get("connections_errors", 0),
+            "connections_lost": pool.get("connections_lost", 0),
+            "returns_bad": pool.get("returns_bad", 0),
+        }
+
+
+def create_pool(conninfo: str) -> InstrumentedPool:
+    """按环境变量创建连接池（不打开，由 MemoryManager.open_pool 在启动时打开并预热到 min_size）"""
+    min_size = max(1, CHECKPOINT_POOL_MIN_SIZE)
+    return InstrumentedPool(
+        conninfo,
+        min_size=min_size,
+        max_size=max(min_size, CHECKPOINT_POOL_MAX_SIZE),
+        max_idle=CHECKPOINT_POOL_MAX_IDLE,
+        max_lifetime=CHECKPOINT_POOL_MAX_LIFETIME,
+        max_waiting=CHECKPOINT_POOL_MAX_WAITING,
+        timeout=CHECKPOINT_POOL_TIMEOUT,
+        kwargs=dict(CONNECTION_KWARGS),
+        open=False,
+    )
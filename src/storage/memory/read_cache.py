@@ -0,0 +1,341 @@
+"""
+Checkpoint Read Cache
+Postgres checkpointer 前的进程内读缓存（LRU + TTL），缓存每个会话（namespace）的最新 checkpoint：
+
+- 单 worker 时数据库只会被本进程写入，缓存由本进程的 put / put_writes 维护，命中直接返回内存中的结果
+  （省去 checkpoint、blob 与 writes 的读取和反序列化，不访问数据库）
+- 多 worker（或 CHECKPOINT_READ_CACHE_VALIDATE=1）时，aget_tuple 命中后先用一次索引查询
+  核对数据库中该会话最新的 checkpoint_id 与其 writes 数，与缓存一致时返回缓存，
+  不一致（其他进程已写入）时回源读取并替换缓存
+- 写入照常直接写 Postgres（write-through）：put 成功后缓存替换为新 checkpoint，
+  put_writes 后该会话的缓存失效（下次读取回源，拿到完整的 pending writes）
+- 每个会话维护写入代数，回源读取期间发生过写入时不回填，避免旧结果覆盖新写入
+- 核对只针对异步接口；需要核对时同步接口（get_tuple）总是回源读取，并刷新缓存
+- 写回模式（CHECKPOINT_WRITE_MODE=write_behind）自带活跃会话的内存读取，不再叠加本缓存
+"""
+
+import itertools
+import os
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Sequence, Tuple
+
+from cachetools import LRUCache, TTLCache
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_serializable_checkpoint_metadata,
+)
+from langgraph.checkpoint.postgres import _ainternal
+from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+from psycopg.rows import tuple_row
+
+# 是否启用读缓存（写回模式下不生效）
+CHECKPOINT_READ_CACHE_ENABLED = os.getenv("CHECKPOINT_READ_CACHE", "1").lower() in ("1", "true")
+# 命中时是否向数据库核对最新版本：auto 表示多 worker 时核对；多个实例共用一个数据库时需设为 1
+CHECKPOINT_READ_CACHE_VALIDATE = os.getenv("CHECKPOINT_READ_CACHE_VALIDATE", "auto").lower()
+# 缓存的会话数上限（LRU 淘汰）
+CHECKPOINT_READ_CACHE_SIZE = int(os.getenv("CHECKPOINT_READ_CACHE_SIZE", "2000"))
+# 缓存项的最长存活时间（秒）
+CHECKPOINT_READ_CACHE_TTL = float(os.getenv("CHECKPOINT_READ_CACHE_TTL", "300"))
+
+Key = Tuple[str, str]
+
+# 数据库中会话最新的 checkpoint 及其 writes 数（均走主键索引）
+_LATEST_VERSION = """
+    SELECT c.checkpoint_id, (
+        SELECT count(*) FROM checkpoint_writes w
+        WHERE w.thread_id = c.thread_id AND w.checkpoint_ns = c.checkpoint_ns AND w.checkpoint_id = c.checkpoint_id
+    )
+    FROM checkpoints c
+    WHERE c.thread_id = %s AND c.checkpoint_ns = %s
+    ORDER BY c.checkpoint_id DESC
+    LIMIT 1
+"""
+
+
+def validate_by_default() -> bool:
+    """CHECKPOINT_READ_CACHE_VALIDATE 为 auto 时按 worker 数决定：只有单 worker 时缓存不会被其他进程的写入绕过"""
+    if CHECKPOINT_READ_CACHE_VALIDATE == "auto":
+        from utils.serving import resolve_worker_count
+
+        return resolve_worker_count() > 1
+    return CHECKPOINT_READ_CACHE_VALIDATE in ("1", "true")
+
+
+def _key(config: RunnableConfig) -> Key:
+    configurable = config["configurable"]
+    return configurable["thread_id"], configurable.get("checkpoint_ns", "")
+
+
+class ReadCachedSaver(BaseCheckpointSaver):
+    """读缓存 + 写穿透的 checkpointer 包装"""
+
+    def __init__(
+        self,
+        backend: BaseCheckpointSaver,
+        maxsize: int = CHECKPOINT_READ_CACHE_SIZE,
+        ttl: float = CHECKPOINT_READ_CACHE_TTL,
+        validate: Optional[bool] = None,
+    ):
+        super().__init__(serde=backend.serde)
+        self.backend = backend
+        # 命中后是否核对数据库（否则信任本进程写入维护的缓存）
+        self.validate = validate_by_default() if validate is None else validate
+        self._cache: TTLCache = TTLCache(maxsize=max(1, maxsize), ttl=ttl)
+        # 会话 -> 最近一次写入的代数（只用于判断回源期间是否有写入，容量大于缓存即可）
+        self._generations: LRUCache = LRUCache(maxsize=max(1, maxsize) * 4)
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.validations = 0
+        self.validation_seconds = 0.0
+        self.fills = 0
+        self.stale_fills = 0
+        self.invalidations = 0
+
+    # ---- 缓存维护 ----
+
+    def _lookup(self, config: RunnableConfig) -> Tuple[Optional[CheckpointTuple], Optional[int]]:
+        """返回 (缓存中的 tuple, 回源前的写入代数)；需要核对时命中的 tuple 核对后才能使用"""
+        key = _key(config)
+        checkpoint_id = get_checkpoint_id(config)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None and checkpoint_id and checkpoint_id != cached.config["configurable"]["checkpoint_id"]:
+                cached = None
+            if cached is None:
+                self.misses += 1
+            return cached, self._generations.get(key)
+
+    async def _alatest_version(self, key: Key) -> Optional[Tuple[str, int]]:
+        """数据库中该会话最新的 (checkpoint_id, writes 数)，没有 checkpoint 时返回 None"""
+        if isinstance(self.backend, AsyncPostgresSaver):
+            async with _ainternal.get_connection(self.backend.conn) as conn:
+                async with conn.cursor(row_factory=tuple_row) as cur:
+                    await cur.execute(_LATEST_VERSION, key)
+                    row = await cur.fetchone()
+            return (row[0], row[1]) if row else None
+        # 其他 backend 没有廉价的版本查询，读取最新的 checkpoint 比较
+        thread_id, checkpoint_ns = key
+        latest = await self.backend.aget_tuple({"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns}})
+        return (latest.config["configurable"]["checkpoint_id"], len(latest.pending_writes or [])) if latest else None
+
+    async def _ais_current(self, config: RunnableConfig, cached: CheckpointTuple) -> bool:
+        """缓存的 tuple 是否仍是数据库中的最新状态（其他进程没有写入新的 checkpoint 或 writes）"""
+        started = time.perf_counter()
+        latest = await self._alatest_version(_key(config))
+        current = latest == (cached.config["configurable"]["checkpoint_id"], len(cached.pending_writes or []))
+        with self._lock:
+            self.validations += 1
+            self.validation_seconds += time.perf_counter() - started
+            if current:
+                self.hits += 1
+            else:
+                self.stale_hits += 1
+                self.misses += 1
+        return current
+
+    def _count_hit(self):
+        with self._lock:
+            self.hits += 1
+
+    def _drop_stale(self, key: Key, cached: CheckpointTuple):
+        with self._lock:
+            if self._cache.get(key) is cached:
+                del self._cache[key]
+
+    def _fill(self, config: RunnableConfig, generation: Optional[int], result: Optional[CheckpointTuple]):
+        """回源结果写入缓存：只缓存"最新 checkpoint"读取，且回源期间没有写入"""
+        if result is None or get_checkpoint_id(config):
+            return
+        key = _key(config)
+        with self._lock:
+            if self._generations.get(key) != generation:
+                self.stale_fills += 1
+                return
+            self._cache[key] = result
+            self.fills += 1
+
+    def _after_put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata, next_config: RunnableConfig):
+        """写入成功后缓存新 checkpoint（刚写入的就是该会话最新的 checkpoint，pending writes 为空）"""
+        key = _key(config)
+        thread_id, checkpoint_ns = key
+        parent_id = config["configurable"].get("checkpoint_id")
+        cached = CheckpointTuple(
+            config=next_config,
+            checkpoint={**checkpoint, "channel_values": checkpoint["channel_values"].copy()},
+            metadata=get_serializable_checkpoint_metadata(config, metadata),
+            parent_config=(
+                {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": parent_id}}
+                if parent_id
+                else None
+            ),
+            pending_writes=[],
+        )
+        with self._lock:
+            self._generations[key] = next(self._counter)
+            self._cache[key] = cached
+
+    def _invalidate(self, key: Key):
+        with self._lock:
+            self._generations[key] = next(self._counter)
+            if self._cache.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def _invalidate_thread(self, thread_id: str):
+        with self._lock:
+            keys = [key for key in list(self._cache.keys()) if key[0] == thread_id]
+        for key in keys:
+            self._invalidate(key)
+        # 没有缓存项的 namespace 也要阻止正在回源的读取回填
+        self._invalidate((thread_id, ""))
+
+    # ---- 异步接口 ----
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        cached, generation = self._lookup(config)
+        if cached is not None:
+            if not self.validate:
+                self._count_hit()
+                return cached
+            if await self._ais_current(config, cached):
+                return cached
+            self._drop_stale(_key(config), cached)
+        result = await self.backend.aget_tuple(config)
+        self._fill(config, generation, result)
+        return result
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        async for item in self.backend.alist(config, filter=filter, before=before, limit=limit):
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        try:
+            next_config = await self.backend.aput(config, checkpoint, metadata, new_versions)
+        except BaseException:
+            self._invalidate(_key(config))
+            raise
+        self._after_put(config, checkpoint, metadata, next_config)
+        return next_config
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        try:
+            await self.backend.aput_writes(config, writes, task_id, task_path)
+        finally:
+            self._invalidate(_key(config))
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        try:
+            await self.backend.adelete_thread(thread_id)
+        finally:
+            self._invalidate_thread(thread_id)
+
+    # ---- 同步接口 ----
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        if not self.validate:
+            cached, generation = self._lookup(config)
+            if cached is not None:
+                self._count_hit()
+                return cached
+        else:
+            # 同步接口没有廉价的核对方式，总是回源
+            with self._lock:
+                self.misses += 1
+                generation = self._generations.get(_key(config))
+        result = self.backend.get_tuple(config)
+        self._fill(config, generation, result)
+        return result
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        return self.backend.list(config, filter=filter, before=before, limit=limit)
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        try:
+            next_config = self.backend.put(config, checkpoint, metadata, new_versions)
+        except BaseException:
+            self._invalidate(_key(config))
+            raise
+        self._after_put(config, checkpoint, metadata, next_config)
+        return next_config
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        try:
+            self.backend.put_writes(config, writes, task_id, task_path)
+        finally:
+            self._invalidate(_key(config))
+
+    def delete_thread(self, thread_id: str) -> None:
+        try:
+            self.backend.delete_thread(thread_id)
+        finally:
+            self._invalidate_thread(thread_id)
+
+    def get_next_version(self, current: Optional[str], channel: None) -> str:
+        return self.backend.get_next_version(current, channel)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._cache),
+                "max_entries": self._cache.maxsize,
+                "ttl": self._cache.ttl,
+                "validate": self.validate,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+                # 缓存中有、但核对发现其他进程已写入的次数（计入 misses）
+                "stale_hits": self.stale_hits,
+                "validations": self.validations,
+                "avg_validation_ms": round(self.validation_seconds / self.validations * 1000, 2) if self.validations else None,
+                "fills": self.fills,
+                "stale_fills": self.stale_fills,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,274 @@
+"""
+Checkpoint Retention
+memory schema 的保留 / 压缩任务（python src/main.py -m retention，或由 ASGI 服务按 CHECKPOINT_RETENTION_INTERVAL 定期执行）：
+
+- 空闲超过 CHECKPOINT_RETENTION_TTL_DAYS 天的会话（最新 checkpoint 的 ts 早于截止时间）整体删除
+- 其余会话每个 namespace 只保留最新的 CHECKPOINT_RETENTION_KEEP 个 checkpoint，
+  删除更早的 checkpoint 及其 writes 与随之不再被引用的 channel blob
+- 按 thread_id 键集分页，每批 CHECKPOINT_RETENTION_BATCH 个会话：只读取、排序这些会话的 checkpoint，
+  每批一个事务，批次之间短暂停顿以降低对线上的影响；整张表只按主键顺序经过一遍
+- blob 只删除被删除的 checkpoint 引用、且没有其他 checkpoint 引用的版本，不会误删正在写入的 checkpoint 的 blob
+- 报告删除的行数与回收的字节数（pg_column_size 统计的行大小；磁盘空间在 VACUUM 后才归还操作系统）
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import psycopg
+
+from storage.memory.memory_saver import get_memory_manager
+
+logger = logging.getLogger(__name__)
+
+# 每个会话（每个 namespace）保留的最新 checkpoint 数，0 表示不按数量清理
+CHECKPOINT_RETENTION_KEEP = int(os.getenv("CHECKPOINT_RETENTION_KEEP", "20"))
+# 会话空闲多少天后整体删除，0 表示不按时间清理
+CHECKPOINT_RETENTION_TTL_DAYS = float(os.getenv("CHECKPOINT_RETENTION_TTL_DAYS", "30"))
+# 每批处理的会话 / checkpoint 数
+CHECKPOINT_RETENTION_BATCH = int(os.getenv("CHECKPOINT_RETENTION_BATCH", "500"))
+# 批次之间的停顿（秒）
+CHECKPOINT_RETENTION_PAUSE = float(os.getenv("CHECKPOINT_RETENTION_PAUSE", "0.05"))
+# ASGI 服务内定期执行的间隔（小时），0 表示不在服务内执行（由 cron 调用 main.py -m retention）
+CHECKPOINT_RETENTION_INTERVAL = float(os.getenv("CHECKPOINT_RETENTION_INTERVAL", "0"))
+
+# 定期执行时的 advisory lock 键：多个 worker / 实例中同一时间只有一个在清理
+_RETENTION_LOCK_KEY = 0x5E7E
+
+# 按 thread_id 键集分页选出一批候选会话（沿主键索引顺序扫描，每批只读取这些会话的行）
+_CANDIDATE_THREADS = """
+    SELECT DISTINCT thread_id FROM checkpoints
+    WHERE thread_id {op} %s
+    ORDER BY thread_id
+    LIMIT %s
+"""
+
+_IDLE_THREADS = """
+    SELECT thread_id FROM checkpoints
+    WHERE thread_id = ANY(%s)
+    GROUP BY thread_id
+    HAVING max((checkpoint->>'ts')::timestamptz) < now() - make_interval(secs => %s)
+"""
+
+# 只在候选会话内排序
+_EXPIRED_CHECKPOINTS = """
+    SELECT thread_id, checkpoint_ns, checkpoint_id FROM (
+        SELECT thread_id, checkpoint_ns, checkpoint_id,
+               row_number() OVER (PARTITION BY thread_id, checkpoint_ns ORDER BY checkpoint_id DESC) AS rn
+        FROM checkpoints
+        WHERE thread_id = ANY(%s)
+    ) ranked
+    WHERE rn > %s
+"""
+
+# 删除语句统一返回 (行数, 字节数)
+_DELETE_THREADS = """
+    WITH deleted AS (
+        DELETE FROM {table} t WHERE t.thread_id = ANY(%s) RETURNING pg_column_size(t.*) AS size
+    )
+    SELECT count(*), coalesce(sum(size), 0) FROM deleted
+"""
+
+_DELETE_CHECKPOINT_ROWS = """
+    WITH keys AS (
+        SELECT * FROM unnest(%s::text[], %s::text[], %s::text[]) AS k(thread_id, checkpoint_ns, checkpoint_id)
+    ), deleted AS (
+        DELETE FROM {table} t USING keys k
+        WHERE t.thread_id = k.thread_id AND t.checkpoint_ns = k.checkpoint_ns AND t.checkpoint_id = k.checkpoint_id
+        RETURNING pg_column_size(t.*) AS size
+    )
+    SELECT count(*), coalesce(sum(size), 0) FROM deleted
+"""
+
+# 在删除 checkpoint 之前执行：只删除将被删除的 checkpoint 引用、且没有其他 checkpoint 引用的 blob 版本。
+# 正在写入的 checkpoint（blob 已写入、checkpoint 行尚未写入）引用的要么是新版本，要么是父 checkpoint
+# （最新的一个，总会保留）的版本，因此不会被误删
+_DELETE_RELEASED_BLOBS = """
+    WITH keys AS (
+        SELECT * FROM unnest(%s::text[], %s::text[], %s::text[]) AS k(thread_id, checkpoint_ns, checkpoint_id)
+    ), released AS (
+        SELECT DISTINCT c.thread_id, c.checkpoint_ns, v.key AS channel, v.value AS version
+        FROM checkpoints c
+        JOIN keys k ON c.thread_id = k.thread_id AND c.checkpoint_ns = k.checkpoint_ns AND c.checkpoint_id = k.checkpoint_id
+        CROSS JOIN LATERAL jsonb_each_text(c.checkpoint->'channel_versions') v
+    ), deleted AS (
+        DELETE FROM checkpoint_blobs b USING released r
+        WHERE b.thread_id = r.thread_id AND b.checkpoint_ns = r.checkpoint_ns
+          AND b.channel = r.channel AND b.version = r.version
+          AND NOT EXISTS (
+              SELECT 1 FROM checkpoints c
+              WHERE c.thread_id = b.thread_id AND c.checkpoint_ns = b.checkpoint_ns
+                AND c.checkpoint->'channel_versions'->>b.channel = b.version
+                AND NOT EXISTS (
+                    SELECT 1 FROM keys k
+                    WHERE k.thread_id = c.thread_id AND k.checkpoint_ns = c.checkpoint_ns AND k.checkpoint_id = c.checkpoint_id
+                )
+          )
+        RETURNING pg_column_size(b.*) AS size
+    )
+    SELECT count(*), coalesce(sum(size), 0) FROM deleted
+"""
+
+
+class RetentionReport:
+    """一次清理的统计（按表累计删除的行数与字节数）"""
+
+    def __init__(self):
+        self.scanned = 0
+        self.threads = 0
+        self.checkpoints = 0
+        self.rows: Dict[str, int] = {"checkpoints": 0, "checkpoint_writes": 0, "checkpoint_blobs": 0}
+        self.bytes = 0
+        self.batches = 0
+        self.started = time.monotonic()
+
+    def add(self, table: str, result: Tuple[int, int]):
+        rows, size = result
+        self.rows[table] += rows
+        self.bytes += int(size)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "scanned_threads": self.scanned,
+            "deleted_threads": self.threads,
+            "deleted_checkpoints": self.checkpoints,
+            "deleted_rows": dict(self.rows),
+            "reclaimed_bytes": self.bytes,
+            "batches": self.batches,
+            "seconds": round(time.monotonic() - self.started, 2),
+        }
+
+
+class CheckpointRetention:
+    """按保留策略分批清理 checkpoint 表（同步 psycopg 连接，autocommit，每批一个事务）"""
+
+    def __init__(
+        self,
+        conn: psycopg.Connection,
+        keep: int = CHECKPOINT_RETENTION_KEEP,
+        ttl_days: float = CHECKPOINT_RETENTION_TTL_DAYS,
+        batch_size: int = CHECKPOINT_RETENTION_BATCH,
+        pause: float = CHECKPOINT_RETENTION_PAUSE,
+    ):
+        self.conn = conn
+        self.keep = keep
+        self.ttl_seconds = ttl_days * 86400
+        self.batch_size = max(1, batch_size)
+        self.pause = pause
+
+    def _one(self, sql: str, params: Sequence[Any]) -> Tuple[int, int]:
+        return self.conn.execute(sql, params).fetchone()
+
+    def _column(self, sql: str, params: Sequence[Any]) -> List[Any]:
+        return [row[0] for row in self.conn.execute(sql, params).fetchall()]
+
+    def _end_batch(self, report: RetentionReport):
+        report.batches += 1
+        if self.pause > 0:
+            time.sleep(self.pause)
+
+    def _candidate_batches(self) -> Iterator[List[str]]:
+        """按 thread_id 顺序逐批产出候选会话（调用方在每批的事务内处理）"""
+        cursor: Optional[str] = None
+        while True:
+            sql = _CANDIDATE_THREADS.format(op=">=" if cursor is None else ">")
+            thread_ids = self._column(sql, ("" if cursor is None else cursor, self.batch_size))
+            if not thread_ids:
+                return
+            yield thread_ids
+            if len(thread_ids) < self.batch_size:
+                return
+            cursor = thread_ids[-1]
+
+    def _idle(self, thread_ids: List[str]) -> List[str]:
+        if self.ttl_seconds <= 0:
+            return []
+        return self._column(_IDLE_THREADS, (thread_ids, self.ttl_seconds))
+
+    def _expired(self, thread_ids: List[str]) -> List[Tuple[str, str, str]]:
+        if self.keep <= 0 or not thread_ids:
+            return []
+        return self.conn.execute(_EXPIRED_CHECKPOINTS, (thread_ids, self.keep)).fetchall()
+
+    def estimate(self) -> Dict[str, Any]:
+        """只统计待清理的数量，不删除（dry run）"""
+        result: Dict[str, Any] = {"idle_threads": 0, "expired_checkpoints": 0}
+        for candidates in self._candidate_batches():
+            idle = set(self._idle(candidates))
+            result["idle_threads"] += len(idle)
+            result["expired_checkpoints"] += len(self._expired([t for t in candidates if t not in idle]))
+        return result
+
+    def purge_idle_threads(self, report: RetentionReport, thread_ids: List[str]) -> List[str]:
+        """删除候选会话中空闲超过 TTL 的会话，返回被删除的会话"""
+        idle = self._idle(thread_ids)
+        if idle:
+            for table in ("checkpoint_writes", "checkpoint_blobs", "checkpoints"):
+                report.add(table, self._one(_DELETE_THREADS.format(table=table), (idle,)))
+            report.threads += len(idle)
+        return idle
+
+    def trim_checkpoints(self, report: RetentionReport, thread_ids: List[str]):
+        """候选会话每个 namespace 只保留最新的 keep 个 checkpoint"""
+        keys = self._expired(thread_ids)
+        if not keys:
+            return
+        columns = [list(column) for column in zip(*keys)]
+        # blob 要在 checkpoint 行删除之前处理（需要读取被删除的 checkpoint 引用的版本）
+        report.add("checkpoint_blobs", self._one(_DELETE_RELEASED_BLOBS, columns))
+        for table in ("checkpoint_writes", "checkpoints"):
+            report.add(table, self._one(_DELETE_CHECKPOINT_ROWS.format(table=table), columns))
+        report.checkpoints += len(keys)
+
+    def run(self) -> Dict[str, Any]:
+        report = RetentionReport()
+        batches = self._candidate_batches()
+        while True:
+            with self.conn.transaction():
+                candidates = next(batches, None)
+                if candidates is None:
+                    break
+                report.scanned += len(candidates)
+                idle = set(self.purge_idle_threads(report, candidates))
+                self.trim_checkpoints(report, [t for t in candidates if t not in idle])
+            self._end_batch(report)
+        result = report.to_dict()
+        logger.info(f"Checkpoint retention done: {result}")
+        return result
+
+
+def run_retention(dry_run: bool = False, exclusive: bool = True, **options) -> Optional[Dict[str, Any]]:
+    """
+    连接数据库执行一次保留策略，返回清理报告；dry_run 时只返回待清理数量
+
+    exclusive（默认）时先获取 advisory lock，其他进程（cron 或服务内定期任务）正在清理则跳过并返回 None；
+    options 可覆盖 keep / ttl_days / batch_size / pause
+    """
+    conn = get_memory_manager().connect()
+    if conn is None:
+        raise RuntimeError("Database is not available, checkpoint retention skipped")
+    try:
+        # 会话级 advisory lock，随连接关闭释放
+        if exclusive and not conn.execute("SELECT pg_try_advisory_lock(%s)", (_RETENTION_LOCK_KEY,)).fetchone()[0]:
+            logger.info("Checkpoint retention is running elsewhere, skipped")
+            return None
+        retention = CheckpointRetention(conn, **options)
+        return retention.estimate() if dry_run else retention.run()
+    finally:
+        conn.close()
+
+
+async def retention_loop(interval_hours: float = CHECKPOINT_RETENTION_INTERVAL):
+    """
+    每隔 interval_hours 小时在线程池中执行一次保留策略（供 ASGI lifespan 启动，取消即停止）
+
+    首次执行在一个间隔之后，避免与启动预热、滚动发布同时进行；单次失败只记录日志，不影响后续执行
+    """
+    while True:
+        await asyncio.sleep(interval_hours * 3600)
+        try:
+            await asyncio.to_thread(run_retention)
+        except Exception as e:
+            logger.warning(f"Periodic checkpoint retention failed: {e}")
@@ -0,0 +1,163 @@
+"""
+Compressed Checkpoint Serializer
+checkpoint 序列化器：在 langgraph 默认的 JsonPlusSerializer 之上对较大的值做 zstd 压缩
+
+- 压缩后的类型标记为 "<原类型>+zstd"（与 langgraph EncryptedSerializer 的 "+后缀" 约定一致），
+  读取时按类型判断，压缩前写入的旧数据（无后缀）照常读取
+- 可选训练字典（CHECKPOINT_ZSTD_DICT）：对话状态之间重复的字段名、消息结构较多，字典对小值的压缩率提升明显；
+  字典 ID 写在 zstd 帧头中，更换字典后旧字典（CHECKPOINT_ZSTD_EXTRA_DICTS）仍可用于读取
+- 小于 CHECKPOINT_ZSTD_MIN_BYTES 的值不压缩；zstandard 未安装时退化为不压缩
+- 注意：启用后写入的数据需要本版本代码才能读取，回滚到旧版本前先设置 CHECKPOINT_COMPRESSION=none
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from langgraph.checkpoint.serde.base import SerializerProtocol
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+try:
+    import zstandard
+except ImportError:  # zstandard 为可选依赖，缺失时不压缩
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# 压缩方式：zstd / none
+CHECKPOINT_COMPRESSION = os.getenv("CHECKPOINT_COMPRESSION", "zstd").lower()
+# zstd 压缩级别（1-22，级别越高越慢）
+CHECKPOINT_ZSTD_LEVEL = int(os.getenv("CHECKPOINT_ZSTD_LEVEL", "3"))
+# 小于该字节数的值不压缩
+CHECKPOINT_ZSTD_MIN_BYTES = int(os.getenv("CHECKPOINT_ZSTD_MIN_BYTES", "256"))
+# 压缩字典文件（python src/benchmarks/checkpoint_serde.py --save-dict 训练生成），为空表示不使用字典
+CHECKPOINT_ZSTD_DICT = os.getenv("CHECKPOINT_ZSTD_DICT", "")
+# 只用于读取的旧字典文件（逗号分隔），更换字典后保留旧字典以读取已有数据
+CHECKPOINT_ZSTD_EXTRA_DICTS = os.getenv("CHECKPOINT_ZSTD_EXTRA_DICTS", "")
+
+ZSTD_SUFFIX = "+zstd"
+
+
+def load_dictionary(path: str) -> "zstandard.ZstdCompressionDict":
+    with open(path, "rb") as f:
+        return zstandard.ZstdCompressionDict(f.read())
+
+
+def train_dictionary(samples: List[bytes], size: int = 64 * 1024) -> "zstandard.ZstdCompressionDict":
+    """用序列化后的 checkpoint 值训练压缩字典"""
+    if zstandard is None:
+        raise RuntimeError("zstandard is not installed")
+    return zstandard.train_dictionary(size, samples)
+
+
+class ZstdSerializer(SerializerProtocol):
+    """对 JsonPlusSerializer 输出做 zstd 压缩的序列化器，兼容读取未压缩的旧数据"""
+
+    def __init__(
+        self,
+        serde: Optional[SerializerProtocol] = None,
+        level: int = CHECKPOINT_ZSTD_LEVEL,
+        min_bytes: int = CHECKPOINT_ZSTD_MIN_BYTES,
+        dictionary: Optional["zstandard.ZstdCompressionDict"] = None,
+        extra_dictionaries: Iterable["zstandard.ZstdCompressionDict"] = (),
+    ):
+        if zstandard is None:
+            raise RuntimeError("zstandard is not installed")
+        self.serde = serde or JsonPlusSerializer()
+        self.level = level
+        self.min_bytes = min_bytes
+        self.dictionary = dictionary
+        if dictionary is not None:
+            dictionary.precompute_compress(level=level)
+        # 字典 ID -> 字典（0 表示无字典）
+        self._dictionaries: Dict[int, Any] = {d.dict_id(): d for d in (*extra_dictionaries, *([dictionary] if dictionary is not None else []))}
+        # ZstdCompressor / ZstdDecompressor 不能跨线程并发使用（AsyncPostgresSaver 在线程池中序列化）
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self.compressed = 0
+        self.skipped = 0
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+        self.compress_seconds = 0.0
+        self.decompressed = 0
+        self.decompress_seconds = 0.0
+
+    def _compressor(self) -> "zstandard.ZstdCompressor":
+        compressor = getattr(self._local, "compressor", None)
+        if compressor is None:
+            compressor = self._local.compressor = zstandard.ZstdCompressor(level=self.level, dict_data=self.dictionary)
+        return compressor
+
+    def _decompressor(self, dict_id: int) -> "zstandard.ZstdDecompressor":
+        decompressors = getattr(self._local, "decompressors", None)
+        if decompressors is None:
+            decompressors = self._local.decompressors = {}
+        decompressor = decompressors.get(dict_id)
+        if decompressor is None:
+            if dict_id and dict_id not in self._dictionaries:
+                raise ValueError(f"checkpoint value was compressed with unknown zstd dictionary {dict_id}")
+            decompressor = decompressors[dict_id] = zstandard.ZstdDecompressor(dict_data=self._dictionaries.get(dict_id))
+        return decompressor
+
+    def dumps_typed(self, obj: Any) -> Tuple[str, bytes]:
+        typ, data = self.serde.dumps_typed(obj)
+        if data is None or len(data) < self.min_bytes:
+            with self._stats_lock:
+                self.skipped += 1
+            return typ, data
+        started = time.perf_counter()
+        compressed = self._compressor().compress(data)
+        elapsed = time.perf_counter() - started
+        with self._stats_lock:
+            self.compressed += 1
+            self.raw_bytes += len(data)
+            self.stored_bytes += len(compressed)
+            self.compress_seconds += elapsed
+        return typ + ZSTD_SUFFIX, compressed
+
+    def loads_typed(self, data: Tuple[str, bytes]) -> Any:
+        typ, payload = data
+        if not typ.endswith(ZSTD_SUFFIX):
+            # 未压缩（压缩前写入的旧数据或小值）
+            return self.serde.loads_typed(data)
+        started = time.perf_counter()
+        dict_id = zstandard.get_frame_parameters(payload).dict_id
+        raw = self._decompressor(dict_id).decompress(payload)
+        elapsed = time.perf_counter() - started
+        with self._stats_lock:
+            self.decompressed += 1
+            self.decompress_seconds += elapsed
+        return self.serde.loads_typed((typ[:-len(ZSTD_SUFFIX)], raw))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "codec": "zstd",
+                "level": self.level,
+                "dictionary": self.dictionary.dict_id() if self.dictionary is not None else None,
+                "compressed": self.compressed,
+                "skipped": self.skipped,
+                "ratio": round(self.raw_bytes / self.stored_bytes, 2) if self.stored_bytes else None,
+                "saved_bytes": self.raw_bytes - self.stored_bytes,
+                "avg_compress_us": round(self.compress_seconds / self.compressed * 1e6, 1) if self.compressed else None,
+                "avg_decompress_us": round(self.decompress_seconds / self.decompressed * 1e6, 1) if self.decompressed else None,
+            }
+
+
+def create_serializer() -> Optional[SerializerProtocol]:
+    """按环境变量创建 checkpoint 序列化器，不压缩时返回 None（使用 langgraph 默认序列化器）"""
+    if CHECKPOINT_COMPRESSION != "zstd":
+        return None
+    if zstandard is None:
+        logger.warning("zstandard is not installed, checkpoints are stored uncompressed")
+        return None
+    try:
+        dictionary = load_dictionary(CHECKPOINT_ZSTD_DICT) if CHECKPOINT_ZSTD_DICT else None
+        extra = [load_dictionary(path.strip()) for path in CHECKPOINT_ZSTD_EXTRA_DICTS.split(",") if path.strip()]
+    except OSError as e:
+        # 没有字典仍可读取无字典压缩的数据；用字典压缩的数据读取时报错，需修复字典路径
+        logger.error(f"Failed to load zstd dictionary ({e}), compressing without dictionary")
+        dictionary, extra = None, []
+    return ZstdSerializer(dictionary=dictionary, extra_dictionaries=extra)
@@ -0,0 +1,144 @@
+"""
+Shared Checkpointer
+连接池与 AsyncPostgresSaver 常驻在进程级后台事件循环（utils.loop_runner）上，
+同步调用方（Agent.invoke / stream、CLI）与任意事件循环上的异步调用方共用这一个连接池
+
+- 异步接口：调用方就在该循环上（Flask 经 LoopRunner 提交的请求）时直接 await，
+  在其他循环上（uvicorn）时投递到该循环并等待结果，不阻塞调用方的循环
+- 同步接口：投递到该循环并阻塞等待，不会为每次调用新建事件循环；
+  在该循环线程上发起同步调用会死锁，直接报错
+"""
+
+import asyncio
+from typing import Any, AsyncIterator, Coroutine, Dict, Iterator, List, Optional, Sequence, Tuple, TypeVar
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+)
+
+T = TypeVar("T")
+
+
+def on_loop(loop: asyncio.AbstractEventLoop) -> bool:
+    """当前线程是否正在运行该事件循环"""
+    try:
+        return asyncio.get_running_loop() is loop
+    except RuntimeError:
+        return False
+
+
+async def run_async(loop: asyncio.AbstractEventLoop, coro: Coroutine[Any, Any, T]) -> T:
+    """在 loop 上执行协程并异步等待结果（已在该循环上时直接 await）"""
+    if on_loop(loop):
+        return await coro
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+
+def run_sync(loop: asyncio.AbstractEventLoop, coro: Coroutine[Any, Any, T]) -> T:
+    """在 loop 上执行协程并阻塞等待结果"""
+    if on_loop(loop):
+        coro.close()
+        raise RuntimeError(
+            "Synchronous checkpointer call from the checkpointer's own event loop would deadlock; "
+            "use the async methods (ainvoke/astream) there"
+        )
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+
+async def _collect(items: AsyncIterator[T]) -> List[T]:
+    return [item async for item in items]
+
+
+class SharedCheckpointer(BaseCheckpointSaver):
+    """把同步 / 异步调用统一转到 backend 所在事件循环执行的 checkpointer"""
+
+    def __init__(self, backend: BaseCheckpointSaver, loop: asyncio.AbstractEventLoop):
+        super().__init__(serde=backend.serde)
+        self.backend = backend
+        self.loop = loop
+
+    # ---- 异步接口 ----
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await run_async(self.loop, self.backend.aget_tuple(config))
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        items = self.backend.alist(config, filter=filter, before=before, limit=limit)
+        if on_loop(self.loop):
+            async for item in items:
+                yield item
+            return
+        for item in await run_async(self.loop, _collect(items)):
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await run_async(self.loop, self.backend.aput(config, checkpoint, metadata, new_versions))
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        await run_async(self.loop, self.backend.aput_writes(config, writes, task_id, task_path))
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await run_async(self.loop, self.backend.adelete_thread(thread_id))
+
+    # ---- 同步接口 ----
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return run_sync(self.loop, self.backend.aget_tuple(config))
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        yield from run_sync(self.loop, _collect(self.backend.alist(config, filter=filter, before=before, limit=limit)))
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return run_sync(self.loop, self.backend.aput(config, checkpoint, metadata, new_versions))
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        run_sync(self.loop, self.backend.aput_writes(config, writes, task_id, task_path))
+
+    def delete_thread(self, thread_id: str) -> None:
+        run_sync(self.loop, self.backend.adelete_thread(thread_id))
+
+    def get_next_version(self, current: Optional[str], channel: None) -> str:
+        return self.backend.get_next_version(current, channel)
@@ -0,0 +1,408 @@
+"""
+Write-Behind Checkpointer
+写回式 checkpointer：包装 AsyncPostgresSaver，Agent 每一步的 checkpoint / writes 先写入进程内缓冲，
+一轮对话结束时（或每 CHECKPOINT_FLUSH_INTERVAL 秒）在一个事务中批量写入 Postgres
+
+- 活跃会话的读取（aget_tuple）直接由内存中的最新 checkpoint 提供，不访问数据库
+- 缓冲操作按会话保序，批量写入时只检出一次连接、在同一事务中以 pipeline 方式执行
+- 缓冲总量上限 CHECKPOINT_MAX_PENDING：达到上限时写入方先等待刷写（背压）；
+  刷写失败（如数据库不可用）、缓冲仍是满的时拒绝新的写入（CheckpointBacklogError），缓冲不会无限增长，
+  失败状态（连续失败次数、最近的错误、拒绝次数）见 stats()
+- 持久性取舍：进程崩溃时最多丢失最近 CHECKPOINT_FLUSH_INTERVAL 秒内未刷写的步骤
+  （一轮结束时总会刷写）；需要零丢失时使用 CHECKPOINT_WRITE_MODE=sync
+- 只支持单进程（WEB_CONCURRENCY=1）：未刷写的 checkpoint 只在本进程内存中，其他进程会读到落后的状态；
+  worker 数大于 1 时启动检查（utils.serving.check_worker_count）拒绝启动
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_serializable_checkpoint_metadata,
+)
+from langgraph.checkpoint.postgres import _ainternal
+from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+
+logger = logging.getLogger(__name__)
+
+# checkpoint 写入模式：sync（每步直接写数据库）/ write_behind（缓冲后批量写入）
+CHECKPOINT_WRITE_MODE = os.getenv("CHECKPOINT_WRITE_MODE", "sync").lower()
+# 后台刷写间隔（秒），即崩溃时可能丢失的最大时间窗口；0 表示只在一轮结束时与缓冲满时刷写
+CHECKPOINT_FLUSH_INTERVAL = float(os.getenv("CHECKPOINT_FLUSH_INTERVAL", "1.0"))
+# 所有会话合计的未刷写操作上限（put + put_writes），超出时写入方等待刷写
+CHECKPOINT_MAX_PENDING = int(os.getenv("CHECKPOINT_MAX_PENDING", "512"))
+# 会话空闲多久（秒）后释放内存中的最新 checkpoint，之后的读取回到数据库
+CHECKPOINT_IDLE_TTL = float(os.getenv("CHECKPOINT_IDLE_TTL", "300"))
+
+
+class CheckpointBacklogError(RuntimeError):
+    """缓冲已满且刷写失败，拒绝新的写入"""
+
+
+class _Entry:
+    """内存中的一个 checkpoint 及其 pending writes（值未序列化）"""
+
+    __slots__ = ("checkpoint", "metadata", "parent_id", "writes")
+
+    def __init__(self, checkpoint: Checkpoint, metadata: CheckpointMetadata, parent_id: Optional[str]):
+        self.checkpoint = checkpoint
+        self.metadata = metadata
+        self.parent_id = parent_id
+        # (task_id, idx) -> (task_id, channel, value)
+        self.writes: Dict[Tuple[str, int], Tuple[str, str, Any]] = {}
+
+
+class _ThreadBuffer:
+    """单个会话的缓冲：按顺序排队的写操作 + 各 namespace 最新的 checkpoint"""
+
+    def __init__(self):
+        self.ops: List[Tuple[str, tuple]] = []
+        self.entries: Dict[Tuple[str, str], _Entry] = {}
+        self.latest: Dict[str, str] = {}
+        self.last_used = time.monotonic()
+        # 同一会话的刷写串行执行，保证写入顺序
+        self.flush_lock = asyncio.Lock()
+
+
+def _thread_key(config: RunnableConfig) -> Tuple[str, str]:
+    configurable = config["configurable"]
+    return configurable["thread_id"], configurable.get("checkpoint_ns", "")
+
+
+class WriteBehindSaver(BaseCheckpointSaver):
+    """在 backend（通常为 AsyncPostgresSaver）前缓冲写入的 checkpointer"""
+
+    def __init__(
+        self,
+        backend: BaseCheckpointSaver,
+        flush_interval: float = CHECKPOINT_FLUSH_INTERVAL,
+        max_pending: int = CHECKPOINT_MAX_PENDING,
+        idle_ttl: float = CHECKPOINT_IDLE_TTL,
+    ):
+        super().__init__(serde=backend.serde)
+        self.backend = backend
+        self.flush_interval = flush_interval
+        self.max_pending = max(1, max_pending)
+        self.idle_ttl = idle_ttl
+        self._buffers: Dict[str, _ThreadBuffer] = {}
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._timer: Optional[asyncio.Task] = None
+        self.read_hits = 0
+        self.read_misses = 0
+        self.flushes = 0
+        self.flushed_ops = 0
+        self.flush_seconds = 0.0
+        self.flush_failures = 0
+        self.consecutive_failures = 0
+        self.last_error: Optional[str] = None
+        self.last_failure_at: Optional[float] = None
+        self.backpressure_waits = 0
+        self.rejected_writes = 0
+
+    # ---- 内存状态 ----
+
+    def _remember_put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata) -> _ThreadBuffer:
+        thread_id, checkpoint_ns = _thread_key(config)
+        buffer = self._buffers.get(thread_id)
+        if buffer is None:
+            buffer = self._buffers[thread_id] = _ThreadBuffer()
+        entry = _Entry(checkpoint, get_serializable_checkpoint_metadata(config, metadata), config["configurable"].get("checkpoint_id"))
+        buffer.entries[(checkpoint_ns, checkpoint["id"])] = entry
+        buffer.latest[checkpoint_ns] = checkpoint["id"]
+        buffer.last_used = time.monotonic()
+        return buffer
+
+    def _remember_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str) -> _ThreadBuffer:
+        thread_id, checkpoint_ns = _thread_key(config)
+        buffer = self._buffers.get(thread_id)
+        if buffer is None:
+            buffer = self._buffers[thread_id] = _ThreadBuffer()
+        entry = buffer.entries.get((checkpoint_ns, config["configurable"]["checkpoint_id"]))
+        if entry is not None:
+            # 与 Postgres 的语义一致：特殊通道（负 idx）覆盖，普通写入已存在时忽略
+            for idx, (channel, value) in enumerate(writes):
+                key = (task_id, WRITES_IDX_MAP.get(channel, idx))
+                if key[1] >= 0 and key in entry.writes:
+                    continue
+                entry.writes[key] = (task_id, channel, value)
+        buffer.last_used = time.monotonic()
+        return buffer
+
+    def _lookup(self, config: RunnableConfig) -> Tuple[Optional[CheckpointTuple], bool]:
+        """从内存读取 checkpoint，返回 (命中的 tuple, 该会话是否有未刷写的操作)"""
+        thread_id, checkpoint_ns = _thread_key(config)
+        with self._lock:
+            buffer = self._buffers.get(thread_id)
+            if buffer is None:
+                self.read_misses += 1
+                return None, False
+            buffer.last_used = time.monotonic()
+            checkpoint_id = get_checkpoint_id(config) or buffer.latest.get(checkpoint_ns)
+            entry = buffer.entries.get((checkpoint_ns, checkpoint_id)) if checkpoint_id else None
+            if entry is None:
+                self.read_misses += 1
+                return None, bool(buffer.ops)
+            self.read_hits += 1
+            writes = list(entry.writes.values())
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}},
+            checkpoint=entry.checkpoint,
+            metadata=entry.metadata,
+            parent_config=(
+                {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": entry.parent_id}}
+                if entry.parent_id
+                else None
+            ),
+            pending_writes=writes,
+        ), False
+
+    # ---- 刷写 ----
+
+    def _ensure_timer(self):
+        if self.flush_interval <= 0 or (self._timer is not None and not self._timer.done()):
+            return
+        self._timer = asyncio.get_running_loop().create_task(self._flush_periodically())
+
+    async def _flush_periodically(self):
+        """后台定时刷写；没有缓冲的会话时退出，下次写入时重新启动"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.aflush()
+            except Exception as e:
+                logger.warning(f"Background checkpoint flush failed, will retry: {e}")
+            self._evict_idle()
+            with self._lock:
+                if not self._buffers:
+                    return
+
+    def _evict_idle(self):
+        deadline = time.monotonic() - self.idle_ttl
+        with self._lock:
+            for thread_id in [t for t, b in self._buffers.items() if not b.ops and b.last_used < deadline]:
+                del self._buffers[thread_id]
+
+    async def _apply(self, ops: List[Tuple[str, tuple]]):
+        """执行一批写操作：Postgres 后端在一个连接、一个事务内以 pipeline 方式执行"""
+        if not isinstance(self.backend, AsyncPostgresSaver):
+            for kind, args in ops:
+                await (self.backend.aput if kind == "put" else self.backend.aput_writes)(*args)
+            return
+        async with _ainternal.get_connection(self.backend.conn) as conn:
+            async with conn.transaction(), conn.pipeline() as pipe:
+                saver = AsyncPostgresSaver(conn, pipe=pipe, serde=self.backend.serde)
+                for kind, args in ops:
+                    await (saver.aput if kind == "put" else saver.aput_writes)(*args)
+
+    async def _flush_thread(self, thread_id: str) -> int:
+        with self._lock:
+            buffer = self._buffers.get(thread_id)
+        if buffer is None:
+            return 0
+        async with buffer.flush_lock:
+            with self._lock:
+                ops, buffer.ops = buffer.ops, []
+            if not ops:
+                return 0
+            started = time.perf_counter()
+            try:
+                await self._apply(ops)
+            except BaseException as e:
+                # 放回队首，下次刷写时按原顺序重试
+                with self._lock:
+                    buffer.ops[:0] = ops
+                    if not isinstance(e, asyncio.CancelledError):
+                        self.flush_failures += 1
+                        self.consecutive_failures += 1
+                        self.last_error = f"{type(e).__name__}: {e}"
+                        self.last_failure_at = time.time()
+                raise
+            with self._lock:
+                self._pending -= len(ops)
+                self.consecutive_failures = 0
+                self.flushes += 1
+                self.flushed_ops += len(ops)
+                self.flush_seconds += time.perf_counter() - started
+                # 已落库的旧 checkpoint 不再保留在内存中，只留各 namespace 的最新一个
+                keep = {(ns, checkpoint_id) for ns, checkpoint_id in buffer.latest.items()}
+                buffer.entries = {key: entry for key, entry in buffer.entries.items() if key in keep}
+            return len(ops)
+
+    async def aflush(self, thread_id: Optional[str] = None) -> int:
+        """刷写指定会话（None 表示全部会话）的缓冲，返回写入的操作数；失败时抛出最后一个异常"""
+        if thread_id is not None:
+            return await self._flush_thread(thread_id)
+        with self._lock:
+            thread_ids = [t for t, b in self._buffers.items() if b.ops]
+        results = await asyncio.gather(*(self._flush_thread(t) for t in thread_ids), return_exceptions=True)
+        errors = [r for r in results if isinstance(r, BaseException)]
+        if errors:
+            raise errors[-1]
+        return sum(results)
+
+    async def _reserve(self):
+        """
+        写入前确认缓冲还有空间：已满时先刷写（背压）；刷写失败、缓冲仍是满的时拒绝本次写入。
+        检查之后到入队之间没有 await，缓冲总量不会超过 max_pending
+        """
+        self._ensure_timer()
+        while self._pending >= self.max_pending:
+            self.backpressure_waits += 1
+            try:
+                await self.aflush()
+            except Exception as e:
+                if self._pending >= self.max_pending:
+                    self.rejected_writes += 1
+                    raise CheckpointBacklogError(
+                        f"checkpoint buffer is full ({self._pending} pending) and flushing failed: {e}"
+                    ) from e
+
+    # ---- 异步接口 ----
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        cached, pending = self._lookup(config)
+        if cached is not None:
+            return cached
+        if pending:
+            # 请求的 checkpoint 不在内存中，但可能依赖未刷写的写入
+            await self._flush_thread(config["configurable"]["thread_id"])
+        return await self.backend.aget_tuple(config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        if config and config.get("configurable", {}).get("thread_id"):
+            await self._flush_thread(config["configurable"]["thread_id"])
+        else:
+            await self.aflush()
+        async for item in self.backend.alist(config, filter=filter, before=before, limit=limit):
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        # 与 AsyncPostgresSaver 相同的浅拷贝，后续步骤不会改动已缓冲的 checkpoint
+        checkpoint = {**checkpoint, "channel_values": checkpoint["channel_values"].copy()}
+        await self._reserve()
+        with self._lock:
+            buffer = self._remember_put(config, checkpoint, metadata)
+            buffer.ops.append(("put", (config, checkpoint, metadata, new_versions)))
+            self._pending += 1
+        thread_id, checkpoint_ns = _thread_key(config)
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"]}}
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        writes = list(writes)
+        await self._reserve()
+        with self._lock:
+            buffer = self._remember_writes(config, writes, task_id)
+            buffer.ops.append(("writes", (config, writes, task_id, task_path)))
+            self._pending += 1
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            buffer = self._buffers.pop(thread_id, None)
+            if buffer is not None:
+                self._pending -= len(buffer.ops)
+        await self.backend.adelete_thread(thread_id)
+
+    # ---- 同步接口：直接写入 backend，同时更新内存中的最新 checkpoint ----
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        cached, _pending = self._lookup(config)
+        return cached if cached is not None else self.backend.get_tuple(config)
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        return self.backend.list(config, filter=filter, before=before, limit=limit)
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        next_config = self.backend.put(config, checkpoint, metadata, new_versions)
+        with self._lock:
+            self._remember_put(config, {**checkpoint, "channel_values": checkpoint["channel_values"].copy()}, metadata)
+        return next_config
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        self.backend.put_writes(config, writes, task_id, task_path)
+        with self._lock:
+            self._remember_writes(config, list(writes), task_id)
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            buffer = self._buffers.pop(thread_id, None)
+            if buffer is not None:
+                self._pending -= len(buffer.ops)
+        self.backend.delete_thread(thread_id)
+
+    def get_next_version(self, current: Optional[str], channel: None) -> str:
+        return self.backend.get_next_version(current, channel)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "mode": "write_behind",
+                "threads": len(self._buffers),
+                "pending_ops": self._pending,
+                "max_pending": self.max_pending,
+                "flush_interval": self.flush_interval,
+                "flushes": self.flushes,
+                "flushed_ops": self.flushed_ops,
+                "avg_batch": round(self.flushed_ops / self.flushes, 1) if self.flushes else None,
+                "avg_flush_ms": round(self.flush_seconds / self.flushes * 1000, 2) if self.flushes else None,
+                "flush_failures": self.flush_failures,
+                # 最近一次刷写失败之后还没有成功刷写过：缓冲只增不减，满后拒绝写入
+                "degraded": self.consecutive_failures > 0,
+                "consecutive_failures": self.consecutive_failures,
+                "last_error": self.last_error,
+                "last_failure_at": self.last_failure_at,
+                "backpressure_waits": self.backpressure_waits,
+                "rejected_writes": self.rejected_writes,
+                "read_hits": self.read_hits,
+                "read_misses": self.read_misses,
+            }
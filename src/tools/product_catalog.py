@@ -0,0 +1,266 @@
+"""
+Product Catalog
+进程内产品目录：从 config/product_catalog.json 加载，按应用、机器类型、机速档位、涂胶方式建立倒排索引，
+以 search_products 工具注册到 Agent。产品信息不再写进系统提示词，模型需要时才查询
+
+- 查询只做字典查找与小词表扫描，单次耗时为微秒级，不依赖任何外部服务
+- 目录文件修改后自动重新加载（按 mtime，最多每 CATALOG_RELOAD_INTERVAL 秒检查一次），加载失败时保留旧目录
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from langchain_core.tools import tool
+
+logger = logging.getLogger(__name__)
+
+PRODUCT_CATALOG = "config/product_catalog.json"
+# 目录文件变化检查间隔（秒），0 表示只在首次使用时加载
+CATALOG_RELOAD_INTERVAL = float(os.getenv("CATALOG_RELOAD_INTERVAL", "5"))
+# 单次查询返回的最大产品数
+CATALOG_MAX_RESULTS = int(os.getenv("CATALOG_MAX_RESULTS", "3"))
+
+# 倒排索引的字段：查询参数名 -> 产品数据中的列表字段
+INDEXED_FIELDS = {
+    "application": "applications",
+    "machine_type": "machine_types",
+    "speed_band": "speed_bands",
+    "coating_method": "coating_methods",
+}
+
+_SEPARATORS = re.compile(r"[\s\-_/]+")
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+
+
+def normalize_term(text: str) -> str:
+    """小写，连字符 / 下划线 / 斜杠与空白统一为单个空格（"Semi-Automatic" == "semi automatic"）"""
+    return _SEPARATORS.sub(" ", text.strip().lower())
+
+
+def model_key(text: str) -> str:
+    """型号归一化："QL-118GH"、"ql 118gh"、"QL118GH" 得到相同的键"""
+    return _NON_ALNUM.sub("", text.lower())
+
+
+class ProductCatalog:
+    """不可变的目录快照：产品列表 + 倒排索引（重新加载时整体替换）"""
+
+    def __init__(self, data: Dict[str, Any], source: str = ""):
+        self.source = source
+        self.version = data.get("version")
+        self.url_base: str = data.get("url_base", "")
+        self.products: List[Dict[str, Any]] = list(data.get("products", []))
+        self.speed_bands: List[Dict[str, Any]] = list(data.get("speed_bands", []))
+        # 字段 -> 归一化词 -> 产品序号集合
+        self.index: Dict[str, Dict[str, Set[int]]] = {field: {} for field in INDEXED_FIELDS}
+        # 字段 -> 别名 / 规范词 -> 规范词
+        self.vocabulary: Dict[str, Dict[str, str]] = {field: {} for field in INDEXED_FIELDS}
+        self.models: Dict[str, int] = {}
+
+        for i, product in enumerate(self.products):
+            if not product.get("model"):
+                raise ValueError(f"product #{i} has no model")
+            for key in (product["model"], product.get("name", ""), product.get("slug", "")):
+                if key:
+                    self.models[model_key(key)] = i
+            for field, attr in INDEXED_FIELDS.items():
+                for term in product.get(attr, []):
+                    canonical = normalize_term(term)
+                    self.index[field].setdefault(canonical, set()).add(i)
+                    self.vocabulary[field][canonical] = canonical
+
+        for field, aliases in (data.get("aliases") or {}).items():
+            if field not in self.vocabulary:
+                raise ValueError(f"aliases for unknown field {field!r}")
+            for canonical, names in aliases.items():
+                for name in names:
+                    self.vocabulary[field][normalize_term(name)] = normalize_term(canonical)
+        # 子串匹配时优先匹配较长的词（"paper bag machine" 命中 "paper bag" 而不是 "bag"）
+        self._terms_by_length = {
+            field: sorted(vocab, key=len, reverse=True) for field, vocab in self.vocabulary.items()
+        }
+
+    @classmethod
+    def load(cls, path: str) -> "ProductCatalog":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f), source=path)
+
+    def url(self, product: Dict[str, Any]) -> str:
+        return self.url_base + product.get("slug", model_key(product["model"]))
+
+    def resolve_terms(self, field: str, text: str) -> List[str]:
+        """把查询文本映射为索引中的规范词：先整词查找，再按词表做子串匹配"""
+        query = normalize_term(text)
+        if not query:
+            return []
+        vocab = self.vocabulary[field]
+        if query in vocab:
+            return [vocab[query]]
+        matched: List[str] = []
+        for term in self._terms_by_length[field]:
+            if term in query and vocab[term] not in matched:
+                matched.append(vocab[term])
+                query = query.replace(term, " ")
+        return matched
+
+    def speed_band(self, speed: float) -> Optional[str]:
+        for band in self.speed_bands:
+            if band.get("min", 0) <= speed < band.get("max", float("inf")):
+                return band["name"]
+        return None
+
+    def get(self, model: str) -> Optional[Dict[str, Any]]:
+        i = self.models.get(model_key(model))
+        return None if i is None else self.products[i]
+
+    def search(
+        self,
+        application: str = "",
+        machine_type: str = "",
+        speed_m_min: float = 0,
+        coating_method: str = "",
+        limit: Optional[int] = None,
+    ) -> List[Tuple[Dict[str, Any], List[str]]]:
+        """
+        按条件检索产品，返回 [(产品, 命中的字段)]，按命中字段数降序
+
+        未给出任何条件时返回空列表；给出的条件都未命中时也返回空列表；最多返回 limit（默认 CATALOG_MAX_RESULTS）个
+        """
+        criteria: Dict[str, List[str]] = {}
+        for field, text in (("application", application), ("machine_type", machine_type), ("coating_method", coating_method)):
+            if text:
+                criteria[field] = self.resolve_terms(field, text)
+        if speed_m_min and speed_m_min > 0:
+            band = self.speed_band(speed_m_min)
+            criteria["speed_band"] = [band] if band else []
+
+        hits: Dict[int, List[str]] = {}
+        for field, terms in criteria.items():
+            matched: Set[int] = set()
+            for term in terms:
+                matched |= self.index[field].get(term, set())
+            for i in matched:
+                hits.setdefault(i, []).append(field)
+        ranked = sorted(hits.items(), key=lambda item: (-len(item[1]), item[0]))
+        return [(self.products[i], fields) for i, fields in ranked[:CATALOG_MAX_RESULTS if limit is None else limit]]
+
+    def describe(self, product: Dict[str, Any]) -> str:
+        """产品的单行描述（工具返回给模型的文本，尽量紧凑）"""
+        parts = [f"{product.get('name', product['model'])} ({self.url(product)})"]
+        if product.get("summary"):
+            parts.append(product["summary"])
+        labels = (("applications", "applications"), ("machine_types", "machine"), ("speed_bands", "speed"), ("coating_methods", "coating"))
+        for attr, label in labels:
+            if product.get(attr):
+                parts.append(f"{label}: {', '.join(product[attr])}")
+        return " | ".join(parts)
+
+
+class CatalogStore:
+    """持有当前目录快照，文件变化时重新加载"""
+
+    def __init__(self, path: Optional[str] = None, interval: float = CATALOG_RELOAD_INTERVAL):
+        self.path = path or os.path.join(os.getenv("COZE_WORKSPACE_PATH", "/workspace/projects"), PRODUCT_CATALOG)
+        self.interval = interval
+        self._catalog: Optional[ProductCatalog] = None
+        self._stat = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.lookup_seconds = 0.0
+        self.reloads = 0
+        self.last_error: Optional[str] = None
+
+    def _file_stat(self):
+        try:
+            st = os.stat(self.path)
+            return st.st_mtime_ns, st.st_size
+        except OSError:
+            return None
+
+    def current(self) -> ProductCatalog:
+        now = time.monotonic()
+        if self._catalog is not None and (self.interval <= 0 or now - self._checked < self.interval):
+            return self._catalog
+        with self._lock:
+            self._checked = now
+            stat = self._file_stat()
+            if self._catalog is None or stat != self._stat:
+                self._stat = stat
+                try:
+                    self._catalog = ProductCatalog.load(self.path)
+                    self.reloads += 1
+                    self.last_error = None
+                    logger.info(f"Loaded product catalog from {self.path} ({len(self._catalog.products)} products)")
+                except (OSError, ValueError) as e:
+                    self.last_error = f"{type(e).__name__}: {e}"
+                    if self._catalog is None:
+                        logger.warning(f"Failed to load product catalog ({e}), catalog is empty")
+                        self._catalog = ProductCatalog({}, source="empty")
+                    else:
+                        logger.error(f"Rejected product catalog change, keeping previous catalog: {e}")
+            return self._catalog
+
+    def record_lookup(self, elapsed: float):
+        self.lookups += 1
+        self.lookup_seconds += elapsed
+
+    def stats(self) -> Dict[str, Any]:
+        catalog = self._catalog
+        return {
+            "products": len(catalog.products) if catalog else 0,
+            "version": catalog.version if catalog else None,
+            "lookups": self.lookups,
+            "avg_lookup_us": round(self.lookup_seconds / self.lookups * 1e6, 1) if self.lookups else None,
+            "reloads": self.reloads,
+            "last_error": self.last_error,
+        }
+
+
+_catalog_store = CatalogStore()
+
+
+def get_catalog_store() -> CatalogStore:
+    return _catalog_store
+
+
+def format_results(catalog: ProductCatalog, results: Iterable[Tuple[Dict[str, Any], List[str]]]) -> str:
+    lines = [f"- {catalog.describe(product)} [matched: {', '.join(fields)}]" for product, fields in results]
+    return "\n".join(lines)
+
+
+@tool
+def search_products(
+    application: str = "",
+    machine_type: str = "",
+    speed_m_min: float = 0,
+    coating_method: str = "",
+    model: str = "",
+) -> str:
+    """Look up adhesives in the product catalog.
+
+    Use it before recommending a product. Pass whatever the customer told you:
+    application (e.g. "paper bag", "side seam"), machine_type (e.g. "semi-automatic"),
+    speed_m_min (machine speed in m/min), coating_method (e.g. "roller"),
+    or model to get one product's details (e.g. "QL-118GH").
+    Returns matching products with their product links.
+    """
+    catalog = _catalog_store.current()
+    started = time.perf_counter()
+    if model:
+        product = catalog.get(model)
+        text = f"- {catalog.describe(product)}" if product else f"No product with model {model!r} in the catalog."
+    else:
+        results = catalog.search(application, machine_type, speed_m_min, coating_method)
+        text = format_results(catalog, results) or "No catalog product matches these requirements; ask the customer for more details."
+    _catalog_store.record_lookup(time.perf_counter() - started)
+    return text
+
+
+# 按名称注册的工具（agent_llm_config.json 的 tools 字段引用这些名称）
+CATALOG_TOOLS = {search_products.name: search_products}
@@ -0,0 +1,255 @@
+"""
+Admission Control
+LLM 调用的准入控制：全局并发上限 + 有界等待队列（带排队超时）+ 按 IP / 会话的令牌桶限流
+
+按 IP 限流使用的客户端地址只信任可信代理（FORWARDED_ALLOW_IPS）写入的转发头，客户端自带的头无法绕过限流
+
+所有方法都在单个事件循环内调用，无需加锁；超限时抛出 AdmissionRejected，
+由 HTTP 层转换为 429 + Retry-After
+"""
+
+import asyncio
+import ipaddress
+import logging
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Deque, Dict, List, Optional, Union
+
+from cachetools import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# 单进程内同时进行的模型调用上限，0 表示不限
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "32"))
+# 等待队列长度上限，队列满时直接拒绝
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+# 排队超时（秒），超时未获得执行槽位的请求被拒绝
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10"))
+# 令牌桶：每秒补充的令牌数与桶容量，rate 为 0 表示不限流
+RATE_LIMIT_IP_RATE = float(os.getenv("RATE_LIMIT_IP_RATE", "1"))
+RATE_LIMIT_IP_BURST = int(os.getenv("RATE_LIMIT_IP_BURST", "20"))
+RATE_LIMIT_SESSION_RATE = float(os.getenv("RATE_LIMIT_SESSION_RATE", "0.5"))
+RATE_LIMIT_SESSION_BURST = int(os.getenv("RATE_LIMIT_SESSION_BURST", "6"))
+# 可信反向代理的地址（逗号分隔的 IP / 网段，* 表示信任所有来源），同时作为 uvicorn 的 forwarded_allow_ips
+FORWARDED_ALLOW_IPS = os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1")
+
+# 统计排队耗时分位数时保留的最近样本数
+_WAIT_SAMPLES = 1024
+
+
+class AdmissionRejected(Exception):
+    """请求未被准入（对应 HTTP 429）"""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"Server busy ({reason}), retry after {math.ceil(retry_after)}s")
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class AdmissionController:
+    """全局并发上限与有界 FIFO 等待队列"""
+
+    def __init__(
+        self,
+        max_in_flight: int = ADMISSION_MAX_IN_FLIGHT,
+        max_queue: int = ADMISSION_MAX_QUEUE,
+        queue_timeout: float = ADMISSION_QUEUE_TIMEOUT,
+    ):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._wait_samples: Deque[float] = deque(maxlen=_WAIT_SAMPLES)
+        # 槽位占用时长的指数滑动平均，用于估算 Retry-After
+        self._hold_ewma = 5.0
+        self.admitted = 0
+        self.queued = 0
+        self.rejected_queue_full = 0
+        self.rejected_queue_timeout = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def _saturated(self) -> bool:
+        return 0 < self.max_in_flight <= self.in_flight
+
+    def _retry_after(self) -> float:
+        """按当前排队深度与平均占用时长估算重试等待时间"""
+        slots = max(1, self.max_in_flight)
+        return (self.queue_depth + 1) * self._hold_ewma / slots
+
+    def check_capacity(self):
+        """快速检查：执行槽位已满且等待队列也已满时立即拒绝"""
+        if self._saturated() and self.queue_depth >= self.max_queue:
+            self.rejected_queue_full += 1
+            raise AdmissionRejected("queue_full", self._retry_after())
+
+    async def acquire(self):
+        """获取执行槽位，必要时排队等待；队列满或排队超时抛出 AdmissionRejected"""
+        if not self._saturated() and not self._waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            self._wait_samples.append(0.0)
+            return
+
+        self.check_capacity()
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        self.queued += 1
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.queue_timeout)
+        except asyncio.TimeoutError:
+            # 超时与转交可能发生在同一轮循环内，已拿到槽位时照常执行
+            if not future.done():
+                future.cancel()
+                self._waiters.remove(future)
+                self.rejected_queue_timeout += 1
+                raise AdmissionRejected("queue_timeout", self._retry_after())
+        except asyncio.CancelledError:
+            if future.done():
+                # 已被转交槽位但请求被取消，继续转交给下一个等待者
+                self.release()
+            else:
+                future.cancel()
+                self._waiters.remove(future)
+            raise
+        # release() 已把槽位转交给本请求（in_flight 不变）
+        self.admitted += 1
+        self._wait_samples.append(time.monotonic() - started)
+
+    def release(self, held: Optional[float] = None):
+        """释放槽位：有等待者时按 FIFO 直接转交，否则归还"""
+        if held is not None:
+            self._hold_ewma = 0.9 * self._hold_ewma + 0.1 * held
+        while self._waiters:
+            future = self._waiters.popleft()
+            if not future.done():
+                future.set_result(True)
+                return
+        self.in_flight -= 1
+
+    @asynccontextmanager
+    async def slot(self):
+        """async with admission.slot(): 持有一个执行槽位"""
+        await self.acquire()
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
+
+    def stats(self) -> Dict[str, Any]:
+        samples = sorted(self._wait_samples)
+
+        def percentile(p: float) -> float:
+            if not samples:
+                return 0.0
+            return round(samples[min(len(samples) - 1, int(p * len(samples)))], 4)
+
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "queue_depth": self.queue_depth,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_queue_timeout": self.rejected_queue_timeout,
+            "wait_p50": percentile(0.5),
+            "wait_p95": percentile(0.95),
+            "wait_max": round(samples[-1], 4) if samples else 0.0,
+            "hold_avg": round(self._hold_ewma, 3),
+        }
+
+
+class RateLimiter:
+    """按 key（IP / 会话）的令牌桶限流，长时间不活跃的 key 自动淘汰"""
+
+    def __init__(self, name: str, rate: float, burst: int, max_keys: int = 10000):
+        self.name = name
+        self.rate = rate
+        self.burst = max(1, burst)
+        # 桶在 burst/rate 秒后必然回满，之后淘汰与新建等价
+        ttl = self.burst / rate if rate > 0 else 1
+        self._buckets: TTLCache = TTLCache(maxsize=max_keys, ttl=ttl)
+        self.rejected = 0
+
+    def check(self, key: Optional[str]):
+        """消耗一个令牌，令牌不足时抛出 AdmissionRejected"""
+        if self.rate <= 0 or not key:
+            return
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (float(self.burst), now))
+        tokens = min(float(self.burst), tokens + (now - updated) * self.rate)
+        if tokens < 1:
+            self.rejected += 1
+            self._buckets[key] = (tokens, now)
+            raise AdmissionRejected(f"rate_limited_{self.name}", (1 - tokens) / self.rate)
+        self._buckets[key] = (tokens - 1, now)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"tracked_keys": len(self._buckets), "rejected": self.rejected}
+
+
+Network = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+
+def parse_trusted_proxies(value: str) -> List[Network]:
+    """解析可信代理列表，* 表示所有地址"""
+    networks: List[Network] = []
+    for item in value.split(","):
+        item = item.strip()
+        if item == "*":
+            return [ipaddress.ip_network("0.0.0.0/0"), ipaddress.ip_network("::/0")]
+        if not item:
+            continue
+        try:
+            networks.append(ipaddress.ip_network(item, strict=False))
+        except ValueError:
+            logger.warning(f"Ignoring invalid FORWARDED_ALLOW_IPS entry {item!r}")
+    return networks
+
+
+_trusted_proxies = parse_trusted_proxies(FORWARDED_ALLOW_IPS)
+
+
+def is_trusted_proxy(addr: Optional[str], trusted: Optional[List[Network]] = None) -> bool:
+    trusted = _trusted_proxies if trusted is None else trusted
+    if not addr:
+        return False
+    try:
+        ip = ipaddress.ip_address(addr.strip())
+    except ValueError:
+        return False
+    return any(ip in network for network in trusted)
+
+
+def client_ip(headers, remote_addr: Optional[str], trusted: Optional[List[Network]] = None) -> Optional[str]:
+    """
+    客户端 IP：只在直接连接方是可信代理时才读取转发头
+
+    - Fly-Client-IP（Fly 代理注入，覆盖客户端自带的同名头）
+    - X-Forwarded-For 从右往左第一个不是可信代理的地址（最近一个可信代理追加的地址，左侧各项可由客户端伪造）
+    uvicorn 启用 proxy_headers 时 ASGI 的连接地址已按同样规则改写为客户端地址，此时直接返回
+    """
+    trusted = _trusted_proxies if trusted is None else trusted
+    if not is_trusted_proxy(remote_addr, trusted):
+        return remote_addr
+    fly_ip = headers.get("Fly-Client-IP")
+    if fly_ip:
+        return fly_ip.strip()
+    forwarded = headers.get("X-Forwarded-For")
+    if forwarded:
+        hops = [hop.strip() for hop in forwarded.split(",") if hop.strip()]
+        for hop in reversed(hops):
+            if not is_trusted_proxy(hop, trusted):
+                return hop
+        if hops:
+            return hops[0]
+    return remote_addr
@@ -0,0 +1,135 @@
+"""
+Language Detection
+本地轻量语言识别（无模型、无网络），用于按会话语言裁剪系统提示词与模型分档路由
+
+- 独有文字（泰文、高棉文、缅甸文、天城文、韩文、假名等）按 Unicode 区段直接判定
+- 汉字按繁体专用字区分简 / 繁；西里尔字母按哈萨克 / 乌兹别克专用字母区分
+- 拉丁字母语言按常用词与特征字母打分，信号不足时返回 None（由调用方回退到全量提示词）
+"""
+
+import re
+from typing import Dict, Optional, Tuple
+
+_LETTER = re.compile(r"[^\W\d_]")
+_WORD = re.compile(r"[^\W\d_]+")
+_CJK = re.compile(r"[㐀-鿿豈-﫿]")
+_LATIN = re.compile(r"[A-Za-zÀ-ɏḀ-ỿ]")
+
+# (语言代码, Unicode 区段)：出现即可确定语言的文字
+_SCRIPTS: Tuple[Tuple[str, str, str], ...] = (
+    ("th", "฀", "๿"),
+    ("lo", "຀", "໿"),
+    ("km", "ក", "៿"),
+    ("my", "က", "႟"),
+    ("hi", "ऀ", "ॿ"),
+    ("bn", "ঀ", "৿"),
+    ("el", "Ͱ", "Ͽ"),
+    ("ko", "가", "힯"),
+    ("ja", "぀", "ヿ"),
+)
+
+# 繁体中文专用的常用字（简体中不会出现）
+_TRADITIONAL = set("們嗎麼說這個國買賣價機請謝語與為對會時樣點幫紙膠問題號聯給發錢貨運單產種類應該還沒關開門見長東車書學習電話網頁")
+# 哈萨克语 / 乌兹别克语西里尔专用字母
+_KAZAKH = set("әғқңөұүһі")
+_UZBEK = set("ўҳ")
+
+# 拉丁字母语言的常用词（小写）
+_STOPWORDS: Dict[str, frozenset] = {
+    "en": frozenset("the and is are you your i we our to of for in on with what which how can do does need have this that it my me please hello hi thanks thank".split()),
+    "fr": frozenset("le la les et est vous nous je de des du pour dans avec une un que qui quel bonjour merci sur pas".split()),
+    "de": frozenset("der die das und ist sie wir ich nicht mit für ein eine zu von auf was wie hallo danke guten tag bitte".split()),
+    "es": frozenset("el la los las y es usted nosotros yo de para con una un que qué por hola gracias cómo necesito".split()),
+    "pt": frozenset("o a os as e é você nós eu de para com uma um que não olá obrigado obrigada oi como preciso".split()),
+    "it": frozenset("il lo la gli le e è lei noi io di per con una un che non ciao grazie come sono".split()),
+    "nl": frozenset("de het een en is u wij ik niet met voor van wat hoe goedendag dank bedankt hallo".split()),
+    "pl": frozenset("i jest pan pani my ja nie z dla w na co jak dzień dobry dziękuję czy".split()),
+    "cs": frozenset("a je vy my já ne s pro v na co jak ahoj děkuji dobrý den".split()),
+    "ro": frozenset("și este dumneavoastră noi eu nu cu pentru în pe ce cum bună ziua mulțumesc".split()),
+    "sv": frozenset("och är ni vi jag inte med för en ett på vad hur hej tack".split()),
+    "no": frozenset("og er dere vi jeg ikke med for en et på hva hvordan hei takk".split()),
+    "fi": frozenset("ja on te me minä ei kanssa mitä miten hei kiitos tarvitsen".split()),
+    "id": frozenset("dan adalah anda kami saya tidak dengan untuk di ke apa bagaimana halo selamat terima kasih yang".split()),
+    "vi": frozenset("và là bạn chúng tôi không với cho của gì như thế nào xin chào cảm ơn".split()),
+    "tl": frozenset("at ang ng mga ako ikaw kami hindi sa para ano paano kamusta salamat po magandang umaga".split()),
+}
+
+# 拉丁字母语言的特征字母（出现一次加分）
+_LATIN_CHARS: Dict[str, str] = {
+    "vi": "ăâđêôơưạảấầẩẫậắằẳẵặẹẻẽếềểễệỉịọỏốồổỗộớờởỡợụủứừửữựỳỵỷỹ",
+    "pl": "ąęłńśźż",
+    "cs": "řěůčšžď",
+    "ro": "șțşţ",
+    "de": "ß",
+    "es": "ñ¿¡",
+    "pt": "ãõ",
+    "fr": "œèêëîï",
+    "no": "æø",
+    "sv": "å",
+}
+
+# 拉丁字母语言判定所需的最低分（常用词命中数 + 特征字母数）
+MIN_LATIN_SCORE = 2
+
+
+def detect_script(text: str) -> str:
+    """粗略判断文本书写系统：latin / cjk / other（无字母时返回 latin）"""
+    letters = _LETTER.findall(text)
+    if not letters:
+        return "latin"
+    cjk = sum(1 for c in letters if _CJK.match(c))
+    latin = sum(1 for c in letters if _LATIN.match(c))
+    if cjk * 2 >= len(letters):
+        return "cjk"
+    if latin * 2 >= len(letters):
+        return "latin"
+    return "other"
+
+
+def _detect_latin(text: str) -> Optional[str]:
+    lowered = text.lower()
+    words = _WORD.findall(lowered)
+    scores: Dict[str, int] = {}
+    for code, stopwords in _STOPWORDS.items():
+        score = sum(1 for w in words if w in stopwords)
+        chars = _LATIN_CHARS.get(code)
+        if chars:
+            score += sum(2 for c in lowered if c in chars)
+        if score:
+            scores[code] = score
+    if not scores:
+        return None
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    code, best = ranked[0]
+    # 分数不足或与第二名持平（如 "hei" 同时属于挪威语与芬兰语）时不判定
+    if best < MIN_LATIN_SCORE or (len(ranked) > 1 and ranked[1][1] == best):
+        return None
+    return code
+
+
+def detect_language(text: str) -> Optional[str]:
+    """
+    返回语言代码（en/fr/th/zh-Hans/zh-Hant/ru/...），无法可靠判定时返回 None
+
+    只看前 500 个字符，单次耗时约 0.1 毫秒
+    """
+    sample = text[:500]
+    if not sample.strip():
+        return None
+    for code, low, high in _SCRIPTS:
+        if any(low <= c <= high for c in sample):
+            return code
+    letters = _LETTER.findall(sample)
+    if not letters:
+        return None
+    cjk = [c for c in letters if _CJK.match(c)]
+    if len(cjk) * 2 >= len(letters):
+        return "zh-Hant" if any(c in _TRADITIONAL for c in cjk) else "zh-Hans"
+    cyrillic = [c.lower() for c in letters if "Ѐ" <= c <= "ӿ"]
+    if len(cyrillic) * 2 >= len(letters):
+        if any(c in _KAZAKH for c in cyrillic):
+            return "kk"
+        if any(c in _UZBEK for c in cyrillic) or "салом" in sample.lower():
+            return "uz"
+        return "ru"
+    return _detect_latin(sample)
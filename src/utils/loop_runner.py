@@ -0,0 +1,87 @@
+"""
+Background Event Loop Runner
+在独立线程中运行一个常驻事件循环，供同步代码（Flask 视图、CLI）提交协程
+"""
+
+import asyncio
+import concurrent.futures
+import logging
+import threading
+from typing import Any, AsyncIterator, Coroutine, Iterator, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class LoopRunner:
+    """进程内共享的后台事件循环，所有异步调用都在同一个循环上执行"""
+
+    def __init__(self, name: str = "loop-runner"):
+        self._name = name
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """获取后台事件循环，首次访问时启动线程"""
+        if self._loop is not None:
+            return self._loop
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                started = threading.Event()
+
+                def _run():
+                    asyncio.set_event_loop(loop)
+                    loop.call_soon(started.set)
+                    loop.run_forever()
+
+                self._thread = threading.Thread(target=_run, name=self._name, daemon=True)
+                self._thread.start()
+                started.wait()
+                self._loop = loop
+                logger.info(f"Background event loop started: {self._name}")
+        return self._loop
+
+    def submit(self, coro: Coroutine[Any, Any, T]) -> "concurrent.futures.Future[T]":
+        """提交协程到后台循环，不等待结果"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro: Coroutine[Any, Any, T], timeout: Optional[float] = None) -> T:
+        """在后台循环上执行协程并阻塞等待结果"""
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except BaseException:
+            future.cancel()
+            raise
+
+    def iterate(self, agen: AsyncIterator[T]) -> Iterator[T]:
+        """把异步生成器转换为同步迭代器；迭代器被关闭时同步关闭异步生成器"""
+        try:
+            while True:
+                try:
+                    item = self.run(agen.__anext__())
+                except StopAsyncIteration:
+                    return
+                yield item
+        finally:
+            aclose = getattr(agen, "aclose", None)
+            if aclose is not None:
+                try:
+                    self.run(aclose())
+                except Exception as e:
+                    logger.warning(f"Failed to close async generator: {e}")
+
+
+_loop_runner: Optional[LoopRunner] = None
+
+
+def get_loop_runner() -> LoopRunner:
+    """获取进程级共享的 LoopRunner"""
+    global _loop_runner
+    if _loop_runner is None:
+        _loop_runner = LoopRunner()
+    return _loop_runner
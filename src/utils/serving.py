@@ -0,0 +1,111 @@
+"""
+Production Server Launcher
+生产环境 HTTP 服务启动参数：多进程 worker、keep-alive、backlog、优雅退出
+"""
+
+import logging
+import os
+from typing import List, Optional
+
+import uvicorn
+
+from utils.admission import FORWARDED_ALLOW_IPS
+
+logger = logging.getLogger(__name__)
+
+# worker 进程数，默认 auto（按可用 CPU 数量）；状态只在进程内的功能（写回模式）要求设为 1，见 single_process_features()
+WEB_CONCURRENCY = os.getenv("WEB_CONCURRENCY", "auto")
+# keep-alive 空闲连接保持时间（秒），需大于前端代理的空闲超时
+SERVER_KEEP_ALIVE = int(os.getenv("SERVER_KEEP_ALIVE", "75"))
+# listen backlog，突发连接在内核队列中等待的上限
+SERVER_BACKLOG = int(os.getenv("SERVER_BACKLOG", "2048"))
+# 优雅退出时等待进行中请求完成的最长时间（秒）
+SERVER_GRACEFUL_TIMEOUT = int(os.getenv("SERVER_GRACEFUL_TIMEOUT", "30"))
+# worker 存活探测超时（秒），worker 启动时导入 langchain 等依赖较慢，过短会被误判为已退出
+SERVER_WORKER_HEALTHCHECK_TIMEOUT = int(os.getenv("SERVER_WORKER_HEALTHCHECK_TIMEOUT", "30"))
+
+
+def available_cpus() -> int:
+    """当前进程可用的 CPU 数量（考虑 CPU 亲和性限制）"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def resolve_worker_count() -> int:
+    """worker 进程数：WEB_CONCURRENCY 指定，默认 auto（可用 CPU 数）"""
+    if not WEB_CONCURRENCY or WEB_CONCURRENCY.lower() == "auto":
+        return available_cpus()
+    if WEB_CONCURRENCY:
+        try:
+            return max(1, int(WEB_CONCURRENCY))
+        except ValueError:
+            logger.warning(f"Invalid WEB_CONCURRENCY={WEB_CONCURRENCY!r}, falling back to a single worker")
+    return 1
+
+
+def single_process_features() -> List[str]:
+    """
+    已启用、且会话状态只保存在进程内的功能
+
+    没有会话粘性时，同一会话的请求会落到不同 worker，这些功能会读到其他进程写入前的旧 checkpoint
+    """
+    # 只在父进程启动前检查时导入，server.py 主模块保持轻量
+    # （多 worker 时 checkpoint 读缓存每次命中都会核对数据库中的最新版本，支持多进程）
+    from storage.memory.write_behind import CHECKPOINT_WRITE_MODE
+
+    features = []
+    if CHECKPOINT_WRITE_MODE == "write_behind":
+        features.append("CHECKPOINT_WRITE_MODE=write_behind")
+    return features
+
+
+def check_worker_count(workers: int):
+    """多 worker 时拒绝启动只支持单进程的功能（RuntimeError），进程内计数的限流与缓存给出提示"""
+    if workers <= 1:
+        return
+    features = single_process_features()
+    if features:
+        raise RuntimeError(
+            f"{', '.join(features)} keeps session state per process and requires a single worker "
+            f"(set WEB_CONCURRENCY=1), got {workers} workers"
+        )
+    logger.warning(f"Running {workers} workers: rate limits, admission slots and the response cache are counted per worker")
+
+
+def run_server(app: str, port: int, host: str = "0.0.0.0", reload: bool = False, workers: Optional[int] = None):
+    """
+    以预派生 worker 池启动 ASGI 应用（默认每个可用 CPU 一个 worker，多 worker 时先检查功能是否支持多进程）
+
+    app 必须是 "module:attr" 形式的导入路径，每个 worker 进程独立导入应用，
+    各自执行 lifespan（构建 Agent、打开 checkpointer 连接池）；
+    收到 SIGTERM 后停止接收新连接，等待进行中的请求完成后退出
+    """
+    if reload:
+        # 热重载只支持单进程
+        workers = 1
+    elif workers is None:
+        workers = resolve_worker_count()
+    check_worker_count(workers)
+    # worker 进程按同一个数量决定进程内状态的策略（如读缓存是否核对数据库）
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+
+    logger.info(
+        f"Start HTTP Server, Port: {port}, Workers: {workers}, "
+        f"Keep-Alive: {SERVER_KEEP_ALIVE}s, Backlog: {SERVER_BACKLOG}"
+    )
+    uvicorn.run(
+        app,
+        host=host,
+        port=port,
+        reload=reload,
+        workers=workers,
+        backlog=SERVER_BACKLOG,
+        timeout_keep_alive=SERVER_KEEP_ALIVE,
+        timeout_graceful_shutdown=SERVER_GRACEFUL_TIMEOUT,
+        timeout_worker_healthcheck=SERVER_WORKER_HEALTHCHECK_TIMEOUT,
+        proxy_headers=True,
+        # 只信任可信代理的转发头，否则任何客户端都能伪造 X-Forwarded-For 绕过按 IP 限流
+        forwarded_allow_ips=FORWARDED_ALLOW_IPS,
+    )
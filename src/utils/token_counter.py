@@ -0,0 +1,92 @@
+"""
+Token Counter
+本地估算提示词 token 数，用于日志统计与历史窗口预算
+
+优先使用 tiktoken 编码（TOKENIZER_ENCODING）；编码文件不可用（如离线环境）时
+退化为按字符估算：CJK 字符每字约 1 token，其余文本约 4 字符 1 token。
+各家模型的分词器不同，结果只作为预算与趋势参考，实际计费以接口返回的 usage 为准
+"""
+
+import logging
+import os
+import re
+import threading
+from typing import Any, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "o200k_base")
+# 每条消息的格式开销（role、分隔符）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_CJK = re.compile(r"[　-〿぀-ヿ㐀-䶿一-鿿가-힯＀-￯]")
+
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+
+def load_tokenizer():
+    """加载 tiktoken 编码（首次加载可能需要下载编码文件，预热时在线程池中调用）"""
+    global _encoding, _encoding_loaded
+    if _encoding_loaded:
+        return _encoding
+    with _encoding_lock:
+        if not _encoding_loaded:
+            try:
+                import tiktoken
+                _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+            except Exception as e:
+                logger.warning(f"Tokenizer {TOKENIZER_ENCODING} unavailable ({type(e).__name__}), using character estimate")
+                _encoding = None
+            _encoding_loaded = True
+    return _encoding
+
+
+def estimate_tokens(text: str) -> int:
+    """按字符估算 token 数"""
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def count_tokens(text: Optional[str]) -> int:
+    if not text:
+        return 0
+    encoding = load_tokenizer()
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """截取文本开头不超过 max_tokens 个 token 的部分"""
+    encoding = load_tokenizer()
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
+    total = estimate_tokens(text)
+    if total <= max_tokens:
+        return text
+    # 按比例截取后再逐步收缩，保证估算值不超过上限
+    end = len(text) * max_tokens // total
+    while end > 0 and estimate_tokens(text[:end]) > max_tokens:
+        end -= max(1, end // 20)
+    return text[:max(0, end)]
+
+
+def message_text(content: Any) -> str:
+    """消息内容转文本（字符串或 content blocks 列表）"""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(
+            block if isinstance(block, str) else str(block.get("text", ""))
+            for block in content
+            if isinstance(block, (str, dict))
+        )
+    return str(content or "")
+
+
+def count_message_tokens(messages: Iterable[Any]) -> int:
+    """消息列表的 token 数（内容 + 每条消息的格式开销）"""
+    return sum(count_tokens(message_text(m.content)) + MESSAGE_OVERHEAD_TOKENS for m in messages)
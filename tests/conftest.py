@@ -0,0 +1,21 @@
+"""
+测试公共配置
+
+与各入口脚本一致，把 src 加入导入路径；需要 Postgres 的测试读取 TEST_PGDATABASE_URL，未设置时跳过
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+
+@pytest.fixture
+def pg_url() -> str:
+    """测试数据库连接串（会在其中创建 memory schema 的 checkpoint 表）"""
+    url = os.getenv("TEST_PGDATABASE_URL", "")
+    if not url:
+        pytest.skip("TEST_PGDATABASE_URL is not set")
+    return url
@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+
+import utils.admission as admission
+from utils.admission import AdmissionController, AdmissionRejected, RateLimiter, client_ip, parse_trusted_proxies
+
+PROXIES = parse_trusted_proxies("127.0.0.1, 172.16.0.0/12, fdaa::/16")
+
+
+def test_untrusted_peer_cannot_spoof_forwarded_headers():
+    headers = {"X-Forwarded-For": "1.2.3.4", "Fly-Client-IP": "5.6.7.8"}
+    assert client_ip(headers, "203.0.113.9", PROXIES) == "203.0.113.9"
+
+
+def test_forwarded_for_uses_the_hop_appended_by_the_trusted_proxy():
+    # 客户端自带 "1.2.3.4"，可信代理追加了真实地址 198.51.100.7
+    headers = {"X-Forwarded-For": "1.2.3.4, 198.51.100.7"}
+    assert client_ip(headers, "172.19.0.5", PROXIES) == "198.51.100.7"
+    # 多层可信代理时跳过代理自身的地址
+    headers = {"X-Forwarded-For": "1.2.3.4, 198.51.100.7, 172.18.0.2"}
+    assert client_ip(headers, "127.0.0.1", PROXIES) == "198.51.100.7"
+    assert client_ip({}, "127.0.0.1", PROXIES) == "127.0.0.1"
+
+
+def test_fly_client_ip_is_trusted_from_the_proxy():
+    assert client_ip({"Fly-Client-IP": " 198.51.100.7 "}, "fdaa:0:1::3", PROXIES) == "198.51.100.7"
+
+
+def test_trust_all_and_invalid_entries():
+    trust_all = parse_trusted_proxies("10.0.0.1, *")
+    # 信任所有来源时 X-Forwarded-For 全部可信，取最左侧
+    assert client_ip({"X-Forwarded-For": "1.2.3.4, 5.6.7.8"}, "203.0.113.9", trust_all) == "1.2.3.4"
+    assert client_ip({}, "2001:db8::1", trust_all) == "2001:db8::1"
+    assert parse_trusted_proxies("bogus, 10.0.0.0/8") == parse_trusted_proxies("10.0.0.0/8")
+
+
+def test_localhost_only_ignores_forwarded_headers_from_other_peers():
+    assert client_ip({"X-Forwarded-For": "1.2.3.4"}, "203.0.113.9", parse_trusted_proxies("127.0.0.1")) == "203.0.113.9"
+
+
+def test_rate_limiter_token_bucket(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(admission.time, "monotonic", lambda: now[0])
+    limiter = RateLimiter("ip", rate=1, burst=2)
+    limiter.check("a")
+    limiter.check("a")
+    with pytest.raises(AdmissionRejected) as rejected:
+        limiter.check("a")
+    assert rejected.value.reason == "rate_limited_ip"
+    assert rejected.value.retry_after >= 1
+    # 其他 key 互不影响，补充令牌后恢复
+    limiter.check("b")
+    now[0] += 1.0
+    limiter.check("a")
+    assert limiter.stats()["rejected"] == 1
+    # 没有 key（如取不到 IP）时不限流
+    for _ in range(5):
+        limiter.check(None)
+
+
+@pytest.mark.asyncio
+async def test_admission_queues_in_fifo_order_and_rejects_when_full():
+    controller = AdmissionController(max_in_flight=1, max_queue=1, queue_timeout=1)
+    order = []
+    await controller.acquire()
+
+    queued = asyncio.create_task(waiter_task(controller, "queued", order))
+    await asyncio.sleep(0)
+    assert controller.queue_depth == 1
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.check_capacity()
+    assert rejected.value.reason == "queue_full"
+    controller.release()
+    await queued
+    assert order == ["queued"]
+    assert controller.in_flight == 0
+
+
+async def waiter_task(controller, name, order):
+    async with controller.slot():
+        order.append(name)
+
+
+@pytest.mark.asyncio
+async def test_admission_queue_timeout():
+    controller = AdmissionController(max_in_flight=1, max_queue=4, queue_timeout=0.01)
+    await controller.acquire()
+    with pytest.raises(AdmissionRejected) as rejected:
+        await controller.acquire()
+    assert rejected.value.reason == "queue_timeout"
+    assert controller.queue_depth == 0
+    controller.release()
+    assert controller.in_flight == 0
@@ -0,0 +1,80 @@
+import pytest
+from langchain_core.messages import AIMessage
+from langgraph.checkpoint.base import empty_checkpoint
+from langgraph.graph import START, MessagesState, StateGraph
+
+import storage.memory.bounded as bounded
+from storage.memory.bounded import BoundedMemorySaver
+
+
+def config(thread_id):
+    return {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+
+
+def put(saver, thread_id, payload="x"):
+    checkpoint = empty_checkpoint()
+    checkpoint["channel_values"] = {"payload": payload}
+    return saver.put(config(thread_id), checkpoint, {"step": 0}, {})
+
+
+def test_keeps_only_the_latest_checkpoint():
+    saver = BoundedMemorySaver()
+    first = put(saver, "t1")
+    second = saver.put(first, empty_checkpoint(), {"step": 1}, {})
+    saver.put_writes(first, [("messages", "stale")], task_id="task")
+    saver.put_writes(second, [("messages", "fresh")], task_id="task")
+
+    latest = saver.get_tuple(config("t1"))
+    assert latest.config["configurable"]["checkpoint_id"] == second["configurable"]["checkpoint_id"]
+    assert latest.parent_config["configurable"]["checkpoint_id"] == first["configurable"]["checkpoint_id"]
+    assert latest.pending_writes == [("task", "messages", "fresh")]
+    assert saver.get_tuple(first) is None
+    assert len(list(saver.list(config("t1")))) == 1
+
+
+def test_evicts_least_recently_used_threads():
+    saver = BoundedMemorySaver(max_threads=2)
+    put(saver, "t1")
+    put(saver, "t2")
+    saver.get_tuple(config("t1"))
+    put(saver, "t3")
+    assert saver.get_tuple(config("t2")) is None
+    assert saver.get_tuple(config("t1")) is not None
+    assert saver.stats()["evicted_lru"] == 1
+
+
+def test_evicts_by_bytes_but_keeps_the_writer():
+    saver = BoundedMemorySaver(max_bytes=2000)
+    put(saver, "t1", "a" * 800)
+    put(saver, "t2", "b" * 800)
+    put(saver, "t3", "c" * 3000)
+    stats = saver.stats()
+    assert stats["threads"] == 1
+    assert stats["evicted_bytes"] == 2
+    assert saver.get_tuple(config("t3")) is not None
+
+    saver.delete_thread("t3")
+    assert saver.stats()["bytes"] == 0
+
+
+def test_evicts_idle_threads(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(bounded.time, "monotonic", lambda: now[0])
+    saver = BoundedMemorySaver(ttl=60)
+    put(saver, "t1")
+    now[0] += 61
+    put(saver, "t2")
+    assert saver.get_tuple(config("t1")) is None
+    assert saver.stats()["evicted_ttl"] == 1
+
+
+@pytest.mark.asyncio
+async def test_runs_a_graph():
+    graph = StateGraph(MessagesState)
+    graph.add_node("model", lambda state: {"messages": [AIMessage(content=f"reply {len(state['messages'])}")]})
+    graph.add_edge(START, "model")
+    agent = graph.compile(checkpointer=BoundedMemorySaver())
+
+    await agent.ainvoke({"messages": [("user", "hi")]}, config("s1"))
+    result = await agent.ainvoke({"messages": [("user", "again")]}, config("s1"))
+    assert [m.content for m in result["messages"]] == ["hi", "reply 1", "again", "reply 3"]
@@ -0,0 +1,129 @@
+import asyncio
+
+import pytest
+
+from api.chat_service import ChatRequestError, ChatService, EmptyReplyError, parse_chat_request
+from api.session_scheduler import SessionScheduler
+
+
+def make_service(reply):
+    service = ChatService()
+
+    async def ensure_agent():
+        return None
+
+    async def run_turn(turn):
+        return reply
+
+    service.ensure_agent = ensure_agent
+    service.scheduler = SessionScheduler(run_turn)
+    return service
+
+
+def test_parse_chat_request():
+    message, session_id, customer_info = parse_chat_request({"message": "  hello ", "session_id": "s1"})
+    assert (message, session_id, customer_info) == ("hello", "s1", {})
+    assert parse_chat_request({"message": "hi"})[1]
+    with pytest.raises(ChatRequestError):
+        parse_chat_request({"message": "   "})
+    with pytest.raises(ChatRequestError):
+        parse_chat_request(None)
+
+
+@pytest.mark.asyncio
+async def test_chat_returns_reply():
+    service = make_service("Hello from Larry")
+    assert await service.chat("hi", "s1") == "Hello from Larry"
+    assert service.scheduler.active_sessions == 0
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("reply", [None, ""])
+async def test_chat_without_reply_raises(reply):
+    service = make_service(reply)
+    with pytest.raises(EmptyReplyError):
+        await service.chat("hi", "s1")
+
+
+class UnreachableMemoryManager:
+    def prepare(self):
+        return False
+
+    async def open_pool(self):
+        raise OSError("connection refused")
+
+
+@pytest.mark.asyncio
+async def test_warm_up_degrades_to_cold_start(monkeypatch):
+    import api.chat_service as chat_service_module
+
+    service = make_service("hi")
+    monkeypatch.setattr(chat_service_module, "get_memory_manager", UnreachableMemoryManager)
+    monkeypatch.setattr(chat_service_module, "load_tokenizer", lambda: None)
+
+    async def prime():
+        raise ConnectionError("model endpoint unreachable")
+
+    service._prime_llm_connection = prime
+    assert await service.warm_up() is True
+    assert service.ready
+
+
+@pytest.mark.asyncio
+async def test_turns_of_one_session_are_serialized_across_workers(monkeypatch):
+    import types
+
+    import api.session_lock as session_lock
+    from api.session_lock import SessionLock
+    from tests.test_session_lock import FakeAdvisoryDatabase
+
+    monkeypatch.setattr(session_lock, "SESSION_LOCK_POLL_INTERVAL", 0.005)
+    database = FakeAdvisoryDatabase()
+    events = []
+
+    def make_worker(name):
+        service = ChatService()
+        service.session_lock = SessionLock(connect=database.connect())
+
+        async def ensure_agent():
+            return types.SimpleNamespace(agent=None)
+
+        async def execute_turn(version, turn):
+            events.append(f"{name}-in")
+            await asyncio.sleep(0.02)
+            events.append(f"{name}-out")
+            return name
+
+        service.ensure_agent = ensure_agent
+        service._execute_turn = execute_turn
+        return service
+
+    worker_a, worker_b = make_worker("a"), make_worker("b")
+    results = await asyncio.gather(worker_a.chat("hi", "s1"), worker_b.chat("hello", "s1"))
+    assert results == ["a", "b"]
+    assert events == ["a-in", "a-out", "b-in", "b-out"]
+
+
+@pytest.mark.asyncio
+async def test_turn_fails_when_the_session_lock_is_lost():
+    import types
+
+    from api.session_lock import SessionLock, SessionLockLost
+    from tests.test_session_lock import FakeAdvisoryDatabase
+
+    service = ChatService()
+    service.session_lock = SessionLock(connect=FakeAdvisoryDatabase().connect())
+
+    async def ensure_agent():
+        return types.SimpleNamespace(agent=None)
+
+    async def execute_turn(version, turn):
+        # 本轮运行期间数据库连接断开，advisory lock 随之释放
+        service.session_lock._conn.broken = True
+        return "reply"
+
+    service.ensure_agent = ensure_agent
+    service._execute_turn = execute_turn
+    with pytest.raises(SessionLockLost):
+        await service.chat("hi", "s1")
+    assert service.session_lock.stats()["lost"] == 1
@@ -0,0 +1,176 @@
+import asyncio
+import json
+import os
+import threading
+
+import pytest
+
+import agents.config_manager as config_manager
+from agents.config_manager import ConfigManager, ConfigValidationError, validate_llm_config
+
+CHECKPOINTER = object()
+
+
+def valid_config(model="model-a", **overrides):
+    cfg = {"config": {"model": model, "temperature": 0.3, "max_completion_tokens": 1000}, "sp": "You are Larry.", "tools": []}
+    cfg.update(overrides)
+    return cfg
+
+
+@pytest.fixture
+def compiled(monkeypatch):
+    """替换 compile_agent：记录编译参数与所在线程，不构建真实 Agent"""
+    calls = []
+
+    def compile_agent(cfg, ctx=None, checkpointer=None):
+        calls.append({"model": cfg["config"]["model"], "checkpointer": checkpointer, "thread": threading.get_ident()})
+        return {"model": cfg["config"]["model"]}
+
+    monkeypatch.setattr(config_manager, "compile_agent", compile_agent)
+    return calls
+
+
+@pytest.fixture
+def config_file(tmp_path):
+    path = tmp_path / "agent_llm_config.json"
+
+    def write(content, mtime_offset=0):
+        path.write_text(content if isinstance(content, str) else json.dumps(content), encoding="utf-8")
+        # 保证 mtime 变化（部分文件系统的时间精度较低）
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + mtime_offset * 1_000_000_000))
+
+    write(valid_config())
+    write.path = str(path)
+    return write
+
+
+def new_manager(path):
+    manager = ConfigManager(path=path, interval=0)
+    manager._checkpointer = CHECKPOINTER
+    return manager
+
+
+@pytest.mark.parametrize(
+    "cfg, message",
+    [
+        ([], "root"),
+        ({"sp": "x"}, "'config'"),
+        ({"config": {"model": " "}, "sp": "x"}, "config.model"),
+        (valid_config(sp=""), "'sp'"),
+        (valid_config(config={"model": "m", "temperature": 3}), "temperature"),
+        (valid_config(config={"model": "m", "max_completion_tokens": 1.5}), "integer"),
+        (valid_config(config={"model": "m", "thinking": "maybe"}), "thinking"),
+        (valid_config(tools=["no_such_tool"]), "unknown tools"),
+        (valid_config(routing={"tiers": {}}), "routing.tiers"),
+        (valid_config(routing={"tiers": {"lite": {}}, "default_tier": "full"}), "default_tier"),
+        (valid_config(routing={"tiers": {"lite": {}}, "simple_patterns": ["("]}), "invalid regex"),
+        (valid_config(sp_languages={"blocks": {"en": ""}}), "sp_languages.blocks"),
+    ],
+)
+def test_validate_rejects_invalid_configs(cfg, message):
+    with pytest.raises(ConfigValidationError, match=message):
+        validate_llm_config(cfg)
+
+
+def test_validate_accepts_routing_and_languages():
+    validate_llm_config(
+        valid_config(
+            routing={"tiers": {"lite": {"model": "m-lite", "max_completion_tokens": 300}, "full": {}}, "default_tier": "full", "simple_tier": "lite"},
+            sp_languages={"header": "", "blocks": {"en": "Hello"}},
+        )
+    )
+
+
+def test_reload_on_mtime_change_swaps_version(compiled, config_file):
+    manager = new_manager(config_file.path)
+    first = manager.current()
+    assert first.model == "model-a"
+    assert not manager.reload()
+
+    config_file(valid_config("model-b"), mtime_offset=1)
+    assert manager.reload()
+    second = manager.current()
+    assert second is manager.active is not first
+    assert second.model == "model-b"
+    # 进行中的运行持有的旧版本保持不变
+    assert first.agent == {"model": "model-a"}
+    assert manager.stats()["reloads"] == 1
+    # 热更新复用首次加载时解析的 checkpointer
+    assert [call["checkpointer"] for call in compiled] == [CHECKPOINTER, CHECKPOINTER]
+
+
+def test_touch_without_content_change_does_not_rebuild(compiled, config_file):
+    manager = new_manager(config_file.path)
+    manager.current()
+    config_file(valid_config(), mtime_offset=1)
+    assert not manager.reload()
+    assert len(compiled) == 1
+
+
+@pytest.mark.parametrize("content", ["{not json", json.dumps(valid_config(config={"model": "m", "temperature": 9}))])
+def test_invalid_file_keeps_previous_version(compiled, config_file, content):
+    manager = new_manager(config_file.path)
+    first = manager.current()
+
+    config_file(content, mtime_offset=1)
+    assert not manager.reload()
+    assert manager.current() is first
+    stats = manager.stats()
+    assert stats["failures"] == 1
+    assert stats["last_error"]
+
+    # 修复后再次加载
+    config_file(valid_config("model-c"), mtime_offset=2)
+    assert manager.reload()
+    assert manager.current().model == "model-c"
+    assert manager.stats()["last_error"] is None
+
+
+def test_compile_failure_keeps_previous_version(monkeypatch, compiled, config_file):
+    manager = new_manager(config_file.path)
+    first = manager.current()
+
+    def broken(cfg, ctx=None, checkpointer=None):
+        raise RuntimeError("tool import failed")
+
+    monkeypatch.setattr(config_manager, "compile_agent", broken)
+    config_file(valid_config("model-b"), mtime_offset=1)
+    assert not manager.reload()
+    assert manager.current() is first
+    assert "tool import failed" in manager.stats()["last_error"]
+
+
+def test_missing_file_falls_back_to_default_config(compiled, tmp_path):
+    manager = new_manager(str(tmp_path / "missing.json"))
+    assert manager.current().source == "default"
+
+
+@pytest.mark.asyncio
+async def test_async_initial_load_compiles_off_the_event_loop(monkeypatch, compiled, config_file):
+    class FakeMemoryManager:
+        def __init__(self):
+            self.prepared_on = None
+            self.resolved_on = None
+
+        def prepare(self):
+            self.prepared_on = threading.get_ident()
+            return True
+
+        def get_checkpointer(self):
+            self.resolved_on = threading.get_ident()
+            return CHECKPOINTER
+
+    memory_manager = FakeMemoryManager()
+    monkeypatch.setattr(config_manager, "get_memory_manager", lambda: memory_manager)
+    manager = ConfigManager(path=config_file.path, interval=0)
+
+    loop_thread = threading.get_ident()
+    versions = await asyncio.gather(manager.acurrent(), manager.acurrent())
+    assert versions[0] is versions[1] is manager.active
+    assert len(compiled) == 1
+    assert compiled[0]["thread"] != loop_thread
+    assert compiled[0]["checkpointer"] is CHECKPOINTER
+    assert memory_manager.prepared_on != loop_thread
+    # checkpointer 在调用方的循环上解析（caller 模式下连接池绑定到该循环）
+    assert memory_manager.resolved_on == loop_thread
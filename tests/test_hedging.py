@@ -0,0 +1,158 @@
+import asyncio
+import time
+from typing import Any, List
+
+import pytest
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessageChunk, HumanMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+
+import agents.hedging as hedging
+from agents.hedging import HedgedChatModel, HedgeStats
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class ScriptedModel(BaseChatModel):
+    """
+    按脚本流式输出的模型：scripts 中每个元素对应一次调用，
+    元素为 (延迟秒数, 内容) 或 (延迟秒数, 异常) 的列表
+    """
+
+    name: str = "scripted"
+    scripts: List[Any] = []
+    calls: int = 0
+    cancelled: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        raise NotImplementedError
+
+    def _next_script(self):
+        script = self.scripts[self.calls]
+        self.calls += 1
+        return script
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        script = self._next_script()
+        try:
+            for delay, item in script:
+                await asyncio.sleep(delay)
+                if isinstance(item, BaseException):
+                    raise item
+                yield ChatGenerationChunk(message=AIMessageChunk(content=item))
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        for delay, item in self._next_script():
+            time.sleep(delay)
+            if isinstance(item, BaseException):
+                raise item
+            yield ChatGenerationChunk(message=AIMessageChunk(content=item))
+
+
+MESSAGES = [HumanMessage(content="hi")]
+
+
+@pytest.fixture(autouse=True)
+def fresh_stats(monkeypatch):
+    stats = HedgeStats()
+    monkeypatch.setattr(hedging, "_hedge_stats", stats)
+    monkeypatch.setattr(hedging, "LLM_RETRY_BASE_DELAY", 0.01)
+    return stats
+
+
+async def collect(model) -> str:
+    return "".join([chunk.content async for chunk in model.astream(MESSAGES)])
+
+
+@pytest.mark.asyncio
+async def test_stall_after_role_chunk_is_hedged(fresh_stats):
+    # 主模型立即返回空的角色片段，之后卡住
+    primary = ScriptedModel(name="primary", scripts=[[(0, ""), (5, "slow")]])
+    fallback = ScriptedModel(name="fallback", scripts=[[(0, "fa"), (0, "st")]])
+    model = HedgedChatModel(primary=primary, fallback=fallback, ttft_deadline=0.05, max_hedges=1)
+
+    assert await collect(model) == "fast"
+    assert fallback.calls == 1
+    # 落败的请求被取消
+    assert primary.cancelled == 1
+    stats = fresh_stats.stats()
+    assert stats["hedged"] == 1
+    assert stats["hedge_wins"] == 1
+    assert stats["ttft_p50_ms"] >= 50
+
+
+@pytest.mark.asyncio
+async def test_leading_empty_chunks_of_the_winner_are_kept():
+    primary = ScriptedModel(scripts=[[(0, ""), (0, "hello")]])
+    model = HedgedChatModel(primary=primary, ttft_deadline=1)
+    chunks = [chunk async for chunk in model.astream(MESSAGES)]
+    # langchain 会在流末尾追加一个空片段
+    assert [c.content for c in chunks][:2] == ["", "hello"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("error", [StatusError(503), TimeoutError("read timeout"), StatusError(429)])
+async def test_retryable_errors_are_retried_with_jitter(monkeypatch, fresh_stats, error):
+    jitter = []
+    monkeypatch.setattr(hedging.random, "uniform", lambda low, high: jitter.append((low, high)) or high)
+    primary = ScriptedModel(scripts=[[(0, error)], [(0, "ok")]])
+    model = HedgedChatModel(primary=primary, ttft_deadline=0, max_retries=2)
+
+    assert await collect(model) == "ok"
+    assert primary.calls == 2
+    assert jitter == [(0.5, 1.0)]
+    assert fresh_stats.stats()["retries"] == 1
+
+
+@pytest.mark.asyncio
+async def test_client_errors_are_not_retried(fresh_stats):
+    primary = ScriptedModel(scripts=[[(0, StatusError(400))], [(0, "unused")]])
+    model = HedgedChatModel(primary=primary, ttft_deadline=0, max_retries=2)
+
+    with pytest.raises(StatusError):
+        await collect(model)
+    assert primary.calls == 1
+    assert fresh_stats.stats()["failures"] == 1
+
+
+@pytest.mark.asyncio
+async def test_retries_are_bounded():
+    primary = ScriptedModel(scripts=[[(0, StatusError(502))]] * 3)
+    model = HedgedChatModel(primary=primary, ttft_deadline=0, max_retries=2)
+    with pytest.raises(StatusError):
+        await collect(model)
+    assert primary.calls == 3
+
+
+@pytest.mark.asyncio
+async def test_winner_error_after_first_token_is_raised():
+    primary = ScriptedModel(scripts=[[(0, "partial"), (0, StatusError(500))], [(0, "unused")]])
+    model = HedgedChatModel(primary=primary, ttft_deadline=1, max_retries=2)
+
+    received = []
+    with pytest.raises(StatusError):
+        async for chunk in model.astream(MESSAGES):
+            received.append(chunk.content)
+    assert received == ["partial"]
+    # 已推送内容后不重试
+    assert primary.calls == 1
+
+
+def test_sync_stream_hedges_after_role_chunk(fresh_stats):
+    primary = ScriptedModel(scripts=[[(0, ""), (0.5, "slow")]])
+    fallback = ScriptedModel(scripts=[[(0, "fast")]])
+    model = HedgedChatModel(primary=primary, fallback=fallback, ttft_deadline=0.05, max_hedges=1)
+
+    assert "".join(chunk.content for chunk in model.stream(MESSAGES)) == "fast"
+    assert fresh_stats.stats()["hedge_wins"] == 1
@@ -0,0 +1,150 @@
+import asyncio
+import itertools
+import types
+
+import pytest
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.graph import START, MessagesState, StateGraph
+
+import agents.history as history
+from agents.history import SUMMARY_MESSAGE_ID, HistoryCompactor, split_history, truncate_message
+
+
+@pytest.fixture(autouse=True)
+def small_budget(monkeypatch):
+    monkeypatch.setattr(history, "HISTORY_SUMMARY_ENABLED", True)
+    monkeypatch.setattr(history, "HISTORY_TOKEN_BUDGET", 60)
+    monkeypatch.setattr(history, "HISTORY_KEEP_TOKENS", 30)
+    monkeypatch.setattr(history, "HISTORY_MESSAGE_MAX_TOKENS", 20)
+
+
+def conversation(turns):
+    messages = []
+    for i in range(turns):
+        messages.append(HumanMessage(content=f"question {i} about glue for paper bags", id=f"h{i}"))
+        messages.append(AIMessage(content=f"answer {i}: we recommend QL-118GH for this machine", id=f"a{i}"))
+    return messages
+
+
+def build_agent():
+    graph = StateGraph(MessagesState)
+    graph.add_node("model", lambda state: {"messages": []})
+    graph.add_edge(START, "model")
+    return graph.compile(checkpointer=InMemorySaver())
+
+
+def fake_llm(on_invoke=None):
+    class SummaryModel(GenericFakeChatModel):
+        async def _agenerate(self, *args, **kwargs):
+            if on_invoke is not None:
+                await on_invoke()
+            return await super()._agenerate(*args, **kwargs)
+
+    return SummaryModel(messages=itertools.repeat(AIMessage(content="Customer runs a 120 m/min machine.")))
+
+
+def test_split_history_keeps_whole_recent_turns():
+    assert split_history(conversation(1)) is None
+    summary, folded, kept = split_history(conversation(6))
+    assert summary is None
+    assert folded and kept
+    assert isinstance(kept[0], HumanMessage)
+    assert folded + kept == conversation(6)
+
+
+def test_truncate_message():
+    short = HumanMessage(content="hi")
+    assert truncate_message(short) is short
+    long = HumanMessage(content="spec " * 200)
+    truncated = truncate_message(long)
+    assert truncated.additional_kwargs["truncated"]
+    assert "tokens omitted" in truncated.content
+    assert truncate_message(truncated) is truncated
+
+
+@pytest.mark.asyncio
+async def test_compact_folds_history_into_summary():
+    agent = build_agent()
+    config = {"configurable": {"thread_id": "t1"}}
+    await agent.aupdate_state(config, {"messages": conversation(6)}, as_node="model")
+
+    compactor = HistoryCompactor(fake_llm)
+    assert await compactor.compact(agent, config)
+    messages = (await agent.aget_state(config)).values["messages"]
+    assert messages[0].id == SUMMARY_MESSAGE_ID
+    assert "120 m/min" in messages[0].content
+    assert messages[-1].id == "a5"
+    assert compactor.stats()["compactions"] == 1
+
+
+@pytest.mark.asyncio
+async def test_compact_is_deferred_when_a_new_turn_lands_during_summarization():
+    agent = build_agent()
+    config = {"configurable": {"thread_id": "t1"}}
+    await agent.aupdate_state(config, {"messages": conversation(6)}, as_node="model")
+
+    async def new_turn():
+        await agent.aupdate_state(config, {"messages": [HumanMessage(content="follow-up", id="late")]}, as_node="model")
+
+    compactor = HistoryCompactor(lambda: fake_llm(new_turn))
+    assert not await compactor.compact(agent, config)
+    messages = (await agent.aget_state(config)).values["messages"]
+    # 新一轮的消息没有被改写覆盖
+    assert messages[-1].id == "late"
+    assert all(m.id != SUMMARY_MESSAGE_ID for m in messages)
+    assert compactor.stats()["deferred"] == 1
+
+
+@pytest.mark.asyncio
+async def test_compact_is_deferred_while_the_session_is_busy():
+    agent = build_agent()
+    config = {"configurable": {"thread_id": "t1"}}
+    await agent.aupdate_state(config, {"messages": conversation(6)}, as_node="model")
+
+    class Busy:
+        async def __aenter__(self):
+            raise TimeoutError("session is locked")
+
+        async def __aexit__(self, *exc):
+            return False
+
+    compactor = HistoryCompactor(fake_llm)
+    assert not await compactor.compact(agent, config, guard=Busy)
+    assert compactor.stats()["deferred"] == 1
+    assert len((await agent.aget_state(config)).values["messages"]) == 12
+
+
+@pytest.mark.asyncio
+async def test_summary_runs_outside_the_session_slot():
+    """摘要生成期间同一会话的下一轮照常执行，不等待摘要"""
+    from api.chat_service import ChatService
+
+    summary_started = asyncio.Event()
+    finish_summary = asyncio.Event()
+    turns = []
+
+    async def slow_compact(agent, config, guard=None):
+        summary_started.set()
+        await finish_summary.wait()
+        return False
+
+    service = ChatService()
+
+    async def ensure_agent():
+        return types.SimpleNamespace(agent=None)
+
+    async def execute_turn(version, turn):
+        turns.append(turn.messages[0].content)
+        return "ok"
+
+    service.ensure_agent = ensure_agent
+    service._execute_turn = execute_turn
+    service.history.compact = slow_compact
+
+    assert await service.chat("first", "s1") == "ok"
+    await asyncio.wait_for(summary_started.wait(), 1)
+    assert await asyncio.wait_for(service.chat("second", "s1"), 1) == "ok"
+    assert turns == ["first", "second"]
+    finish_summary.set()
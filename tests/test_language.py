@@ -0,0 +1,42 @@
+import pytest
+
+from utils.language import detect_language, detect_script
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("สวัสดีครับ ต้องการกาวสำหรับถุงกระดาษ", "th"),
+        ("안녕하세요, 종이봉투용 접착제가 필요합니다", "ko"),
+        ("紙袋用の接着剤を探しています", "ja"),
+        ("我们需要纸袋机用的胶水", "zh-Hans"),
+        ("我們需要紙袋機用的膠水，請問價格", "zh-Hant"),
+        ("Здравствуйте, нужен клей для бумажных пакетов", "ru"),
+        ("Сәлеметсіз бе, қағаз пакеттерге желім керек", "kk"),
+        ("Hello, which glue do you recommend for our paper bag machine?", "en"),
+        ("Bonjour, nous cherchons une colle pour sacs en papier", "fr"),
+        ("Hola, necesito un adhesivo para bolsas de papel, ¿qué recomienda?", "es"),
+        ("Xin chào, chúng tôi cần keo dán túi giấy", "vi"),
+        ("Dzień dobry, czy macie klej do toreb papierowych?", "pl"),
+    ],
+)
+def test_detect_language(text, expected):
+    assert detect_language(text) == expected
+
+
+@pytest.mark.parametrize("text", ["", "   ", "12345 !!!", "QL-118GH", "hei"])
+def test_undetermined_text_returns_none(text):
+    assert detect_language(text) is None
+
+
+def test_only_the_beginning_is_sampled():
+    assert detect_language("Hello, can you help me with this order? " * 13 + "ขอบคุณ") == "en"
+    assert detect_language("x" * 500 + "ขอบคุณ") is None
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [("hello world", "latin"), ("你好世界", "cjk"), ("Привет мир", "other"), ("123", "latin"), ("QL-118GH 胶水", "latin")],
+)
+def test_detect_script(text, expected):
+    assert detect_script(text) == expected
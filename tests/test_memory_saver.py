@@ -0,0 +1,31 @@
+import pytest
+from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+
+import storage.memory.memory_saver as memory_saver
+from storage.memory.memory_saver import CheckpointerLoopError, MemoryManager
+from storage.memory.read_cache import ReadCachedSaver
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    """数据库已就绪（不实际连接）的 MemoryManager，测试结束后恢复单例状态"""
+    manager = MemoryManager()
+    for name, value in (("_checkpointer", None), ("_pool", None), ("_loop", None), ("_db_url", "postgresql://db/test")):
+        monkeypatch.setattr(manager, name, value)
+    monkeypatch.setattr(memory_saver, "CHECKPOINTER_LOOP", "caller")
+    return manager
+
+
+def test_caller_mode_off_loop_raises_instead_of_falling_back(manager):
+    with pytest.raises(CheckpointerLoopError, match="CHECKPOINTER_LOOP=shared"):
+        manager.get_checkpointer()
+    # 没有静默装配内存 checkpointer，修正调用方式后仍可创建 Postgres checkpointer
+    assert manager._checkpointer is None
+
+
+@pytest.mark.asyncio
+async def test_caller_mode_binds_to_the_running_loop(manager):
+    checkpointer = manager.get_checkpointer()
+    saver = checkpointer.backend if isinstance(checkpointer, ReadCachedSaver) else checkpointer
+    assert isinstance(saver, AsyncPostgresSaver)
+    assert manager._pool is not None and manager._pool.closed
@@ -0,0 +1,88 @@
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, RemoveMessage, SystemMessage, ToolMessage
+from langgraph.graph.message import REMOVE_ALL_MESSAGES, add_messages
+
+from agents.message_window import MessageWindow, merge_window
+
+
+def is_summary(message):
+    return message.id == "summary"
+
+
+def turn(i):
+    return [HumanMessage(content=f"question {i}", id=f"h{i}"), AIMessage(content=f"answer {i}", id=f"a{i}")]
+
+
+def dump(messages):
+    return [(m.id, m.content) for m in messages]
+
+
+def test_matches_add_messages_with_slice():
+    legacy, window = [], []
+    for i in range(30):
+        legacy = add_messages(legacy, turn(i))[-8:]
+        window = merge_window(window, turn(i), 8)
+        edit = AIMessage(content=f"edited {i}", id=f"a{i}")
+        legacy = add_messages(legacy, [edit])[-8:]
+        window = merge_window(window, [edit], 8)
+        assert dump(window) == dump(legacy)
+        assert isinstance(window, MessageWindow)
+
+
+def test_plain_list_from_checkpoint_is_indexed():
+    restored = list(merge_window([], turn(0) + turn(1), 10))
+    window = merge_window(restored, [AIMessage(content="edited", id="a0")], 10)
+    assert dump(window) == [("h0", "question 0"), ("a0", "edited"), ("h1", "question 1"), ("a1", "answer 1")]
+
+
+def test_update_does_not_mutate_previous_window():
+    old = merge_window([], turn(0) + turn(1), 4)
+    before = dump(old)
+    merge_window(old, turn(2) + [AIMessage(content="edited", id="a1")], 4)
+    assert dump(old) == before
+    assert old.position("h0") == 0
+
+
+def test_pinned_summary_is_never_evicted():
+    summary = SystemMessage(content="summary of earlier turns", id="summary")
+    window = merge_window([], [summary], 4, is_pinned=is_summary)
+    for i in range(5):
+        window = merge_window(window, turn(i), 4, is_pinned=is_summary)
+    # 窗口上限包含固定的摘要
+    assert [m.id for m in window] == ["summary", "a3", "h4", "a4"]
+    assert window.position("summary") == 0
+    assert window.position("h4") == 2
+
+    window = merge_window(window, [SystemMessage(content="newer summary", id="summary")], 4, is_pinned=is_summary)
+    assert window[0].content == "newer summary"
+
+
+def test_remove_all_then_rewrite():
+    window = merge_window([], turn(0) + turn(1), 10)
+    summary = SystemMessage(content="summary", id="summary")
+    window = merge_window(
+        window, [RemoveMessage(id=REMOVE_ALL_MESSAGES), summary] + turn(1), 10, is_pinned=is_summary
+    )
+    assert [m.id for m in window] == ["summary", "h1", "a1"]
+    assert window.pinned == 1
+    assert window.position("h0") is None
+
+
+def test_remove_by_id():
+    window = merge_window([], turn(0) + turn(1), 10)
+    window = merge_window(window, [RemoveMessage(id="a0")], 10)
+    assert [m.id for m in window] == ["h0", "h1", "a1"]
+    assert window.position("a1") == 2
+
+    with pytest.raises(ValueError):
+        merge_window(window, [RemoveMessage(id="missing")], 10)
+
+
+def test_window_never_starts_with_tool_result():
+    call = AIMessage(content="", id="call", tool_calls=[{"name": "search", "args": {}, "id": "t1"}])
+    result = ToolMessage(content="result", tool_call_id="t1", id="tool")
+    window = merge_window([], [HumanMessage(content="q", id="q"), call, result, AIMessage(content="a", id="a")], 4)
+    window = merge_window(window, [HumanMessage(content="next", id="n")], 3)
+    # 淘汰 q 与 call 后窗口会以 tool 结果开头，tool 结果一并淘汰
+    assert [m.id for m in window] == ["a", "n"]
+    assert window.position("tool") is None
@@ -0,0 +1,132 @@
+import types
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+import agents.model_router as model_router
+from agents.agent import build_router
+from agents.model_router import ModelRouterMiddleware, RoutingStats, TierRule
+
+ROUTING = {
+    "default_tier": "full",
+    "simple_tier": "lite",
+    "simple_max_chars": 80,
+    "tiers": {"lite": {"model": "model-lite", "max_completion_tokens": 300}, "full": {"model": "model-full"}},
+}
+
+
+@pytest.fixture
+def rule():
+    return TierRule(ROUTING)
+
+
+@pytest.mark.parametrize(
+    "text, tier, reason",
+    [
+        ("hi", "lite", "simple_intent"),
+        ("Good morning!", "lite", "simple_intent"),
+        ("Hello, how are you today", "lite", "simple_intent"),
+        ("thanks a lot", "lite", "simple_intent"),
+        ("ok, got it", "lite", "simple_intent"),
+        ("what is your whatsapp?", "lite", "simple_intent"),
+        ("你好", "lite", "simple_intent"),
+        ("谢谢", "lite", "simple_intent"),
+        ("微信多少", "lite", "simple_intent"),
+        ("We run 200 m/min", "full", "specs"),
+        ("coating weight 12 gsm", "full", "specs"),
+        ("thanks, we need 500 kg", "full", "specs"),
+        ("Which glue for paper bags?", "full", "keyword:glue"),
+        ("hi, can you recommend one", "full", "keyword:recommend"),
+        ("推荐一款胶水", "full", "keyword:推荐"),
+        ("QL-118GH", "full", "keyword:ql-"),
+        ("Hello " + "x" * 80, "full", "long"),
+        ("Здравствуйте", "full", "language"),
+        ("مرحبا، شكرا", "full", "language"),
+        ("สวัสดีครับ", "full", "language"),
+        ("what is the weather", "full", "default"),
+        ("", "full", "empty"),
+    ],
+)
+def test_classify(rule, text, tier, reason):
+    assert rule.classify(text, turn=1) == (tier, reason)
+
+
+def test_late_turns_use_the_default_tier():
+    rule = TierRule({**ROUTING, "max_simple_turn": 3})
+    assert rule.classify("thanks", turn=3) == ("lite", "simple_intent")
+    assert rule.classify("thanks", turn=4) == ("full", "late_turn")
+
+
+def test_keywords_match_word_starts():
+    rule = TierRule(ROUTING)
+    # "show" 不命中 "how"，"laminated" 命中 "laminat"
+    assert rule.classify("show me", turn=1) == ("full", "default")
+    assert rule.classify("laminated", turn=1) == ("full", "keyword:laminat")
+
+
+class FakeRequest:
+    def __init__(self, messages, model=None):
+        self.messages = messages
+        self.model = model
+
+    def override(self, **changes):
+        return FakeRequest(changes.get("messages", self.messages), changes.get("model", self.model))
+
+
+@pytest.fixture
+def stats(monkeypatch):
+    stats = RoutingStats()
+    monkeypatch.setattr(model_router, "_routing_stats", stats)
+    return stats
+
+
+@pytest.fixture
+def router():
+    models = {tier: types.SimpleNamespace(model_name=cfg["model"]) for tier, cfg in ROUTING["tiers"].items()}
+    return ModelRouterMiddleware(TierRule(ROUTING), models)
+
+
+def reply(input_tokens, output_tokens):
+    message = AIMessage(content="ok", usage_metadata={"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens})
+    return types.SimpleNamespace(result=[message])
+
+
+def test_wrap_model_call_overrides_model_and_records_stats(router, stats):
+    seen = []
+
+    def handler(request):
+        seen.append(request.model.model_name)
+        return reply(100, 10)
+
+    router.wrap_model_call(FakeRequest([HumanMessage(content="thanks!")]), handler)
+    router.wrap_model_call(FakeRequest([HumanMessage(content="Which adhesive for kraft bags?")]), handler)
+    assert seen == ["model-lite", "model-full"]
+
+    result = stats.stats()
+    assert result["tiers"]["lite"]["calls"] == 1
+    assert result["tiers"]["lite"]["input_tokens"] == 100
+    assert result["tiers"]["full"]["output_tokens"] == 10
+    assert result["reasons"] == {"simple_intent": 1, "keyword": 1}
+
+
+@pytest.mark.asyncio
+async def test_awrap_model_call_records_failures(router, stats):
+    async def handler(request):
+        raise TimeoutError("model timeout")
+
+    with pytest.raises(TimeoutError):
+        await router.awrap_model_call(FakeRequest([HumanMessage(content="hi")]), handler)
+    assert stats.stats()["tiers"]["lite"]["failures"] == 1
+
+
+def test_only_routed_tiers_cap_output_tokens(monkeypatch):
+    monkeypatch.setenv("COZE_WORKLOAD_IDENTITY_API_KEY", "test")
+    cfg = {"config": {"model": "model-full", "max_completion_tokens": 10000}, "sp": "You are Larry.", "routing": ROUTING}
+    models = build_router(cfg).models
+
+    def max_tokens(model):
+        return getattr(model, "primary", model).max_tokens
+
+    assert max_tokens(models["lite"]) == 300
+    # 档位未设置时不把 config.max_completion_tokens 作为上限
+    assert max_tokens(models["full"]) is None
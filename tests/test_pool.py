@@ -0,0 +1,49 @@
+import psycopg
+import pytest
+from langgraph.checkpoint.base import empty_checkpoint
+from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+from psycopg.rows import dict_row
+
+import storage.memory.pool as pool_module
+from storage.memory.pool import InstrumentedPool, create_pool
+
+
+def test_pool_connections_match_checkpointer_requirements():
+    pool = create_pool("postgresql://localhost/unused")
+    assert pool.kwargs == {"autocommit": True, "prepare_threshold": 0, "row_factory": dict_row}
+    # 每个连接池拿到自己的一份参数
+    assert pool.kwargs is not create_pool("postgresql://localhost/unused").kwargs
+    assert pool.stats()["checkouts"] == 0
+
+
+def test_rejects_unknown_check_policy():
+    with pytest.raises(ValueError):
+        InstrumentedPool("postgresql://localhost/unused", check_policy="sometimes", open=False)
+
+
+@pytest.mark.asyncio
+async def test_checkpoint_survives_returning_the_connection(pg_url, monkeypatch):
+    async with await psycopg.AsyncConnection.connect(pg_url, autocommit=True) as conn:
+        await conn.execute("CREATE SCHEMA IF NOT EXISTS memory")
+    url = f"{pg_url}{'&' if '?' in pg_url else '?'}options=-csearch_path%3Dmemory"
+    # 只有一个连接：写入与读取使用同一个（已归还过的）连接
+    monkeypatch.setattr(pool_module, "CHECKPOINT_POOL_MIN_SIZE", 1)
+    monkeypatch.setattr(pool_module, "CHECKPOINT_POOL_MAX_SIZE", 1)
+    pool = create_pool(url)
+    await pool.open(wait=True)
+    try:
+        saver = AsyncPostgresSaver(pool)
+        await saver.setup()
+        config = {"configurable": {"thread_id": "pool-test", "checkpoint_ns": ""}}
+        await saver.adelete_thread("pool-test")
+        stored = await saver.aput(config, empty_checkpoint(), {"step": 0}, {})
+
+        loaded = await saver.aget_tuple(config)
+        assert loaded.config["configurable"]["checkpoint_id"] == stored["configurable"]["checkpoint_id"]
+        # 另一个连接也能读到：写入已提交
+        async with await psycopg.AsyncConnection.connect(url) as other:
+            cur = await other.execute("SELECT count(*) FROM checkpoints WHERE thread_id = %s", ("pool-test",))
+            assert (await cur.fetchone())[0] == 1
+        await saver.adelete_thread("pool-test")
+    finally:
+        await pool.close()
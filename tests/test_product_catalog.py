@@ -0,0 +1,161 @@
+import json
+import os
+
+import pytest
+
+import tools.product_catalog as product_catalog
+from tools.product_catalog import CatalogStore, ProductCatalog, model_key, normalize_term, search_products
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DATA = {
+    "version": 1,
+    "url_base": "www.paperbagglue.com/products/",
+    "speed_bands": [{"name": "low", "max": 100}, {"name": "medium", "min": 100, "max": 250}, {"name": "high", "min": 250}],
+    "aliases": {
+        "application": {"paper bag": ["bags", "kraft bag", "纸袋"], "side seam": ["side glue", "糊边"]},
+        "machine_type": {"semi-automatic": ["semi auto", "半自动"], "automatic": ["fully automatic", "全自动"]},
+        "coating_method": {"roller": ["roller coating", "辊涂"]},
+    },
+    "products": [
+        {"model": "QL-306P", "slug": "ql-306p", "applications": ["paper bag"], "machine_types": ["automatic"], "speed_bands": ["high"]},
+        {
+            "model": "QL-118GH",
+            "slug": "ql-118gh",
+            "summary": "Stable roller application.",
+            "applications": ["paper bag"],
+            "machine_types": ["semi-automatic"],
+            "speed_bands": ["medium"],
+            "coating_methods": ["roller"],
+        },
+        {"model": "SIDE-GLUE-98", "name": "Side Glue 98", "slug": "side-glue-98", "applications": ["side seam"]},
+        {"model": "QL-108H", "applications": ["paper bag"], "speed_bands": ["low"]},
+    ],
+}
+
+
+@pytest.fixture
+def catalog():
+    return ProductCatalog(DATA)
+
+
+def models(results):
+    return [product["model"] for product, _ in results]
+
+
+def test_index_and_normalization(catalog):
+    assert normalize_term("  Semi-Automatic ") == normalize_term("semi automatic") == "semi automatic"
+    assert catalog.index["application"]["paper bag"] == {0, 1, 3}
+    assert catalog.index["coating_method"]["roller"] == {1}
+
+
+@pytest.mark.parametrize(
+    "field, text, expected",
+    [
+        ("application", "Kraft-Bag", ["paper bag"]),
+        ("application", "纸袋", ["paper bag"]),
+        ("application", "side glue for our bags", ["side seam", "paper bag"]),
+        ("machine_type", "Semi_Auto", ["semi automatic"]),
+        ("machine_type", "全自动", ["automatic"]),
+        ("coating_method", "we use roller coating", ["roller"]),
+        ("coating_method", "spray", []),
+    ],
+)
+def test_aliases_resolve_to_canonical_terms(catalog, field, text, expected):
+    assert catalog.resolve_terms(field, text) == expected
+
+
+@pytest.mark.parametrize("text", ["QL-118GH", "ql118gh", "ql 118gh", " Ql_118-GH "])
+def test_model_lookup_ignores_case_and_separators(catalog, text):
+    assert model_key(text) == "ql118gh"
+    assert catalog.get(text)["model"] == "QL-118GH"
+
+
+def test_lookup_by_name_and_slug(catalog):
+    assert catalog.get("Side Glue 98") is catalog.get("side-glue-98") is catalog.products[2]
+    assert catalog.get("QL-999") is None
+
+
+@pytest.mark.parametrize("speed, band", [(50, "low"), (99.9, "low"), (100, "medium"), (200, "medium"), (250, "high"), (600, "high")])
+def test_speed_bands(catalog, speed, band):
+    assert catalog.speed_band(speed) == band
+
+
+def test_search_ranks_by_matched_fields(catalog):
+    results = catalog.search("paper bag", "semi-auto", 200, "roller", limit=10)
+    assert models(results) == ["QL-118GH", "QL-306P", "QL-108H"]
+    assert results[0][1] == ["application", "machine_type", "coating_method", "speed_band"]
+    assert catalog.search() == []
+    assert catalog.search("bottle labels") == []
+
+
+def test_search_is_truncated_to_max_results(monkeypatch, catalog):
+    monkeypatch.setattr(product_catalog, "CATALOG_MAX_RESULTS", 2)
+    assert len(catalog.search("paper bag")) == 2
+    assert len(catalog.search("paper bag", limit=3)) == 3
+
+
+def test_catalog_rejects_products_without_model():
+    with pytest.raises(ValueError, match="no model"):
+        ProductCatalog({"products": [{"name": "unnamed"}]})
+
+
+def test_search_products_tool(monkeypatch, tmp_path):
+    path = tmp_path / "catalog.json"
+    path.write_text(json.dumps(DATA), encoding="utf-8")
+    store = CatalogStore(str(path), interval=0)
+    monkeypatch.setattr(product_catalog, "_catalog_store", store)
+    monkeypatch.setattr(product_catalog, "CATALOG_MAX_RESULTS", 1)
+
+    text = search_products.invoke({"application": "bags", "coating_method": "辊涂"})
+    assert text.splitlines() == [
+        "- QL-118GH (www.paperbagglue.com/products/ql-118gh) | Stable roller application. | applications: paper bag "
+        "| machine: semi-automatic | speed: medium | coating: roller [matched: application, coating_method]"
+    ]
+    assert "ql-118gh" in search_products.invoke({"model": "ql118gh"})
+    assert "No product" in search_products.invoke({"model": "QL-999"})
+    assert "No catalog product" in search_products.invoke({"application": "bottle labels"})
+    assert store.stats()["lookups"] == 4
+
+
+def write_catalog(path, data, mtime_offset):
+    path.write_text(data if isinstance(data, str) else json.dumps(data), encoding="utf-8")
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + mtime_offset * 1_000_000_000))
+
+
+def test_store_reloads_on_mtime_and_keeps_old_catalog_on_bad_file(tmp_path):
+    path = tmp_path / "catalog.json"
+    write_catalog(path, DATA, 0)
+    store = CatalogStore(str(path), interval=0.01)
+    first = store.current()
+    assert len(first.products) == 4
+
+    store._checked = 0
+    write_catalog(path, {**DATA, "products": DATA["products"][:2]}, 1)
+    second = store.current()
+    assert second is not first
+    assert len(second.products) == 2
+
+    store._checked = 0
+    write_catalog(path, "{broken", 2)
+    assert store.current() is second
+    stats = store.stats()
+    assert stats["reloads"] == 2
+    assert "JSONDecodeError" in stats["last_error"]
+
+    store._checked = 0
+    write_catalog(path, {**DATA, "products": [{"name": "no model"}]}, 3)
+    assert store.current() is second
+
+
+def test_missing_file_gives_an_empty_catalog(tmp_path):
+    store = CatalogStore(str(tmp_path / "missing.json"), interval=0)
+    assert store.current().products == []
+    assert store.stats()["last_error"]
+
+
+def test_shipped_catalog_loads():
+    catalog = ProductCatalog.load(os.path.join(ROOT, product_catalog.PRODUCT_CATALOG))
+    assert catalog.get("QL-118GH") is not None
+    assert models(catalog.search("paper bag", "semi-automatic", 200, "roller"))[0] == "QL-118GH"
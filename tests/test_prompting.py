@@ -0,0 +1,101 @@
+import re
+import types
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+import agents.prompting as prompting
+from agents.prompting import TokenUsage, assemble_system_prompt, message_usage, prompt_cache_key, prompt_cache_params
+from api.chat_service import ChatService
+from api.session_scheduler import Turn
+from utils.token_counter import count_message_tokens
+
+CONFIG = {
+    "config": {"model": "m"},
+    "sp": "# Role\n\nYou are Larry.\n\n## Style\n- Concise",
+    "sp_languages": {"header": "## Languages", "blocks": {"en": "| Hello | English |", "th": "| สวัสดี | Thai |"}},
+}
+
+
+@pytest.mark.parametrize(
+    "sp",
+    [
+        "# Role\r\n\r\nYou are Larry.\r\n\r\n## Style\r\n- Concise",
+        "# Role  \n\nYou are Larry.\t\n\n## Style\n- Concise   \n\n",
+        "\n\n# Role\r\rYou are Larry.\r\r## Style\r- Concise",
+    ],
+)
+def test_editor_differences_give_identical_bytes(sp):
+    assert assemble_system_prompt({**CONFIG, "sp": sp}).encode() == assemble_system_prompt(CONFIG).encode()
+
+
+def test_prompt_is_stable_and_shares_the_core_prefix():
+    full = assemble_system_prompt(CONFIG)
+    assert assemble_system_prompt(CONFIG) == full
+    assert full.endswith("## Languages\n| Hello | English |\n| สวัสดี | Thai |")
+    core = assemble_system_prompt({**CONFIG, "sp_languages": None})
+    for language in ("en", "th", None, "fr"):
+        assert assemble_system_prompt(CONFIG, language).startswith(core + "\n\n")
+    assert assemble_system_prompt(CONFIG, "th") == core + "\n\n## Languages\n| สวัสดี | Thai |"
+    # 没有独立语言段的语言使用完整提示词
+    assert assemble_system_prompt(CONFIG, "fr") == full
+
+
+def test_prompt_cache_key_follows_the_prompt_bytes():
+    prompt = assemble_system_prompt(CONFIG)
+    key = prompt_cache_key(prompt)
+    assert re.fullmatch(r"sp-[0-9a-f]{16}", key)
+    assert prompt_cache_key(assemble_system_prompt({**CONFIG, "sp": CONFIG["sp"].replace("\n", "\r\n")})) == key
+    assert prompt_cache_key(prompt + " ") != key
+
+
+def test_prompt_cache_params(monkeypatch):
+    prompt = assemble_system_prompt(CONFIG)
+    monkeypatch.setattr(prompting, "PROMPT_CACHE_HINT", "none")
+    assert prompt_cache_params(CONFIG, prompt) == {}
+    monkeypatch.setattr(prompting, "PROMPT_CACHE_HINT", "prompt_cache_key")
+    assert prompt_cache_params(CONFIG, prompt) == {"prompt_cache_key": prompt_cache_key(prompt)}
+    # 配置中的 prompt_cache_hint 覆盖环境变量
+    assert prompt_cache_params({**CONFIG, "config": {"model": "m", "prompt_cache_hint": "none"}}, prompt) == {}
+    assert prompt_cache_params({**CONFIG, "config": {"model": "m", "prompt_cache_hint": "bogus"}}, prompt) == {}
+
+
+def ai(content, input_tokens, output_tokens, cached=0):
+    usage = {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+    if cached:
+        usage["input_token_details"] = {"cache_read": cached}
+    return AIMessage(content=content, usage_metadata=usage)
+
+
+def test_message_usage_sums_model_calls():
+    messages = [HumanMessage(content="hi"), ai("", 1000, 20, cached=800), ai("reply", 1100, 40, cached=1000), AIMessage(content="no usage")]
+    assert message_usage(messages) == {"input": 2100, "cached": 1800, "output": 60, "calls": 2}
+
+
+def test_token_usage_in_stats():
+    service = ChatService()
+    version = types.SimpleNamespace(prompt_tokens=lambda language: 500)
+    history = [HumanMessage(content="earlier question", id="h0"), ai("earlier answer", 900, 30, cached=600)]
+
+    turn = Turn("s1")
+    turn.add_message("which glue for kraft bags?")
+    messages = history + turn.messages + [ai("QL-118GH", 1000, 50, cached=800)]
+    service._record_usage(version, turn, messages)
+
+    stats = service.stats()["token_usage"]
+    # 只统计本轮的模型调用，历史消息上的 usage 不重复计入
+    assert stats["requests"] == 1
+    assert (stats["input_tokens"], stats["cached_tokens"], stats["output_tokens"]) == (1000, 800, 50)
+    assert stats["cache_hit_rate"] == 0.8
+    assert stats["avg_prompt_estimate"] == 500 + count_message_tokens(history + turn.messages)
+
+
+def test_token_usage_averages():
+    usage = TokenUsage()
+    usage.record({"input": 1000, "cached": 0, "output": 10}, 900)
+    usage.record({"input": 3000, "cached": 3000, "output": 30}, 2900)
+    stats = usage.stats()
+    assert stats["cache_hit_rate"] == 0.75
+    assert stats["avg_input_tokens"] == 2000
+    assert stats["avg_prompt_estimate"] == 1900
+    assert TokenUsage().stats()["cache_hit_rate"] == 0.0
@@ -0,0 +1,129 @@
+import pytest
+from langgraph.checkpoint.base import empty_checkpoint
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+
+from storage.memory.pool import create_pool
+import storage.memory.read_cache as read_cache
+import utils.serving as serving
+from storage.memory.read_cache import ReadCachedSaver
+
+CONFIG = {"configurable": {"thread_id": "t1", "checkpoint_ns": ""}}
+
+
+def checkpoint_id(config):
+    return config["configurable"]["checkpoint_id"]
+
+
+@pytest.mark.asyncio
+async def test_serves_own_writes_from_cache():
+    cache = ReadCachedSaver(InMemorySaver(), validate=True)
+    stored = await cache.aput(CONFIG, empty_checkpoint(), {"step": 0}, {})
+
+    first = await cache.aget_tuple(CONFIG)
+    assert checkpoint_id(first.config) == checkpoint_id(stored)
+    assert await cache.aget_tuple(CONFIG) is first
+    stats = cache.stats()
+    assert stats["hits"] == 2
+    assert stats["validations"] == 2
+    assert stats["stale_hits"] == 0
+
+
+@pytest.mark.asyncio
+async def test_refetches_after_another_worker_writes_a_checkpoint():
+    backend = InMemorySaver()
+    cache = ReadCachedSaver(backend, validate=True)
+    stored = await cache.aput(CONFIG, empty_checkpoint(), {"step": 0}, {})
+    # 另一个 worker 直接写入数据库
+    newer = await backend.aput(stored, empty_checkpoint(), {"step": 1}, {})
+
+    latest = await cache.aget_tuple(CONFIG)
+    assert checkpoint_id(latest.config) == checkpoint_id(newer)
+    assert cache.stats()["stale_hits"] == 1
+    # 回源结果已回填，下次读取命中
+    assert await cache.aget_tuple(CONFIG) is latest
+    assert cache.stats()["hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_refetches_after_another_worker_adds_writes():
+    backend = InMemorySaver()
+    cache = ReadCachedSaver(backend, validate=True)
+    stored = await cache.aput(CONFIG, empty_checkpoint(), {"step": 0}, {})
+    await backend.aput_writes(stored, [("messages", "partial")], task_id="task")
+
+    latest = await cache.aget_tuple(CONFIG)
+    assert latest.pending_writes == [("task", "messages", "partial")]
+    assert cache.stats()["stale_hits"] == 1
+
+
+def test_sync_reads_always_go_to_backend():
+    backend = InMemorySaver()
+    cache = ReadCachedSaver(backend, validate=True)
+    stored = cache.put(CONFIG, empty_checkpoint(), {"step": 0}, {})
+    newer = backend.put(stored, empty_checkpoint(), {"step": 1}, {})
+    assert checkpoint_id(cache.get_tuple(CONFIG).config) == checkpoint_id(newer)
+
+
+@pytest.mark.asyncio
+async def test_workers_see_each_others_writes_on_postgres(pg_url):
+    url = f"{pg_url}{'&' if '?' in pg_url else '?'}options=-csearch_path%3Dmemory"
+    pools = [create_pool(url), create_pool(url)]
+    try:
+        for pool in pools:
+            await pool.open(wait=True)
+        async with pools[0].connection() as conn:
+            await conn.execute("CREATE SCHEMA IF NOT EXISTS memory")
+        await AsyncPostgresSaver(pools[0]).setup()
+        worker_a, worker_b = (ReadCachedSaver(AsyncPostgresSaver(pool), validate=True) for pool in pools)
+        config = {"configurable": {"thread_id": "read-cache-test", "checkpoint_ns": ""}}
+        await worker_a.adelete_thread("read-cache-test")
+
+        first = await worker_a.aput(config, empty_checkpoint(), {"step": 0}, {})
+        assert checkpoint_id((await worker_b.aget_tuple(config)).config) == checkpoint_id(first)
+        second = await worker_a.aput(first, empty_checkpoint(), {"step": 1}, {})
+        assert checkpoint_id((await worker_b.aget_tuple(config)).config) == checkpoint_id(second)
+        assert worker_b.stats()["stale_hits"] == 1
+        assert await worker_b.aget_tuple(config) is not None
+        assert worker_b.stats()["hits"] == 1
+
+        await worker_a.adelete_thread("read-cache-test")
+    finally:
+        for pool in pools:
+            await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_single_worker_trusts_own_writes_without_querying():
+    class CountingSaver(InMemorySaver):
+        reads = 0
+
+        async def aget_tuple(self, config):
+            self.reads += 1
+            return await super().aget_tuple(config)
+
+    backend = CountingSaver()
+    cache = ReadCachedSaver(backend, validate=False)
+    stored = await cache.aput(CONFIG, empty_checkpoint(), {"step": 0}, {})
+    assert checkpoint_id((await cache.aget_tuple(CONFIG)).config) == checkpoint_id(stored)
+    assert cache.get_tuple(CONFIG) is await cache.aget_tuple(CONFIG)
+    assert backend.reads == 0
+
+    # 本进程的 writes 使缓存失效，下次读取回源拿到完整的 pending writes
+    await cache.aput_writes(stored, [("messages", "partial")], task_id="task")
+    assert (await cache.aget_tuple(CONFIG)).pending_writes == [("task", "messages", "partial")]
+    assert backend.reads == 1
+    stats = cache.stats()
+    assert stats["validations"] == 0
+    assert stats["hits"] == 3
+
+
+@pytest.mark.parametrize(
+    "setting, concurrency, expected",
+    [("auto", "auto", True), ("auto", "1", False), ("auto", "4", True), ("1", "1", True), ("0", "4", False)],
+)
+def test_validation_follows_worker_count(monkeypatch, setting, concurrency, expected):
+    monkeypatch.setattr(read_cache, "CHECKPOINT_READ_CACHE_VALIDATE", setting)
+    monkeypatch.setattr(serving, "available_cpus", lambda: 2)
+    monkeypatch.setattr(serving, "WEB_CONCURRENCY", concurrency)
+    assert ReadCachedSaver(InMemorySaver()).validate is expected
@@ -0,0 +1,73 @@
+from typing import Any, Dict, List
+
+import pytest
+from coze_coding_utils.runtime_ctx.context import new_context
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langgraph.checkpoint.memory import InMemorySaver
+
+import agents.agent as agent_module
+from agents.agent import compile_agent
+from agents.request_headers import llm_request_headers
+
+CONFIG = {"config": {"model": "model-a"}, "sp": "You are Larry.", "tools": []}
+
+
+class HeaderCapturingModel(BaseChatModel):
+    """记录每次调用收到的 extra_headers"""
+
+    headers: List[Dict[str, str]] = []
+    built: List[Any] = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "header-capturing"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        self.headers.append(dict(kwargs.get("extra_headers") or {}))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="ok"))])
+
+
+@pytest.fixture
+def model(monkeypatch):
+    model = HeaderCapturingModel()
+
+    def build_llm(cfg, ctx=None, max_tokens=None):
+        model.built.append(ctx)
+        return model
+
+    monkeypatch.setattr(agent_module, "build_llm", build_llm)
+    return model
+
+
+def request_context(logid: str, env: str):
+    return new_context("stream_sse", {"x-tt-logid": logid, "x-tt-env": env})
+
+
+@pytest.mark.asyncio
+async def test_headers_follow_each_request_on_a_shared_agent(model):
+    agent = compile_agent(CONFIG, checkpointer=InMemorySaver())
+
+    for i, (logid, env) in enumerate([("log-1", "ppe_a"), ("log-2", "ppe_b")]):
+        ctx = request_context(logid, env)
+        config = {"configurable": {"thread_id": f"s{i}"}}
+        await agent.ainvoke({"messages": [("user", "hi")]}, config, context=ctx)
+
+    assert [(h["x-tt-logid"], h["x-tt-env"]) for h in model.headers] == [("log-1", "ppe_a"), ("log-2", "ppe_b")]
+    # Agent 与模型只在编译时构建一次，不随请求重建
+    assert model.built == [None]
+
+
+def test_extra_headers_are_merged_for_sync_calls(model):
+    agent = compile_agent(CONFIG, checkpointer=InMemorySaver())
+    config = {"configurable": {"thread_id": "s1"}}
+
+    with llm_request_headers({"x-request-source": "widget"}):
+        agent.invoke({"messages": [("user", "hi")]}, config, context=request_context("log-3", "prod"))
+    agent.invoke({"messages": [("user", "again")]}, config)
+
+    assert model.headers[0]["x-request-source"] == "widget"
+    assert model.headers[0]["x-tt-logid"] == "log-3"
+    # 请求结束后不再携带上一请求的调用头
+    assert model.headers[1] == {}
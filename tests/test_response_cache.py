@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+
+from api.response_cache import ResponseCache, normalize_message, split_for_replay
+
+
+def test_normalize_message():
+    assert normalize_message("  Ｈｅｌｌｏ   World!! ") == "hello world"
+    assert normalize_message("你好！") == "你好"
+
+
+def test_key_skips_empty_and_long_messages():
+    cache = ResponseCache(max_message_chars=10)
+    assert cache.key("Hi!", "cfg") == ("hi", "cfg")
+    assert cache.key("?!", "cfg") is None
+    assert cache.key("x" * 11, "cfg") is None
+
+
+@pytest.mark.parametrize("text", ["Hello there, how can I help?", "  leading space\nnew line ", "你好，请问有什么可以帮您"])
+def test_replay_pieces_rebuild_the_reply(text):
+    assert "".join(split_for_replay(text)) == text
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_call_the_model_once():
+    cache = ResponseCache()
+    calls = 0
+    release = asyncio.Event()
+
+    async def compute():
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        return "hello!"
+
+    key = cache.key("hello", "cfg")
+    tasks = [asyncio.create_task(cache.get_or_compute(key, compute)) for _ in range(5)]
+    await asyncio.sleep(0)
+    release.set()
+    results = await asyncio.gather(*tasks)
+
+    assert calls == 1
+    assert sorted(computed for _, computed in results) == [False] * 4 + [True]
+    assert {reply for reply, _ in results} == {"hello!"}
+    assert await cache.get_or_compute(key, compute) == ("hello!", False)
+    assert cache.stats() == {"entries": 1, "hits": 1, "misses": 1, "shared": 4}
+
+
+@pytest.mark.asyncio
+async def test_waiters_compute_themselves_when_the_leader_fails():
+    cache = ResponseCache()
+    release = asyncio.Event()
+
+    async def failing():
+        await release.wait()
+        raise RuntimeError("model unavailable")
+
+    async def succeeding():
+        return "fallback"
+
+    key = cache.key("hello", "cfg")
+    leader = asyncio.create_task(cache.get_or_compute(key, failing))
+    await asyncio.sleep(0)
+    follower = asyncio.create_task(cache.get_or_compute(key, succeeding))
+    await asyncio.sleep(0)
+    release.set()
+
+    with pytest.raises(RuntimeError):
+        await leader
+    assert await follower == ("fallback", True)
+    assert cache.stats()["shared"] == 0
+
+
+@pytest.mark.asyncio
+async def test_empty_reply_is_not_cached():
+    cache = ResponseCache()
+
+    async def empty():
+        return ""
+
+    key = cache.key("hello", "cfg")
+    assert await cache.get_or_compute(key, empty) == ("", True)
+    assert cache.stats()["entries"] == 0
@@ -0,0 +1,139 @@
+import asyncio
+import uuid
+
+import psycopg
+import pytest
+from langgraph.checkpoint.base import empty_checkpoint
+from langgraph.checkpoint.postgres import PostgresSaver
+from psycopg.rows import dict_row
+
+import storage.memory.retention as retention_module
+from storage.memory.retention import CheckpointRetention, RetentionReport, retention_loop
+
+
+class KeysetOnly(CheckpointRetention):
+    """只模拟候选会话的键集分页查询"""
+
+    def __init__(self, thread_ids, batch_size):
+        super().__init__(conn=None, batch_size=batch_size)
+        self.thread_ids = sorted(thread_ids)
+        self.queries = []
+
+    def _column(self, sql, params):
+        cursor, limit = params
+        self.queries.append((">=" if ">=" in sql else ">", cursor))
+        if ">=" in sql:
+            rows = [t for t in self.thread_ids if t >= cursor]
+        else:
+            rows = [t for t in self.thread_ids if t > cursor]
+        return rows[:limit]
+
+
+def test_candidate_batches_walk_threads_once():
+    retention = KeysetOnly([f"t{i:02d}" for i in range(7)], batch_size=3)
+    batches = list(retention._candidate_batches())
+    assert batches == [["t00", "t01", "t02"], ["t03", "t04", "t05"], ["t06"]]
+    assert retention.queries == [(">=", ""), (">", "t02"), (">", "t05")]
+
+
+def test_candidate_batches_stop_after_exact_multiple():
+    retention = KeysetOnly(["a", "b"], batch_size=2)
+    assert list(retention._candidate_batches()) == [["a", "b"]]
+    assert retention.queries[-1] == (">", "b")
+
+
+def test_report_totals():
+    report = RetentionReport()
+    report.add("checkpoints", (3, 300))
+    report.add("checkpoint_blobs", (2, 50))
+    report.threads = 1
+    result = report.to_dict()
+    assert result["deleted_rows"] == {"checkpoints": 3, "checkpoint_writes": 0, "checkpoint_blobs": 2}
+    assert result["reclaimed_bytes"] == 350
+    assert result["deleted_threads"] == 1
+
+
+@pytest.mark.asyncio
+async def test_retention_loop_keeps_running_after_failures(monkeypatch):
+    calls = []
+
+    def run_retention():
+        calls.append(len(calls))
+        if len(calls) == 1:
+            raise RuntimeError("Database is not available")
+        return {}
+
+    monkeypatch.setattr(retention_module, "run_retention", run_retention)
+    task = asyncio.create_task(retention_loop(interval_hours=0.01 / 3600))
+    while len(calls) < 3:
+        await asyncio.sleep(0.01)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    # 首次执行失败只记录日志，后续按间隔继续执行
+    assert len(calls) >= 3
+
+
+@pytest.fixture
+def retention_schema(pg_url):
+    schema = f"retention_test_{uuid.uuid4().hex[:8]}"
+    admin = psycopg.connect(pg_url, autocommit=True)
+    admin.execute(f"CREATE SCHEMA {schema}")
+    url = f"{pg_url}{'&' if '?' in pg_url else '?'}options=-csearch_path%3D{schema}"
+    try:
+        with psycopg.connect(url, autocommit=True, prepare_threshold=0, row_factory=dict_row) as conn:
+            PostgresSaver(conn).setup()
+        yield url
+    finally:
+        admin.execute(f"DROP SCHEMA {schema} CASCADE")
+        admin.close()
+
+
+def write_thread(saver, thread_id, steps, ts=None):
+    """写入 steps 个连续的 checkpoint：messages 每步更新，profile 只在第一步写入"""
+    config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+    version = None
+    profile_version = saver.get_next_version(None, None)
+    for step in range(steps):
+        version = saver.get_next_version(version, None)
+        checkpoint = empty_checkpoint()
+        if ts:
+            checkpoint["ts"] = ts
+        checkpoint["channel_values"] = {"messages": [f"{thread_id}-{step}"], "profile": {"name": thread_id}}
+        checkpoint["channel_versions"] = {"messages": version, "profile": profile_version}
+        new_versions = {"messages": version, **({"profile": profile_version} if step == 0 else {})}
+        config = saver.put(config, checkpoint, {"step": step}, new_versions)
+    return config
+
+
+def test_retention_on_postgres(retention_schema):
+    url = retention_schema
+    with psycopg.connect(url, autocommit=True, prepare_threshold=0, row_factory=dict_row) as saver_conn, \
+            psycopg.connect(url, autocommit=True) as conn:
+        saver = PostgresSaver(saver_conn)
+        for i in range(5):
+            write_thread(saver, f"active-{i}", steps=4)
+        write_thread(saver, "idle", steps=2, ts="2020-01-01T00:00:00+00:00")
+        # 正在写入的 checkpoint：blob 已写入，checkpoint 行尚未写入
+        conn.execute(
+            "INSERT INTO checkpoint_blobs (thread_id, checkpoint_ns, channel, version, type, blob) VALUES (%s, '', 'messages', %s, 'json', %s)",
+            ("active-0", "99999999999999999999999999999999.0.1", b"[]"),
+        )
+
+        retention = CheckpointRetention(conn, keep=2, ttl_days=30, batch_size=2, pause=0)
+        assert retention.estimate() == {"idle_threads": 1, "expired_checkpoints": 10}
+        result = retention.run()
+
+        assert result["scanned_threads"] == 6
+        assert result["deleted_threads"] == 1
+        assert result["deleted_checkpoints"] == 10
+        assert result["batches"] == 3
+        assert conn.execute("SELECT count(*) FROM checkpoints").fetchone()[0] == 10
+        assert conn.execute("SELECT count(*) FROM checkpoints WHERE thread_id = 'idle'").fetchone()[0] == 0
+        # 每个会话：保留的 2 个 messages 版本 + 第一步写入、仍被引用的 profile；外加正在写入的 blob
+        assert conn.execute("SELECT count(*) FROM checkpoint_blobs").fetchone()[0] == 5 * 3 + 1
+        for i in range(5):
+            latest = saver.get_tuple({"configurable": {"thread_id": f"active-{i}", "checkpoint_ns": ""}})
+            assert latest.checkpoint["channel_values"] == {"messages": [f"active-{i}-3"], "profile": {"name": f"active-{i}"}}
+
+        assert retention.estimate() == {"idle_threads": 0, "expired_checkpoints": 0}
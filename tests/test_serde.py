@@ -0,0 +1,59 @@
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+import storage.memory.serde as serde_module
+from storage.memory.serde import ZSTD_SUFFIX, ZstdSerializer, create_serializer, train_dictionary
+
+pytest.importorskip("zstandard")
+
+
+def conversation(i):
+    return [
+        HumanMessage(content=f"Question {i}: which glue fits a 200 m/min bag machine?", id=f"h{i}"),
+        AIMessage(content=f"Answer {i}: we recommend QL-118GH for roller coating. " * 3, id=f"a{i}"),
+    ]
+
+
+def test_large_values_are_compressed_and_round_trip():
+    serde = ZstdSerializer(min_bytes=64)
+    value = conversation(1) * 5
+    typ, data = serde.dumps_typed(value)
+    assert typ.endswith(ZSTD_SUFFIX)
+    assert len(data) < len(JsonPlusSerializer().dumps_typed(value)[1])
+    assert serde.loads_typed((typ, data)) == value
+    stats = serde.stats()
+    assert stats["compressed"] == 1
+    assert stats["ratio"] > 1
+
+
+def test_small_values_are_stored_as_is():
+    serde = ZstdSerializer(min_bytes=1024)
+    assert serde.dumps_typed("hi") == JsonPlusSerializer().dumps_typed("hi")
+    assert serde.stats()["skipped"] == 1
+
+
+def test_reads_rows_written_before_compression():
+    legacy = JsonPlusSerializer().dumps_typed(conversation(2))
+    assert ZstdSerializer(min_bytes=0).loads_typed(legacy) == conversation(2)
+
+
+def test_dictionary_rotation_keeps_old_rows_readable():
+    samples = [JsonPlusSerializer().dumps_typed(conversation(i))[1] for i in range(400)]
+    old_dict = train_dictionary(samples, size=4096)
+    new_dict = train_dictionary(samples[::-1], size=2048)
+    value = conversation(999)
+
+    written = ZstdSerializer(min_bytes=0, dictionary=old_dict).dumps_typed(value)
+    rotated = ZstdSerializer(min_bytes=0, dictionary=new_dict, extra_dictionaries=[old_dict])
+    assert rotated.loads_typed(written) == value
+
+    with pytest.raises(ValueError, match="unknown zstd dictionary"):
+        ZstdSerializer(min_bytes=0, dictionary=new_dict).loads_typed(written)
+
+
+def test_compression_can_be_disabled(monkeypatch):
+    monkeypatch.setattr(serde_module, "CHECKPOINT_COMPRESSION", "none")
+    assert create_serializer() is None
+    monkeypatch.setattr(serde_module, "CHECKPOINT_COMPRESSION", "zstd")
+    assert isinstance(create_serializer(), ZstdSerializer)
@@ -0,0 +1,36 @@
+import pytest
+
+import utils.serving as serving
+
+
+@pytest.mark.parametrize("value, expected", [("1", 1), ("3", 3), ("0", 1), ("many", 1)])
+def test_resolve_worker_count(monkeypatch, value, expected):
+    monkeypatch.setattr(serving, "WEB_CONCURRENCY", value)
+    assert serving.resolve_worker_count() == expected
+
+
+@pytest.mark.parametrize("value", ["auto", "AUTO", ""])
+def test_auto_worker_count_uses_cpus(monkeypatch, value):
+    monkeypatch.setattr(serving, "WEB_CONCURRENCY", value)
+    monkeypatch.setattr(serving, "available_cpus", lambda: 6)
+    assert serving.resolve_worker_count() == 6
+
+
+def test_single_process_features_refuse_multiple_workers(monkeypatch):
+    import storage.memory.write_behind as write_behind
+
+    monkeypatch.setattr(write_behind, "CHECKPOINT_WRITE_MODE", "write_behind")
+    serving.check_worker_count(1)
+    with pytest.raises(RuntimeError, match="WEB_CONCURRENCY=1"):
+        serving.check_worker_count(2)
+
+
+def test_multiple_workers_allowed_without_single_process_features(monkeypatch):
+    import storage.memory.read_cache as read_cache
+    import storage.memory.write_behind as write_behind
+
+    monkeypatch.setattr(write_behind, "CHECKPOINT_WRITE_MODE", "sync")
+    # 读缓存命中时核对数据库中的最新版本，可以多进程运行
+    monkeypatch.setattr(read_cache, "CHECKPOINT_READ_CACHE_ENABLED", True)
+    assert serving.single_process_features() == []
+    serving.check_worker_count(4)
@@ -0,0 +1,213 @@
+import asyncio
+
+import psycopg
+import pytest
+
+import api.session_lock as session_lock
+from api.session_lock import SessionLock, SessionLockLost
+
+
+class FakeAdvisoryDatabase:
+    """按连接记录 advisory lock 的持有者与重入次数（与 Postgres 会话级 advisory lock 语义一致）"""
+
+    def __init__(self):
+        self.locks = {}
+
+    def connect(self):
+        database = self
+
+        class Cursor:
+            def __init__(self, value):
+                self.value = value
+
+            async def fetchone(self):
+                return (self.value,)
+
+        class Connection:
+            closed = False
+            broken = False
+
+            async def execute(self, sql, params=()):
+                if self.broken:
+                    raise psycopg.OperationalError("server closed the connection")
+                if sql == "SELECT 1":
+                    return Cursor(1)
+                key = tuple(params)
+                owner, count = database.locks.get(key, (None, 0))
+                if "pg_try_advisory_lock" in sql:
+                    if owner not in (None, self):
+                        return Cursor(False)
+                    database.locks[key] = (self, count + 1)
+                    return Cursor(True)
+                assert owner is self
+                if count == 1:
+                    del database.locks[key]
+                else:
+                    database.locks[key] = (self, count - 1)
+                return Cursor(True)
+
+            async def close(self):
+                # 连接关闭时数据库释放它持有的全部锁
+                self.closed = True
+                for key, (owner, _count) in list(database.locks.items()):
+                    if owner is self:
+                        del database.locks[key]
+
+        async def connect():
+            return Connection()
+
+        return connect
+
+
+@pytest.mark.asyncio
+async def test_in_process_exclusion_without_database():
+    async def unavailable():
+        return None
+
+    lock = SessionLock(connect=unavailable)
+    events = []
+
+    async def turn(name):
+        async with lock.hold("s1"):
+            events.append(f"{name}-in")
+            await asyncio.sleep(0.01)
+            events.append(f"{name}-out")
+
+    await asyncio.gather(turn("a"), turn("b"))
+    assert events in (["a-in", "a-out", "b-in", "b-out"], ["b-in", "b-out", "a-in", "a-out"])
+    assert lock.stats()["mode"] == "process"
+
+
+@pytest.mark.asyncio
+async def test_try_once_times_out_while_held():
+    async def unavailable():
+        return None
+
+    lock = SessionLock(connect=unavailable)
+    async with lock.hold("s1"):
+        with pytest.raises(TimeoutError):
+            async with lock.hold("s1", timeout=0):
+                pass
+        # 其他会话不受影响
+        async with lock.hold("s2", timeout=0):
+            pass
+    async with lock.hold("s1", timeout=0):
+        pass
+    assert lock.stats()["timeouts"] == 1
+
+
+@pytest.mark.asyncio
+async def test_workers_exclude_each_other(monkeypatch):
+    monkeypatch.setattr(session_lock, "SESSION_LOCK_POLL_INTERVAL", 0.005)
+    database = FakeAdvisoryDatabase()
+    worker_a = SessionLock(connect=database.connect())
+    worker_b = SessionLock(connect=database.connect())
+    events = []
+
+    async def turn(lock, name, delay):
+        await asyncio.sleep(delay)
+        async with lock.hold("s1"):
+            events.append(f"{name}-in")
+            await asyncio.sleep(0.02)
+            events.append(f"{name}-out")
+
+    await asyncio.gather(turn(worker_a, "a", 0), turn(worker_b, "b", 0.005))
+    assert events == ["a-in", "a-out", "b-in", "b-out"]
+    assert worker_b.stats()["contended"] == 1
+    assert database.locks == {}
+
+    # 另一个 worker 持锁时按截止时间放弃
+    async with worker_a.hold("s1"):
+        with pytest.raises(TimeoutError):
+            async with worker_b.hold("s1", timeout=0.02):
+                pass
+    assert database.locks == {}
+
+
+@pytest.mark.asyncio
+async def test_lock_is_released_when_the_turn_is_cancelled():
+    database = FakeAdvisoryDatabase()
+    lock = SessionLock(connect=database.connect())
+    entered = asyncio.Event()
+
+    async def turn():
+        async with lock.hold("s1"):
+            entered.set()
+            await asyncio.sleep(10)
+
+    task = asyncio.create_task(turn())
+    await entered.wait()
+    assert database.locks
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert database.locks == {}
+
+
+@pytest.mark.asyncio
+async def test_broken_connection_reconnects():
+    database = FakeAdvisoryDatabase()
+    lock = SessionLock(connect=database.connect())
+    async with lock.hold("s1"):
+        pass
+    lock._conn.broken = True
+    async with lock.hold("s1"):
+        assert database.locks
+    assert lock.stats()["errors"] == 1
+    assert database.locks == {}
+
+
+@pytest.mark.asyncio
+async def test_lease_verifies_the_lock_is_still_held():
+    database = FakeAdvisoryDatabase()
+    lock = SessionLock(connect=database.connect())
+    async with lock.hold("s1") as lease:
+        await lease.verify()
+
+    # 持有期间连接断开：数据库已释放锁，本轮不能再提交
+    async with lock.hold("s1") as lease:
+        lease.conn.broken = True
+        with pytest.raises(SessionLockLost):
+            await lease.verify()
+        assert database.locks == {}
+    stats = lock.stats()
+    assert (stats["lost"], stats["errors"]) == (1, 1)
+
+    # 连接被其他协程发现断开并替换
+    async with lock.hold("s1") as first:
+        await lock._drop_connection(first.conn)
+        async with lock.hold("s2") as second:
+            await second.verify()
+        with pytest.raises(SessionLockLost):
+            await first.verify()
+    assert lock.stats()["lost"] == 2
+
+
+@pytest.mark.asyncio
+async def test_lease_without_database_always_verifies():
+    async def unavailable():
+        return None
+
+    lock = SessionLock(connect=unavailable)
+    async with lock.hold("s1") as lease:
+        assert lease.conn is None
+        await lease.verify()
+
+
+@pytest.mark.asyncio
+async def test_advisory_lock_on_postgres(pg_url):
+    async def connect():
+        return await psycopg.AsyncConnection.connect(pg_url, autocommit=True)
+
+    worker_a = SessionLock(connect=connect)
+    worker_b = SessionLock(connect=connect)
+    try:
+        async with worker_a.hold("pg-session"):
+            with pytest.raises(TimeoutError):
+                async with worker_b.hold("pg-session", timeout=0.1):
+                    pass
+        async with worker_b.hold("pg-session", timeout=1):
+            assert worker_b.stats()["mode"] == "postgres"
+    finally:
+        await worker_a.close()
+        await worker_b.close()
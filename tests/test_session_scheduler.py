@@ -0,0 +1,123 @@
+import asyncio
+
+import pytest
+
+from api.session_scheduler import SessionScheduler
+
+
+@pytest.mark.asyncio
+async def test_turns_of_one_session_run_serially_and_coalesce():
+    running = 0
+    max_running = 0
+    started = asyncio.Event()
+    release = asyncio.Event()
+    seen = []
+
+    async def runner(turn):
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        seen.append([m.content for m in turn.messages])
+        started.set()
+        await release.wait()
+        running -= 1
+        return "reply " + "+".join(m.content for m in turn.messages)
+
+    scheduler = SessionScheduler(runner)
+    first = scheduler.submit("s1", "a")
+    await started.wait()
+    # 第一轮运行期间到达的两条消息合并进同一轮
+    second = scheduler.submit("s1", "b")
+    third = scheduler.submit("s1", "c")
+    assert second is third
+    release.set()
+
+    assert await first.result() == "reply a"
+    assert await second.result() == "reply b+c"
+    assert seen == [["a"], ["b", "c"]]
+    assert max_running == 1
+    for turn in (first, second, third):
+        scheduler.release(turn)
+    await asyncio.sleep(0)
+    assert scheduler.active_sessions == 0
+
+
+@pytest.mark.asyncio
+async def test_sessions_run_concurrently():
+    gate = asyncio.Event()
+    running = set()
+
+    async def runner(turn):
+        running.add(turn.session_id)
+        if len(running) == 2:
+            gate.set()
+        await gate.wait()
+        return turn.session_id
+
+    scheduler = SessionScheduler(runner)
+    a = scheduler.submit("a", "hi")
+    b = scheduler.submit("b", "hi")
+    assert await asyncio.wait_for(a.result(), 1) == "a"
+    assert await asyncio.wait_for(b.result(), 1) == "b"
+
+
+@pytest.mark.asyncio
+async def test_turn_is_cancelled_when_all_waiters_leave():
+    cancelled = asyncio.Event()
+    started = asyncio.Event()
+
+    async def runner(turn):
+        started.set()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    scheduler = SessionScheduler(runner)
+    turn = scheduler.submit("s1", "hi")
+    turn.waiters += 1  # 模拟第二个等待者
+    await started.wait()
+    scheduler.release(turn)
+    await asyncio.sleep(0.01)
+    assert not cancelled.is_set()
+    scheduler.release(turn)
+    await asyncio.wait_for(cancelled.wait(), 1)
+    with pytest.raises(asyncio.CancelledError):
+        await turn.result()
+
+
+@pytest.mark.asyncio
+async def test_chunks_are_replayed_to_late_subscribers():
+    async def runner(turn):
+        turn.publish("Hel")
+        turn.publish("lo")
+        return None
+
+    scheduler = SessionScheduler(runner)
+    turn = scheduler.submit("s1", "hi")
+    assert await turn.result() == "Hello"
+    assert [chunk async for chunk in turn.subscribe()] == ["Hel", "lo"]
+
+
+@pytest.mark.asyncio
+async def test_after_turn_runs_before_next_turn_and_failures_are_isolated():
+    order = []
+
+    async def runner(turn):
+        order.append(("run", turn.messages[0].content))
+        if turn.messages[0].content == "boom":
+            raise ValueError("boom")
+        return "ok"
+
+    async def after_turn(turn):
+        order.append(("after", turn.messages[0].content))
+        raise RuntimeError("after_turn errors are logged, not raised")
+
+    scheduler = SessionScheduler(runner, after_turn=after_turn)
+    first = scheduler.submit("s1", "one")
+    assert await first.result() == "ok"
+    failed = scheduler.submit("s1", "boom")
+    with pytest.raises(ValueError):
+        await failed.result()
+    assert order == [("run", "one"), ("after", "one"), ("run", "boom")]
@@ -0,0 +1,72 @@
+import asyncio
+import threading
+
+import pytest
+from langgraph.checkpoint.base import empty_checkpoint
+from langgraph.checkpoint.memory import InMemorySaver
+
+from storage.memory.shared import SharedCheckpointer, run_async, run_sync
+
+CONFIG = {"configurable": {"thread_id": "t1", "checkpoint_ns": ""}}
+
+
+@pytest.fixture
+def background_loop():
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield loop
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+
+
+class LoopRecordingSaver(InMemorySaver):
+    """记录异步写入执行在哪个事件循环上"""
+
+    def __init__(self):
+        super().__init__()
+        self.loops = set()
+
+    async def aput(self, *args, **kwargs):
+        self.loops.add(asyncio.get_running_loop())
+        return await super().aput(*args, **kwargs)
+
+
+def test_sync_calls_run_on_the_backend_loop(background_loop):
+    backend = LoopRecordingSaver()
+    saver = SharedCheckpointer(backend, background_loop)
+    stored = saver.put(CONFIG, empty_checkpoint(), {"step": 0}, {})
+    assert backend.loops == {background_loop}
+    assert saver.get_tuple(CONFIG).config == stored
+    assert [item.config for item in saver.list(CONFIG)] == [stored]
+
+
+@pytest.mark.asyncio
+async def test_async_calls_from_another_loop(background_loop):
+    backend = LoopRecordingSaver()
+    saver = SharedCheckpointer(backend, background_loop)
+    stored = await saver.aput(CONFIG, empty_checkpoint(), {"step": 0}, {})
+    assert backend.loops == {background_loop}
+    assert (await saver.aget_tuple(CONFIG)).config == stored
+    assert [item.config async for item in saver.alist(CONFIG)] == [stored]
+
+
+@pytest.mark.asyncio
+async def test_async_calls_on_the_backend_loop_are_awaited_directly():
+    backend = LoopRecordingSaver()
+    loop = asyncio.get_running_loop()
+    saver = SharedCheckpointer(backend, loop)
+    await saver.aput(CONFIG, empty_checkpoint(), {"step": 0}, {})
+    assert backend.loops == {loop}
+
+
+@pytest.mark.asyncio
+async def test_sync_call_on_the_backend_loop_fails_instead_of_deadlocking():
+    async def value():
+        return 1
+
+    loop = asyncio.get_running_loop()
+    with pytest.raises(RuntimeError, match="deadlock"):
+        run_sync(loop, value())
+    assert await run_async(loop, value()) == 1
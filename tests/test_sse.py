@@ -0,0 +1,53 @@
+import json
+
+import api.sse as sse
+from api.sse import SSEStreamWriter, sse_frame
+
+
+def decode(frame):
+    assert frame.startswith(b"data: ") and frame.endswith(b"\n\n")
+    return json.loads(frame[len(b"data: "):-2])
+
+
+def test_frames_match_the_unbatched_encoding():
+    writer = SSEStreamWriter("s1", flush_interval_ms=0, flush_bytes=0)
+    writer.write('say "你好"\n')
+    frame = writer.poll()
+    assert frame == sse_frame({"content": 'say "你好"\n', "done": False})
+    assert writer.poll() is None
+
+
+def test_byte_threshold_coalesces_tokens():
+    writer = SSEStreamWriter("s1", flush_interval_ms=0, flush_bytes=8)
+    writer.write("abc")
+    assert writer.poll() is None
+    writer.write("你好")
+    assert decode(writer.poll()) == {"content": "abc你好", "done": False}
+    assert writer.time_until_due() is None
+
+
+def test_time_window_coalesces_tokens(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(sse.time, "monotonic", lambda: now[0])
+    writer = SSEStreamWriter("s1", flush_interval_ms=40, flush_bytes=0)
+    writer.write("a")
+    now[0] += 0.01
+    writer.write("b")
+    assert writer.poll() is None
+    assert abs(writer.time_until_due() - 0.03) < 1e-9
+    now[0] += 0.03
+    assert decode(writer.poll())["content"] == "ab"
+    assert writer.time_until_due() is None
+
+
+def test_flush_and_final_frames_keep_the_whole_reply():
+    writer = SSEStreamWriter("s1", flush_interval_ms=1000, flush_bytes=1000)
+    for piece in ["Hel", "lo", "!"]:
+        writer.write(piece)
+    assert decode(writer.flush())["content"] == "Hello!"
+    assert writer.flush() is None
+    assert writer.text == "Hello!"
+    assert decode(writer.done_frame()) == {"content": "", "done": True, "session_id": "s1"}
+    assert decode(writer.error_frame(RuntimeError("boom"), code=502)) == {"error": "boom", "done": True, "code": 502}
+    assert writer.frames == 3
+    assert writer.tokens == 3
@@ -0,0 +1,82 @@
+import gzip
+import re
+
+import pytest
+
+import api.static_assets as static_assets
+from api.static_assets import (
+    IMMUTABLE_CACHE_CONTROL,
+    LOADER_NAME,
+    REVALIDATE_CACHE_CONTROL,
+    StaticAssetStore,
+    etag_matches,
+    negotiate_encoding,
+)
+
+WIDGET = b"console.log('chat widget');\n" * 100
+
+
+@pytest.fixture
+def store(tmp_path):
+    (tmp_path / "chat-widget.js").write_bytes(WIDGET)
+    (tmp_path / "logo.png").write_bytes(b"\x89PNG" + b"\x00" * 1000)
+    (tmp_path / ".hidden").write_bytes(b"secret")
+    return StaticAssetStore(str(tmp_path))
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        (None, "identity"),
+        ("gzip", "gzip"),
+        ("gzip, br", "br"),
+        ("br;q=0.5, gzip", "gzip"),
+        ("br;q=0, gzip;q=0", "identity"),
+        ("*", "br"),
+        ("gzip;q=oops, br;q=0", "identity"),
+    ],
+)
+def test_negotiate_encoding(header, expected):
+    assert negotiate_encoding(header, ["gzip", "br"]) == expected
+
+
+@pytest.mark.parametrize(
+    "header, matches",
+    [(None, False), ('"abc"', True), ('W/"abc"', True), ('"x", "abc"', True), ("*", True), ('"abd"', False)],
+)
+def test_etag_matches(header, matches):
+    assert etag_matches(header, '"abc"') is matches
+
+
+def test_hashed_names_and_cache_policies(store):
+    hashed = store.manifest["chat-widget.js"]
+    assert re.fullmatch(r"chat-widget\.[0-9a-f]{12}\.js", hashed)
+    assert ".hidden" not in store.manifest
+    assert store.get(hashed).cache_control == IMMUTABLE_CACHE_CONTROL
+    assert store.get("chat-widget.js").cache_control == REVALIDATE_CACHE_CONTROL
+
+    status, body, headers = store.respond(LOADER_NAME, None, None)
+    assert status == 200
+    assert hashed.encode() in body
+    assert headers["Content-Type"] == "application/javascript; charset=utf-8"
+    assert store.respond("missing.js", None, None) is None
+
+
+def test_compressed_variant_and_conditional_request(store):
+    status, body, headers = store.respond("chat-widget.js", "gzip", None)
+    assert status == 200
+    assert headers["Content-Encoding"] == "gzip"
+    assert headers["Vary"] == "Accept-Encoding"
+    assert gzip.decompress(body) == WIDGET
+
+    status, body, not_modified = store.respond("chat-widget.js", "gzip", headers["ETag"])
+    assert (status, body) == (304, b"")
+    assert not_modified["ETag"] == headers["ETag"]
+    # 其他编码版本的 ETag 不同，不能用来协商
+    assert store.respond("chat-widget.js", None, headers["ETag"])[0] == 200
+
+
+def test_binary_and_small_files_are_not_compressed(store, monkeypatch):
+    assert set(store.get("logo.png").variants) == {"identity"}
+    monkeypatch.setattr(static_assets, "STATIC_COMPRESS_MIN_BYTES", 10 ** 6)
+    assert set(static_assets.StaticAsset("a.js", WIDGET, "d", "no-cache").variants) == {"identity"}
@@ -0,0 +1,84 @@
+import pytest
+from langgraph.checkpoint.base import empty_checkpoint
+from langgraph.checkpoint.memory import InMemorySaver
+
+from storage.memory.write_behind import CheckpointBacklogError, WriteBehindSaver
+
+CONFIG = {"configurable": {"thread_id": "t1", "checkpoint_ns": ""}}
+
+
+class FlakySaver(InMemorySaver):
+    """failing=True 时写入抛出异常（模拟数据库不可用）"""
+
+    def __init__(self):
+        super().__init__()
+        self.failing = False
+
+    async def aput(self, *args, **kwargs):
+        if self.failing:
+            raise ConnectionError("database unavailable")
+        return await super().aput(*args, **kwargs)
+
+
+async def put(saver, config=CONFIG):
+    checkpoint = empty_checkpoint()
+    return await saver.aput(config, checkpoint, {"step": 0}, {})
+
+
+@pytest.mark.asyncio
+async def test_buffers_until_flush_and_reads_from_memory():
+    backend = FlakySaver()
+    saver = WriteBehindSaver(backend, flush_interval=0, max_pending=10)
+    next_config = await put(saver)
+    await saver.aput_writes(next_config, [("messages", "hello")], task_id="task")
+
+    assert await backend.aget_tuple(CONFIG) is None
+    cached = await saver.aget_tuple(CONFIG)
+    assert cached.config["configurable"]["checkpoint_id"] == next_config["configurable"]["checkpoint_id"]
+    assert cached.pending_writes == [("task", "messages", "hello")]
+
+    assert await saver.aflush() == 2
+    stored = await backend.aget_tuple(CONFIG)
+    assert stored.config["configurable"]["checkpoint_id"] == next_config["configurable"]["checkpoint_id"]
+    assert stored.pending_writes == [("task", "messages", "hello")]
+    assert saver.stats()["pending_ops"] == 0
+
+
+@pytest.mark.asyncio
+async def test_full_buffer_flushes_before_accepting_writes():
+    backend = FlakySaver()
+    saver = WriteBehindSaver(backend, flush_interval=0, max_pending=2)
+    for _ in range(5):
+        await put(saver)
+        assert saver.stats()["pending_ops"] <= 2
+    assert saver.stats()["backpressure_waits"] == 2
+    assert len([c async for c in backend.alist(CONFIG)]) == 4
+
+
+@pytest.mark.asyncio
+async def test_rejects_writes_while_flushing_fails_and_recovers():
+    backend = FlakySaver()
+    saver = WriteBehindSaver(backend, flush_interval=0, max_pending=2)
+    backend.failing = True
+    await put(saver)
+    await put(saver)
+
+    for _ in range(3):
+        with pytest.raises(CheckpointBacklogError):
+            await put(saver)
+    stats = saver.stats()
+    assert stats["pending_ops"] == 2
+    assert stats["degraded"] is True
+    assert stats["consecutive_failures"] == 3
+    assert "database unavailable" in stats["last_error"]
+    assert stats["rejected_writes"] == 3
+
+    backend.failing = False
+    latest = await put(saver)
+    stats = saver.stats()
+    assert stats["degraded"] is False
+    assert stats["pending_ops"] == 1
+    await saver.aflush()
+    stored = await backend.aget_tuple(CONFIG)
+    assert stored.config["configurable"]["checkpoint_id"] == latest["configurable"]["checkpoint_id"]
+    assert len([c async for c in backend.alist(CONFIG)]) == 3